@@ -0,0 +1,136 @@
+import asyncio
+import os
+import threading
+
+from SmartVoyage.config import Config
+from SmartVoyage.create_logger import logger
+from SmartVoyage.utils.metrics import metrics
+from SmartVoyage.utils.resources import lazy_import, lazy_import_async
+
+conf = Config()
+
+_sync_loop = None
+_sync_loop_lock = threading.Lock()
+
+
+# Flask模式的常驻事件循环：LLM客户端、代理连接池、MCP会话池等资源绑定首次使用它们的事件循环，
+# 每个请求各用一个 asyncio.run 会在循环关闭后留下不可用的连接，因此所有请求都提交到同一个后台循环
+def _get_sync_loop():
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, name="a2a-sync-loop", daemon=True).start()
+        return _sync_loop
+
+
+# 同步入口（python_a2a的Flask服务器在请求线程中调用 handle_task）：在常驻事件循环中执行协程并阻塞等待结果
+def run_sync(coro):
+    return asyncio.run_coroutine_threadsafe(coro, _get_sync_loop()).result()
+
+
+# fork出的子进程不继承常驻循环线程，首次调用时重新创建
+def _reset_sync_loop_after_fork():
+    global _sync_loop, _sync_loop_lock
+    _sync_loop = None
+    _sync_loop_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_sync_loop_after_fork)
+
+
+def create_async_app(server):
+    '''
+    为A2A代理创建异步HTTP应用：与python_a2a的Flask服务器提供相同的任务接口（python_a2a格式），
+    但任务在事件循环中通过 handle_task_async 处理，等待LLM、MCP和下游代理时不占用线程
+    :param server: 代理服务，提供 card（卡片字典）、agent_card、tasks 与 handle_task_async
+    :return: FastAPI应用
+    '''
+    fastapi = lazy_import("fastapi")
+    JSONResponse = lazy_import("fastapi.responses").JSONResponse
+    app = fastapi.FastAPI(title=server.card["name"])
+
+    @app.get("/agent.json")
+    @app.get("/a2a/agent.json")
+    async def agent_card():
+        await lazy_import_async("python_a2a")
+        return server.agent_card.to_dict()
+
+    @app.get("/a2a/health")
+    async def health():
+        return {"status": "ok"}
+
+    # 本进程的LLM调用与缓存指标（多工作进程时为处理该请求的工作进程）
+    @app.get("/metrics")
+    async def llm_metrics():
+        return metrics.summary()
+
+    @app.post("/tasks/send")
+    @app.post("/a2a/tasks/send")
+    async def tasks_send(request: fastapi.Request):
+        data = await request.json()
+        rpc = "jsonrpc" in data
+        params = data.get("params", {}) if rpc else data
+        try:
+            a2a = await lazy_import_async("python_a2a")
+            result = await server.handle_task_async(a2a.Task.from_dict(params))
+        except Exception as e:
+            logger.error(f"任务处理出错: {str(e)}")
+            if rpc:
+                return JSONResponse({"jsonrpc": "2.0", "id": data.get("id", 1),
+                                     "error": {"code": -32603, "message": f"Internal error: {str(e)}"}},
+                                    status_code=500)
+            return JSONResponse({"id": params.get("id", ""), "sessionId": params.get("sessionId", ""),
+                                 "status": {"state": "failed", "message": {"error": f"Error processing task: {e}"}}},
+                                status_code=500)
+        server.tasks[result.id] = result
+        if rpc:
+            return {"jsonrpc": "2.0", "id": data.get("id", 1), "result": result.to_dict()}
+        return result.to_dict()
+
+    @app.post("/tasks/get")
+    @app.post("/a2a/tasks/get")
+    async def tasks_get(request: fastapi.Request):
+        data = await request.json()
+        rpc = "jsonrpc" in data
+        task_id = (data.get("params", {}) if rpc else data).get("id")
+        task = server.tasks.get(task_id)
+        if task is None:
+            if rpc:
+                return JSONResponse({"jsonrpc": "2.0", "id": data.get("id", 1),
+                                     "error": {"code": -32000, "message": f"Task not found: {task_id}"}},
+                                    status_code=404)
+            return JSONResponse({"error": f"Task not found: {task_id}"}, status_code=404)
+        if rpc:
+            return {"jsonrpc": "2.0", "id": data.get("id", 1), "result": task.to_dict()}
+        return task.to_dict()
+
+    return app
+
+
+# Flask模式：把代理服务包装为python_a2a的A2AServer（代理服务本身不继承A2AServer，启动时不必导入python_a2a），
+# 任务交给代理服务的 handle_task 处理，任务记录与异步服务器共用 server.tasks
+def to_a2a_server(server):
+    A2AServer = lazy_import("python_a2a").A2AServer
+
+    class FlaskAgentServer(A2AServer):
+        def handle_task(self, task):
+            return server.handle_task(task)
+
+    flask_server = FlaskAgentServer(agent_card=server.agent_card)
+    flask_server.tasks = server.tasks
+    return flask_server
+
+
+# 按配置启动代理服务：async使用uvicorn运行异步应用（可配置多个工作进程），flask使用python_a2a自带的服务器
+def serve(server, host, port):
+    workers = conf.a2a_workers.get(server.card["name"], 1)
+    if conf.a2a_server_mode != "async":
+        if workers > 1:
+            logger.warning("Flask模式不支持多工作进程，按单进程运行")
+        lazy_import("python_a2a").run_server(to_a2a_server(server), host=host, port=port)
+    elif workers > 1:
+        lazy_import("SmartVoyage.a2a_server.launcher").run_workers(create_async_app(server), host, port, workers)
+    else:
+        print(f"Starting async A2A server on http://{host}:{port}/a2a")
+        lazy_import("uvicorn").run(create_async_app(server), host=host, port=port, log_level="warning")
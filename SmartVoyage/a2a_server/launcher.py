@@ -0,0 +1,95 @@
+import gc
+import os
+import signal
+import socket
+import time
+
+from SmartVoyage.config import Config
+from SmartVoyage.create_logger import logger
+from SmartVoyage.utils.metrics import metrics
+from SmartVoyage.utils.resources import lazy_import, resources
+
+conf = Config()
+
+
+# 在主进程中绑定监听端口，子进程继承同一个监听socket，由内核在各进程之间分配连接
+def bind_socket(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(index, app, sock):
+    # 子进程单独成组：终端的Ctrl+C只发给主进程，由主进程统一转发SIGTERM，避免uvicorn收到两次信号后强制退出
+    os.setpgid(0, 0)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    metrics.worker = index
+    uvicorn = lazy_import("uvicorn")
+    uvicorn.Server(uvicorn.Config(app, log_level="warning")).run(sockets=[sock])
+
+
+def run_workers(app, host, port, workers):
+    '''
+    预先fork多个工作进程共同监听同一端口，主进程只负责监控：工作进程异常退出时重新拉起，收到SIGTERM/SIGINT时
+    通知所有工作进程优雅退出（处理完进行中的请求），超时未退出的强制结束
+    :param app: 异步应用（create_async_app的返回值）
+    :param host: 监听地址
+    :param port: 监听端口
+    :param workers: 工作进程数
+    '''
+    # fork之前只构建提示模板、城市词典、LLM客户端等只读资源，工作进程通过写时复制共享；进程内MCP服务
+    # （数据库连接、索引刷新线程）和持有事件循环线程的运行时在各子进程中首次使用时构建（见各模块的register_at_fork）；
+    # 冻结GC，避免子进程的垃圾回收改写这些对象所在的内存页；lazy模式下先等后台预导入完成再fork
+    resources.join_prefetch()
+    resources.warm(fork_safe_only=True)
+    gc.freeze()
+    sock = bind_socket(host, port)
+    children = {}  # 进程号 -> 工作进程序号
+    stopping = []
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(index, app, sock)
+            except BaseException as e:
+                logger.error(f"工作进程 {index} 异常退出: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = index
+
+    def stop(signum, frame):
+        if not stopping:
+            stopping.append(time.monotonic())
+            logger.info(f"收到退出信号，通知 {len(children)} 个工作进程退出")
+            for pid in list(children):
+                os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(workers):
+        spawn(index)
+    print(f"已启动 {workers} 个工作进程，监听 http://{host}:{port}/a2a")
+
+    while children:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if stopping and time.monotonic() - stopping[0] > conf.a2a_worker_shutdown_timeout:
+                logger.warning(f"工作进程未在 {conf.a2a_worker_shutdown_timeout}s 内退出，强制结束")
+                for child in list(children):
+                    os.kill(child, signal.SIGKILL)
+            time.sleep(0.2)
+            continue
+        index = children.pop(pid, None)
+        if index is not None and not stopping:
+            logger.warning(f"工作进程 {index}（pid {pid}）意外退出，状态 {status}，重新启动")
+            time.sleep(1)
+            spawn(index)
+    sock.close()
+    logger.info("所有工作进程已退出")
@@ -1,122 +1,162 @@
 import asyncio
 import uuid
 
-from langchain_openai import ChatOpenAI
-from mcp import ClientSession
-from mcp.client.streamable_http import streamablehttp_client
-from langchain_mcp_adapters.tools import load_mcp_tools
-from langchain.agents import create_tool_calling_agent, AgentExecutor
-from langchain_core.prompts import ChatPromptTemplate
-from python_a2a import AgentCard, AgentSkill, run_server, TaskStatus, TaskState, A2AServer, A2AClient, Message, \
-    TextContent, MessageRole, Task
+# 最先导入资源注册表，以其导入时刻作为启动时刻
+from SmartVoyage.utils.resources import lazy_import, lazy_import_async, resources
 
+from SmartVoyage.a2a_server.async_app import run_sync, serve
 from SmartVoyage.create_logger import logger
-from config import Config
+from SmartVoyage.utils.deadline import DEADLINE_KEY, new_deadline, remaining_budget, task_deadline, wait_with_timeout
+from SmartVoyage.utils.mcp_pool import McpSessionProxy, get_mcp_runtime
+from SmartVoyage.utils.metrics import llm_config, metrics, track_turn
+from SmartVoyage.utils.paging import PAGE_TOKEN_KEY
+from SmartVoyage.config import Config
 
 conf = Config()
+resources.mark("导入完成")
 
-# 初始化LLM
-llm = ChatOpenAI(
-    model=conf.model_name,
-    base_url=conf.base_url,
-    api_key=conf.api_key,
-    temperature=0.1
-)
 
-# 定义查询函数
+# 票务查询代理的客户端：使用aiohttp长连接池（A2AClient的异步发送实际占用线程池中的一个线程），
+# 连接池在首次请求时于当前事件循环中建立（两种服务模式下任务都在进程内唯一的常驻事件循环中处理）
+def build_ticket_client():
+    runtime = lazy_import("SmartVoyage.orchestrator.runtime")
+    return runtime.PooledA2AClient(conf.agent_urls["TicketQueryAssistant"],
+                                   runtime.AgentConnectionPool(conf.agent_urls["TicketQueryAssistant"]),
+                                   timeout=conf.agent_task_timeout)
+
+
+resources.register("ticket_client", build_ticket_client)
+
+# 在MCP会话上构建工具调用代理并执行订票
+# session 为 McpSessionProxy：代理与LLM调用在当前事件循环中运行，工具调用转交到MCP运行时
+async def run_order_agent(session, query):
+    # 按需导入LangChain工具代理相关模块
+    load_mcp_tools = lazy_import("langchain_mcp_adapters.tools").load_mcp_tools
+    agents = lazy_import("langchain.agents")
+    ChatPromptTemplate = lazy_import("langchain_core.prompts").ChatPromptTemplate
+
+    # 从 session 自动获取 MCP server 提供的工具列表。
+    tools = await load_mcp_tools(session)
+    # print(f"tools-->{tools}")
+
+    # 创建 agent 的提示模板
+    prompt = ChatPromptTemplate.from_messages([
+        ("system",
+         "你是一个票务预定助手，能够调用工具来完成火车票、飞机票或演出票的预定。你需要仔细分析工具需要的参数，然后从用户提供的信息中提取信息。如果用户提供的信息不足以提取到调用工具所有必要参数，则向用户追问，以获取该信息。不能自己编撰参数。"),
+        ("human", "{input}"),
+        ("placeholder", "{agent_scratchpad}"),
+    ])
+
+    # 构建工具调用代理
+    agent = agents.create_tool_calling_agent(resources.get("llm"), tools, prompt)
+
+    # 创建代理执行器
+    agent_executor = agents.AgentExecutor(agent=agent, tools=tools, verbose=True)
+
+    # 代理调用
+    return await agent_executor.ainvoke({"input": query}, config=llm_config("order_agent"))
+
+
+# 定义查询函数：工具调用复用会话池中已初始化的MCP会话；订票有副作用，会话失效时不自动重试
 async def order_tickets(query):
     try:
-        # 启动 MCP server，通过streamable建立连接
-        async with streamablehttp_client("http://127.0.0.1:8003/mcp") as (read, write, _):
-            # 使用读写通道创建 MCP 会话
-            async with ClientSession(read, write) as session:
-                try:
-                    await session.initialize()
-
-                    # 从 session 自动获取 MCP server 提供的工具列表。
-                    tools = await load_mcp_tools(session)
-                    # print(f"tools-->{tools}")
-
-                    # 创建 agent 的提示模板
-                    prompt = ChatPromptTemplate.from_messages([
-                        ("system",
-                         "你是一个票务预定助手，能够调用工具来完成火车票、飞机票或演出票的预定。你需要仔细分析工具需要的参数，然后从用户提供的信息中提取信息。如果用户提供的信息不足以提取到调用工具所有必要参数，则向用户追问，以获取该信息。不能自己编撰参数。"),
-                        ("human", "{input}"),
-                        ("placeholder", "{agent_scratchpad}"),
-                    ])
-
-                    # 构建工具调用代理
-                    agent = create_tool_calling_agent(llm, tools, prompt)
-
-                    # 创建代理执行器
-                    agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
-
-                    # 代理调用
-                    response = await agent_executor.ainvoke({"input": query})
-
-                    return {"status": "success", "message": f"{response['output']}"}
-                except Exception as e:
-                    logger.error(f"票务 MCP 测试出错：{str(e)}")
-                    return {"status": "error", "message": f"票务 MCP 查询出错：{str(e)}"}
+        response = await run_order_agent(McpSessionProxy(get_mcp_runtime(), "order", retry=False), query)
+        return {"status": "success", "message": f"{response['output']}"}
+    except asyncio.TimeoutError:  # 超时交给handle_task处理
+        raise
     except Exception as e:
-        logger.error(f"连接或会话初始化时发生错误: {e}")
-        return {"status": "error", "message": "连接或会话初始化时发生错误"}
-
-# Agent 卡片定义
-agent_card = AgentCard(
-    name="TicketOrderAssistant",
-    description="通过MCP提供票务预定服务的助手",
-    url="http://localhost:5007",
-    version="1.0.4",
-    capabilities={"streaming": True, "memory": True},
-    skills=[
-        AgentSkill(
-            name="execute ticket order",
-            description="根据客户端提供的输入执行票务预定，返回执行结果",
-            examples=["北京 到 上海 2025-11-15 火车票 二等座 1张",
-                      "上海 到 北京 2025-12-11 飞机票 公务舱 2张"]
-        )
+        logger.error(f"票务 MCP 预定出错：{str(e)}")
+        return {"status": "error", "message": f"票务 MCP 查询出错：{str(e)}"}
+
+# Agent 卡片定义：以字典声明，python_a2a导入较慢，首次需要AgentCard对象时才导入并构建
+AGENT_CARD = {
+    "name": "TicketOrderAssistant",
+    "description": "通过MCP提供票务预定服务的助手",
+    "url": "http://localhost:5007",
+    "version": "1.0.4",
+    "capabilities": {"streaming": True, "memory": True},
+    "skills": [
+        {
+            "name": "execute ticket order",
+            "description": "根据客户端提供的输入执行票务预定，返回执行结果",
+            "examples": ["北京 到 上海 2025-11-15 火车票 二等座 1张",
+                         "上海 到 北京 2025-12-11 飞机票 公务舱 2张"]
+        }
     ]
-)
+}
+resources.register("order_agent_card", lambda: lazy_import("python_a2a").AgentCard.from_dict(AGENT_CARD))
 
 
 # 票务预定服务器类
-class TicketOrderServer(A2AServer):
+class TicketOrderServer:
+    card = AGENT_CARD
+
     def __init__(self):
-        super().__init__(agent_card=agent_card)
-        self.llm = llm
-        self.ticket_client = A2AClient("http://localhost:5006")
+        self.tasks = {}  # 任务ID -> 已处理的任务，供 tasks/get 查询
+
+    @property
+    def agent_card(self):
+        return resources.get("order_agent_card")
+
+    # 票务查询代理的客户端：首次使用时创建
+    @property
+    def ticket_client(self):
+        return resources.get("ticket_client")
 
     # 处理任务：提取输入，查询余票，调用MCP，结果输出
+    # 同步入口：python_a2a的Flask服务器在请求线程中调用，任务提交到常驻事件循环执行，请求线程阻塞等待结果
     def handle_task(self, task):
+        return run_sync(self.handle_task_async(task))
+
+    # 异步入口：异步服务器（a2a_server/async_app.py）在事件循环中直接await，不占用线程
+    async def handle_task_async(self, task):
+        # 统计本次任务的LLM调用，结束后输出明细，指标文件在后台延迟写出
+        with track_turn("订票任务") as turn:
+            task = await self._handle_task(task)
+        logger.info(turn.summary_line())
+        metrics.dump_soon("order_agent")
+        return task
+
+    async def _handle_task(self, task):
+        a2a = await lazy_import_async("python_a2a")
         # 1 提取输入
         content = (task.message or {}).get("content", {})  # 从消息中获取内容
         # 提取conversation，即客户端发起的任务中的query语句
         conversation = content.get("text", "") if isinstance(content, dict) else ""
         logger.info(f"对话历史及用户问题: {conversation}")
+        # 截止时间：优先使用客户端随任务传入的截止时间，各阶段只使用剩余预算，并预留返回余量
+        deadline = task_deadline(task) or new_deadline(conf.agent_task_timeout)
+        ticket_result = None
 
         try:
-            # 2 调用票务查询agent查询余票
-            message_ticket = Message(content=TextContent(text=conversation), role=MessageRole.USER)
-            task_ticket = Task(id="task-" + str(uuid.uuid4()), message=message_ticket.to_dict())
+            # 2 调用票务查询agent查询余票，截止时间继续传给票务查询agent
+            message_ticket = a2a.Message(content=a2a.TextContent(text=conversation), role=a2a.MessageRole.USER)
+            metadata = {DEADLINE_KEY: deadline - conf.deadline_margin}
+            # 用户从展示的某一页中订票时，带上该页的翻页令牌，票务查询agent返回同一页余票
+            page_token = (task.metadata or {}).get(PAGE_TOKEN_KEY)
+            if page_token:
+                metadata[PAGE_TOKEN_KEY] = page_token
+            task_ticket = a2a.Task(id="task-" + str(uuid.uuid4()), message=message_ticket.to_dict(), metadata=metadata)
 
             # 发送任务并获取最终结果
-            ticket_result_task = asyncio.run(self.ticket_client.send_task_async(task_ticket))
+            ticket_result_task = await wait_with_timeout(self.ticket_client.send_task_async(task_ticket),
+                                                         remaining_budget(deadline, margin=conf.deadline_margin))
             logger.info(f"原始响应: {ticket_result_task}")
 
             # 处理结果：未查到余票信息时，则返回提示信息
             if ticket_result_task.status.state != 'completed':
                 required_message = ticket_result_task.status.message['content']['text']
                 logger.info(f'余票未查到：{required_message}')
-                task.status = TaskStatus(state=TaskState.INPUT_REQUIRED,
-                                         message={"role": "agent", "content": {"text": required_message}})
+                task.status = a2a.TaskStatus(state=a2a.TaskState.INPUT_REQUIRED,
+                                             message={"role": "agent", "content": {"text": required_message}})
                 return task
             # 处理结果：查到余票信息时，进行订票
             ticket_result = ticket_result_task.artifacts[0]["parts"][0]["text"]
             logger.info(f"余票信息: {ticket_result}")
 
             # 3 调用MCP订票
-            order_result = asyncio.run(order_tickets(conversation + '\n余票信息：' + ticket_result))
+            order_result = await wait_with_timeout(order_tickets(conversation + '\n余票信息：' + ticket_result),
+                                                   remaining_budget(deadline, margin=conf.deadline_margin))
             logger.info(f"MCP 返回: {order_result}")
 
             # 4 结果输出
@@ -127,38 +167,56 @@ class TicketOrderServer(A2AServer):
                 result = '余票信息：' + ticket_result + '\n订票结果：' + data
                 # 设置任务产物为文本部分，并设置任务状态为完成
                 task.artifacts = [{"parts": [{"type": "text", "text": result}]}]
-                task.status = TaskStatus(state=TaskState.COMPLETED)
+                task.status = a2a.TaskStatus(state=a2a.TaskState.COMPLETED)
             else:
                 # 设置任务状态为失败，添加错误信息
-                task.status = TaskStatus(state=TaskState.FAILED,
-                                         message={"role": "agent", "content": {"text": data}})
+                task.status = a2a.TaskStatus(state=a2a.TaskState.FAILED,
+                                             message={"role": "agent", "content": {"text": data}})
+            return task
+
+        except asyncio.TimeoutError:
+            logger.error("处理超时，已取消剩余工作")
+            if ticket_result is None:
+                text = "余票查询超时，未进行预定，请稍后重试。"
+            else:
+                # 部分结果：余票已查到，但订票在截止时间前未完成，预定结果未知
+                text = '余票信息：' + ticket_result + '\n订票超时，预定结果未知，请稍后确认订单后再重试。'
+            task.status = a2a.TaskStatus(state=a2a.TaskState.FAILED, message={"role": "agent", "content": {"text": text}})
             return task
 
         except Exception as e:  # 捕获异常
             logger.error(f"查询失败: {str(e)}")
 
             # 设置任务状态为失败，添加错误信息
-            task.status = TaskStatus(state=TaskState.FAILED,
-                                     message={"role": "agent", "content": {"text": f"查询失败: {str(e)} 请重试或提供更多细节。"}})
+            task.status = a2a.TaskStatus(state=a2a.TaskState.FAILED,
+                                         message={"role": "agent", "content": {"text": f"查询失败: {str(e)} 请重试或提供更多细节。"}})
             return task
 
 
 if __name__ == '__main__':
-    # 测试handle_task
-    server = TicketOrderServer()
-    message = Message(content=TextContent(text="火车票 从北京到上海 2025-10-22"), role=MessageRole.USER)
-    task = Task(message=message.to_dict())
-    server.handle_task(task)
+    # 测试handle_task（会在服务使用的事件循环之外初始化LLM客户端、连接池等资源，仅单独调试时打开）
+    # server = TicketOrderServer()
+    # message = Message(content=TextContent(text="火车票 从北京到上海 2025-10-22"), role=MessageRole.USER)
+    # task = Task(message=message.to_dict())
+    # server.handle_task(task)
 
     # 创建并运行服务器
     # 实例化票务查询服务器
     ticket_server = TicketOrderServer()
+    # 启动模式为eager时在开始服务前预热资源，并按配置打印启动耗时分析；lazy时开始服务后在后台预导入
+    modules = ["python_a2a", "mcp", "mcp.client.streamable_http", "langchain_mcp_adapters.tools", "langchain.agents"]
+    if conf.startup_mode == "eager":
+        resources.warm(modules=modules)
+    else:
+        resources.prefetch(modules)
+    resources.mark("资源就绪")
+    resources.print_profile("票务预定代理")
     # 打印服务器信息
     print("\n=== 服务器信息 ===")
-    print(f"名称: {ticket_server.agent_card.name}")
-    print(f"描述: {ticket_server.agent_card.description}")
+    print(f"名称: {ticket_server.card['name']}")
+    print(f"描述: {ticket_server.card['description']}")
     print("\n技能:")
-    for skill in ticket_server.agent_card.skills:
-        print(f"- {skill.name}: {skill.description}")
+    for skill in ticket_server.card["skills"]:
+        print(f"- {skill['name']}: {skill['description']}")
     # 运行服务器
-    run_server(ticket_server, host="127.0.0.1", port=5007)
\ No newline at end of file
+    serve(ticket_server, host="127.0.0.1", port=5007)
\ No newline at end of file
@@ -1,27 +1,35 @@
 import json
 import asyncio
+import re
+
+# 最先导入资源注册表，以其导入时刻作为启动时刻
+from SmartVoyage.utils.resources import lazy_import, lazy_import_async, resources
 
-from mcp import ClientSession
-from mcp.client.streamable_http import streamablehttp_client
-from python_a2a import A2AServer, run_server, AgentCard, AgentSkill, TaskStatus, TaskState, Message, TextContent, \
-    MessageRole, Task
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
 from datetime import datetime
-import pytz
+from typing import Dict, Literal, Optional, Union
+
+from pydantic import BaseModel, Field, model_validator
 
 from SmartVoyage.config import Config
+from SmartVoyage.a2a_server.async_app import run_sync, serve
 from SmartVoyage.create_logger import logger
+from SmartVoyage.utils.cache import DailyLRUCache, conversation_cache_key
+from SmartVoyage.utils.deadline import new_deadline, remaining_budget, task_deadline, wait_with_timeout
+from SmartVoyage.utils.entity_resolver import resolve_query_slots, resolve_query_sql
+from SmartVoyage.utils.mcp_pool import call_mcp_tool
+from SmartVoyage.utils.metrics import llm_config, metrics, track_turn
+from SmartVoyage.utils.paging import PAGE_ORDERS, PAGE_TOKEN_KEY, decode_page_token, encode_page_token, page_rows
+from SmartVoyage.utils.sql_rewrite import append_order_by, has_limit, is_single_select
 
 conf = Config()
+resources.mark("导入完成")
+if not conf.page_token_secret:
+    logger.warning("未配置翻页令牌签名密钥（环境变量 SMARTVOYAGE_PAGE_TOKEN_SECRET），使用随机密钥，服务重启后旧的翻页令牌失效")
+
+# SQL生成结果缓存：同一对话、同一天的解析结果（type + sql 或追问）直接复用，不同用户的重复问题不再调用LLM
+sql_cache = DailyLRUCache(maxsize=conf.sql_cache_size)
+metrics.register_cache("ticket_sql", sql_cache)
 
-# 初始化LLM
-llm = ChatOpenAI(
-    model=conf.model_name,
-    base_url=conf.base_url,
-    api_key=conf.api_key,
-    temperature=0.1
-)
 
 
 # 数据表 schema
@@ -74,8 +82,8 @@ CREATE TABLE concert_tickets (
 ) COMMENT='演唱会门票信息表';
 """
 
-# 生成SQL的提示词
-sql_prompt = ChatPromptTemplate.from_template(
+# 生成SQL的提示词模板，首次使用时才构建ChatPromptTemplate
+sql_prompt_template = (
     """
 系统提示：你是一个专业的票务SQL生成器，需要从对话历史（含用户的问题）中提取用户的意图以及关键信息，然后基于train_tickets、flight_tickets、concert_tickets表生成SELECT语句。
 根据对话历史：
@@ -120,167 +128,539 @@ SELECT id, artist, city, venue, start_time, end_time, ticket_type, price, remain
 当前日期: {current_date} (Asia/Shanghai)
     """
 )
+resources.register("ticket_sql_prompt",
+                   lambda: lazy_import("langchain_core.prompts").ChatPromptTemplate.from_template(sql_prompt_template))
 
-# 定义查询函数
+# 结构化输出模式的提示词模板：输出格式由TicketQuery的JSON schema（工具调用）约束，提示词只描述字段含义
+structured_prompt_template = (
+    """
+系统提示：你是一个专业的票务SQL生成器，需要从对话历史（含用户的问题）中提取用户的意图以及关键信息，然后基于train_tickets、flight_tickets、concert_tickets表生成SELECT语句，并通过TicketQuery工具返回结果。
+1. type 为用户的意图：train（火车/高铁）、flight（机票）、concert（演唱会）。
+2. 信息齐全时 status 为 "sql"，sql 为对应表的 SELECT 语句，仅查询指定字段：
+- train_tickets: id, departure_city, arrival_city, departure_time, arrival_time, train_number, seat_type, price, remaining_seats
+- flight_tickets: id, departure_city, arrival_city, departure_time, arrival_time, flight_number, cabin_type, price, remaining_seats
+- concert_tickets: id, artist, city, venue, start_time, end_time, ticket_type, price, remaining_seats
+  同时在 slots 中填写提取到的关键信息（城市、日期、车次/航班号、座位类型、艺人等）。
+3. 缺少必要信息、无法识别意图或意图不在这3种内时，status 为 "input_required"，message 为追问内容，例如 "请提供票务类型（如火车票、机票、演唱会）和必要信息（如城市、日期）。"
+其中，每种意图必要的信息有：
+- flight/train: 【departure_city (出发城市), arrival_city (到达城市), date (日期)】 或 【train_number/flight_number (车次)】
+- concert: city (城市), artist (艺人), date (日期)。
+
+示例：
+- 对话: user: 火车票 北京 上海 2025-07-31 硬卧
+输出: {{"status": "sql", "type": "train", "sql": "SELECT id, departure_city, arrival_city, departure_time, arrival_time, train_number, seat_type, price, remaining_seats FROM train_tickets WHERE departure_city = '北京' AND arrival_city = '上海' AND DATE(departure_time) = '2025-07-31' AND seat_type = '硬卧'", "slots": {{"departure_city": "北京", "arrival_city": "上海", "date": "2025-07-31", "seat_type": "硬卧"}}}}
+- 对话: user: 火车票
+输出: {{"status": "input_required", "message": "请提供出发城市、到达城市和日期。"}}
+
+表结构：{table_schema_string}
+对话历史: {conversation}
+当前日期: {current_date} (Asia/Shanghai)
+    """
+)
+resources.register("ticket_structured_prompt",
+                   lambda: lazy_import("langchain_core.prompts").ChatPromptTemplate.from_template(
+                       structured_prompt_template))
+
+
+# 票务查询的结构化输出：一次返回意图、SQL（或追问消息）和提取的槽位，字段不一致时校验失败
+class TicketQuery(BaseModel):
+    '''票务查询解析结果'''
+    status: Literal["sql", "input_required"] = Field(description="信息齐全时为sql，需要追问时为input_required")
+    type: Optional[Literal["train", "flight", "concert"]] = Field(default=None, description="票务类型")
+    sql: Optional[str] = Field(default=None, description="status为sql时的SELECT语句")
+    slots: Optional[Dict[str, Union[str, int]]] = Field(default=None, description="提取到的关键信息")
+    message: Optional[str] = Field(default=None, description="status为input_required时的追问内容")
+
+    @model_validator(mode="after")
+    def check_consistency(self):
+        if self.status == "sql":
+            if not self.type or not self.sql or not self.sql.lstrip().upper().startswith("SELECT"):
+                raise ValueError("status为sql时必须提供type和SELECT语句")
+        elif not self.message:
+            raise ValueError("status为input_required时必须提供message")
+        return self
+
+    def to_result(self):
+        if self.status == "sql":
+            return {"status": "sql", "type": self.type, "sql": self.sql.strip(), "slots": self.slots or {}}
+        return {"status": "input_required", "message": self.message}
+
+
+# 解析文本输出模式的LLM回复：第一行为类型JSON（或追问JSON），其余行为SQL，可能带```json代码块；格式无效时返回None
+def parse_ticket_output(output):
+    lines = output.split('\n')
+    type_line = lines[0].strip()
+    if type_line.startswith('```json'):  # 检查是否以```json开头
+        type_line = lines[1].strip() if len(lines) > 1 else ''  # 取下一行为类型行
+        sql_lines = lines[3:-1] if lines[-1].strip() == '```' else lines[3:]  # 提取SQL行，跳过代码块标记
+    else:
+        sql_lines = lines[1:] if len(lines) > 1 else []  # 取剩余行为SQL行
+
+    # 提取 type 和 SQL
+    if type_line.startswith('{"type":'):  # 如果以{"type":开头
+        query_type = json.loads(type_line)["type"]  # 解析并提取类型
+        sql_query = ' '.join([line.strip() for line in sql_lines if
+                              line.strip() and not line.startswith('```')])  # 连接SQL行，过滤空行和代码块
+        logger.info(f"分类类型: {query_type}, 生成的 SQL: {sql_query}")
+        return {"status": "sql", "type": query_type, "sql": sql_query}  # SQL状态字典，包括类型
+    if type_line.startswith('{"status": "input_required"'):  # 检查是否为追问JSON
+        return json.loads(type_line)
+    logger.error(f"无效的 LLM 输出格式: {output}")
+    return None
+
+
+# 线路查询可以直接走内存索引的条件：列名 -> search_tickets 参数名
+ROUTE_CONDITIONS = {
+    "departure_city": "departure_city", "arrival_city": "arrival_city", "DATE(departure_time)": "date",
+    "seat_type": "seat_type", "cabin_type": "seat_type", "train_number": "number", "flight_number": "number",
+}
+ROUTE_CONDITION_PATTERN = re.compile(r"^\(?\s*([\w()]+)\s*=\s*'([^']*)'\s*\)?$")
+
+
+def route_search_args(query_type, sql):
+    '''
+    判断生成的SQL是否为简单的线路查询（只有出发城市、到达城市、出发日期、座位类型、车次的等值条件），
+    是则转换为 search_tickets 工具的参数，由票务MCP服务直接查内存索引；含其他条件、排序或OR的查询返回None，仍执行SQL
+    :param query_type: 票务类型
+    :param sql: 生成的SQL
+    :return: search_tickets 参数字典或None
+    '''
+    if query_type not in ("train", "flight"):
+        return None
+    match = re.search(r"\bWHERE\b(.*)$", sql.strip().rstrip(';'), re.IGNORECASE | re.DOTALL)
+    if not match or re.search(r"\b(OR|ORDER|GROUP|LIMIT|LIKE|IN|BETWEEN)\b", match.group(1), re.IGNORECASE):
+        return None
+    args = {"type": query_type}
+    for condition in re.split(r"\bAND\b", match.group(1), flags=re.IGNORECASE):
+        found = ROUTE_CONDITION_PATTERN.match(condition.strip())
+        if not found or found.group(1) not in ROUTE_CONDITIONS or ROUTE_CONDITIONS[found.group(1)] in args:
+            return None
+        args[ROUTE_CONDITIONS[found.group(1)]] = found.group(2)
+    if not {"departure_city", "arrival_city", "date"} <= args.keys():
+        return None
+    try:
+        datetime.strptime(args["date"], "%Y-%m-%d")
+    except ValueError:
+        return None
+    return args
+
+
+# 用户偏好价格时换乘方案按总价排序，否则按到达时间排序
+PRICE_KEYWORDS = ("便宜", "最低价", "低价", "省钱", "价格最低", "票价最低")
+
+
+def transfer_search_args(query_type, route_args, slots, conversation):
+    '''
+    直达查询无结果时，判断是否可以改查换乘方案：只对火车票/机票的纯线路查询（有出发城市、到达城市、日期，
+    没有限定座位类型或车次）查换乘
+    :param route_args: route_search_args 的结果，可能为None
+    :param slots: 结构化输出中的槽位，可能为None
+    :return: search_transfers 参数字典或None
+    '''
+    if query_type not in ("train", "flight"):
+        return None
+    args = route_args or slots or {}
+    if args.get("seat_type") or args.get("cabin_type") or args.get("number") \
+            or args.get("train_number") or args.get("flight_number"):
+        return None
+    if not all(isinstance(args.get(key), str) and args.get(key) for key in ("departure_city", "arrival_city", "date")):
+        return None
+    try:
+        datetime.strptime(args["date"], "%Y-%m-%d")
+    except ValueError:
+        return None
+    objective = "price" if any(keyword in conversation for keyword in PRICE_KEYWORDS) else "arrival"
+    return {"departure_city": args["departure_city"], "arrival_city": args["arrival_city"], "date": args["date"],
+            "objective": objective}
+
+
+# 渲染换乘方案：每个方案一行概要，下面逐段列出行程
+def format_transfer_plans(plans):
+    lines = []
+    for i, plan in enumerate(plans, 1):
+        hours, minutes = divmod(plan["duration_minutes"], 60)
+        lines.append(f"方案{i}：{plan['departure_time']} 出发，{plan['arrival_time']} 到达，全程 {hours}小时{minutes}分，"
+                     f"换乘 {plan['transfers']} 次，总价 {plan['total_price']}元")
+        for leg in plan["legs"]:
+            number = leg.get("train_number") or leg.get("flight_number", "")
+            seat = leg.get("seat_type") or leg.get("cabin_type", "")
+            lines.append(f"  {leg['departure_city']} {leg['departure_time']} → {leg['arrival_city']} {leg['arrival_time']}："
+                         f"{'车次' if leg['type'] == 'train' else '航班'} {number}，{seat} {leg['price']}元，"
+                         f"剩余 {leg['remaining_seats']} 张")
+    return "\n".join(lines) + "\n"
+
+
+# 结果排序方式：用户偏好价格时按票价，否则按出发/开始时间
+def ticket_order(conversation):
+    return "price" if any(keyword in conversation for keyword in PRICE_KEYWORDS) else "time"
+
+
+# 各票务类型对应的表，以及与 row_sort_key 一致的SQL排序列
+TICKET_TYPE_TABLES = {"train": "train_tickets", "flight": "flight_tickets", "concert": "concert_tickets"}
+
+
+def ticket_sort_columns(query_type, order):
+    time_column = "start_time" if query_type == "concert" else "departure_time"
+    return ["price", time_column, "id"] if order == "price" else [time_column, "price", "id"]
+
+
+def valid_page_state(state):
+    '''
+    校验翻页令牌中的查询状态：令牌有签名，但其中的SQL仍重新校验为只查询对应票务表的单条SELECT，
+    签名密钥泄露时也不能借令牌执行任意SQL
+    '''
+    if not isinstance(state, dict) or state.get("type") not in TICKET_TYPE_TABLES \
+            or state.get("order") not in PAGE_ORDERS:
+        return False
+    if "route" in state:
+        return isinstance(state["route"], dict)
+    return is_single_select(state.get("sql"), {TICKET_TYPE_TABLES[state["type"]]})
+
+
+def format_ticket_row(query_type, d):
+    '''
+    紧凑的单行编码：线路与年份在标题中只出现一次，每行只保留车次、时间、座位、票价、余票
+    '''
+    if query_type == "concert":
+        return (f"{d['artist']} {str(d['start_time'])[5:16]} {d['venue']} {d['ticket_type']} "
+                f"{d['price']}元 余{d['remaining_seats']}")
+    number = d.get("train_number") or d.get("flight_number", "")
+    seat = d.get("seat_type") or d.get("cabin_type", "")
+    return (f"{number} {str(d['departure_time'])[5:16]}→{str(d['arrival_time'])[11:16]} {seat} "
+            f"{d['price']}元 余{d['remaining_seats']}")
+
+
+def format_ticket_page(query_type, page, total, offset, order, truncated=False, pageable=True):
+    '''
+    渲染一页票务结果：标题说明线路、总条数与排序方式，之后每条一行；文本长度只与页大小有关，与结果总数无关
+    :param offset: 本页之前已展示的条数
+    :param truncated: 结果被SQL默认LIMIT截断，total只是排序后的前若干条
+    :param pageable: 是否签发了下一页的翻页令牌
+    '''
+    if not page:
+        return "无结果。如果需要其他日期，请补充。"
+    first = page[0]
+    label = {"train": "火车票", "flight": "机票", "concert": "演唱会门票"}.get(query_type, "票务")
+    subject = f"{first.get('city', '')}" if query_type == "concert" \
+        else f"{first.get('departure_city', '')} 到 {first.get('arrival_city', '')}"
+    lines = [f"{subject} {label}共 {total}{'+' if truncated else ''} 条（按{'票价' if order == 'price' else '时间'}排序），"
+             f"第 {offset + 1}-{offset + len(page)} 条："]
+    lines.extend(format_ticket_row(query_type, d) for d in page)
+    if offset + len(page) < total:
+        lines.append(f"还有 {total - offset - len(page)} 条结果，回复“下一页”继续查看。" if pageable
+                     else f"还有 {total - offset - len(page)} 条结果未展示。")
+    if truncated:
+        lines.append(f"结果超过 {total} 条，只保留排序后的前 {total} 条，可补充时间段、座位类型等条件缩小范围。")
+    return "\n".join(lines) + "\n"
+
+
+# 定义查询函数：复用会话池中已初始化的MCP会话
 async def get_ticket_info(sql):
     try:
-        # 启动 MCP server，通过streamable建立连接
-        async with streamablehttp_client("http://127.0.0.1:8001/mcp") as (read, write, _):
-            # 使用读写通道创建 MCP 会话
-            async with ClientSession(read, write) as session:
-                try:
-                    await session.initialize()
-                    # 工具调用
-                    result = await session.call_tool("query_tickets", {"sql": sql})
-                    result_data = json.loads(result) if isinstance(result, str) else result
-                    logger.info(f"票务查询结果：{result_data}")
-                    return result_data.content[0].text
-                except Exception as e:
-                    logger.error(f"票务 MCP 测试出错：{str(e)}")
-                    return {"status": "error", "message": f"票务 MCP 查询出错：{str(e)}"}
+        result = await call_mcp_tool("ticket", "query_tickets", {"sql": sql})
+        result_data = json.loads(result) if isinstance(result, str) else result
+        logger.info(f"票务查询结果：{result_data}")
+        return result_data.content[0].text
+    except asyncio.TimeoutError:  # 超时交给handle_task处理
+        raise
+    except Exception as e:
+        logger.error(f"票务 MCP 查询出错：{str(e)}")
+        return {"status": "error", "message": f"票务 MCP 查询出错：{str(e)}"}
+
+
+# 线路查询：由票务MCP服务查内存索引，不访问数据库
+async def search_ticket_routes(args):
+    try:
+        result = await call_mcp_tool("ticket", "search_tickets", args)
+        return result.content[0].text
+    except asyncio.TimeoutError:  # 超时交给handle_task处理
+        raise
     except Exception as e:
-        logger.error(f"连接或会话初始化时发生错误: {e}")
-        return {"status": "error", "message": "连接或会话初始化时发生错误"}
-
-# Agent 卡片定义
-agent_card = AgentCard(
-    name="TicketQueryAssistant",
-    description="基于 LangChain 提供票务查询服务的助手",
-    url="http://localhost:5006",
-    version="1.0.4",
-    capabilities={"streaming": True, "memory": True},
-    skills=[
-        AgentSkill(
-            name="execute ticket query",
-            description="根据客户端提供的输入执行票务查询，返回数据库结果，支持自然语言输入",
-            examples=["火车票 北京 上海 2025-07-31 硬卧", "机票 北京 上海 2025-07-31 经济舱",
-                      "演唱会 北京 刀郎 2025-08-23 看台"]
-        )
+        logger.error(f"票务 MCP 线路查询出错：{str(e)}")
+        return {"status": "error", "message": f"票务 MCP 查询出错：{str(e)}"}
+
+
+# 换乘查询：由票务MCP服务在内存换乘图上搜索
+async def search_ticket_transfers(args):
+    try:
+        result = await call_mcp_tool("ticket", "search_transfers", args)
+        response = json.loads(result.content[0].text)
+        logger.info(f"换乘查询结果：{response.get('status')}，{len(response.get('data', []))} 个方案")
+        return response
+    except asyncio.TimeoutError:  # 超时交给handle_task处理
+        raise
+    except Exception as e:
+        logger.error(f"票务 MCP 换乘查询出错：{str(e)}")
+        return {"status": "error", "message": f"票务 MCP 查询出错：{str(e)}"}
+
+# Agent 卡片定义：以字典声明，python_a2a导入较慢，首次需要AgentCard对象时才导入并构建
+AGENT_CARD = {
+    "name": "TicketQueryAssistant",
+    "description": "基于 LangChain 提供票务查询服务的助手",
+    "url": "http://localhost:5006",
+    "version": "1.0.4",
+    "capabilities": {"streaming": True, "memory": True},
+    "skills": [
+        {
+            "name": "execute ticket query",
+            "description": "根据客户端提供的输入执行票务查询，返回数据库结果，支持自然语言输入",
+            "examples": ["火车票 北京 上海 2025-07-31 硬卧", "机票 北京 上海 2025-07-31 经济舱",
+                         "演唱会 北京 刀郎 2025-08-23 看台"]
+        }
     ]
-)
+}
+resources.register("ticket_agent_card", lambda: lazy_import("python_a2a").AgentCard.from_dict(AGENT_CARD))
 
 
 # 票务查询服务器类
-class TicketQueryServer(A2AServer):
+class TicketQueryServer:
+    card = AGENT_CARD
+
     def __init__(self):
-        super().__init__(agent_card=agent_card)
-        self.llm = llm
-        self.sql_prompt = sql_prompt
         self.schema = table_schema_string
+        self.tasks = {}  # 任务ID -> 已处理的任务，供 tasks/get 查询
+
+    @property
+    def agent_card(self):
+        return resources.get("ticket_agent_card")
+
+    # LLM客户端与提示模板由资源注册表按需构建，进程内共享
+    @property
+    def llm(self):
+        return resources.get("llm")
+
+    @property
+    def sql_prompt(self):
+        return resources.get("ticket_sql_prompt")
+
+    @property
+    def structured_prompt(self):
+        return resources.get("ticket_structured_prompt")
 
     # 定义生成SQL查询方法，输入对话历史，返回SQL或追问JSON
-    def generate_sql_query(self, conversation: str) -> dict:
+    async def generate_sql_query(self, conversation: str, timeout=None) -> dict:
+        current_date = now_shanghai().strftime('%Y-%m-%d')  # 获取当前日期，格式化为字符串
+        key = conversation_cache_key(conversation, current_date) if conf.sql_cache_enabled else None
+        if key is not None:
+            cached = sql_cache.get(key)
+            if cached is not None:
+                logger.info(f"SQL生成命中缓存: {cached}")
+                return dict(cached)
+        inputs = {"conversation": conversation, "current_date": current_date, "table_schema_string": self.schema}
         try:
-            # 组装链
-            chain = self.sql_prompt | self.llm
-            # 调用链
-            current_date = datetime.now(pytz.timezone('Asia/Shanghai')).strftime('%Y-%m-%d')  # 获取当前日期，格式化为字符串
-            output = chain.invoke({"conversation": conversation, "current_date": current_date, "table_schema_string": self.schema}).content.strip()
-            logger.info(f"原始 LLM 输出: {output}")
-
-            # 处理 LLM 输出
-            # 处理结果，返回字典
-            lines = output.split('\n')
-            type_line = lines[0].strip()
-            if type_line.startswith('```json'):  # 检查是否以```json开头
-                type_line = lines[1].strip()  # 取下一行为类型行
-                sql_lines = lines[3:-1] if lines[-1].strip() == '```' else lines[3:]  # 提取SQL行，跳过代码块标记
+            if conf.ticket_output_mode == "structured":
+                result = await self.generate_structured(inputs, timeout)
             else:
-                sql_lines = lines[1:] if len(lines) > 1 else []  # 取剩余行为SQL行
-
-            # 提取 type 和 SQL
-            if type_line.startswith('{"type":'):  # 如果以{"type":开头
-                query_type = json.loads(type_line)["type"]  # 解析并提取类型
-                sql_query = ' '.join([line.strip() for line in sql_lines if
-                                      line.strip() and not line.startswith('```')])  # 连接SQL行，过滤空行和代码块
-                logger.info(f"分类类型: {query_type}, 生成的 SQL: {sql_query}")
-                return {"status": "sql", "type": query_type, "sql": sql_query}  # 返回SQL状态字典，包括类型
-            elif type_line.startswith('{"status": "input_required"'):  # 检查是否为追问JSON
-                return json.loads(type_line)
-            else:  # 无效格式
-                logger.error(f"无效的 LLM 输出格式: {output}")
-                return {"status": "input_required", "message": "无法解析查询类型或SQL，请提供更明确的信息。"}  # 返回默认追问
-
+                result = await self.generate_text(inputs, timeout)
+        except asyncio.TimeoutError:  # 超时交给handle_task处理，不当作追问
+            raise
         except Exception as e:
             logger.error(f"SQL 生成失败: {str(e)}")
             return {"status": "input_required", "message": "查询无效，请提供查询票务的相关信息。"}  # 返回追问JSON
-
+        if result is None:  # 无效格式
+            return {"status": "input_required", "message": "无法解析查询类型或SQL，请提供更明确的信息。"}  # 返回默认追问
+        # 解析成功才写入缓存，无效格式与异常时的默认追问不缓存
+        if key is not None:
+            sql_cache.set(key, dict(result))
+        return result
+
+    # 文本输出模式：LLM按两行格式输出，手工解析
+    async def generate_text(self, inputs, timeout):
+        # 组装链
+        chain = self.sql_prompt | self.llm
+        # 调用链
+        output = (await wait_with_timeout(chain.ainvoke(inputs, config=llm_config("ticket_sql")),
+                                          timeout)).content.strip()
+        logger.info(f"原始 LLM 输出: {output}")
+        result = parse_ticket_output(output)
+        metrics.incr("ticket_output.text." + ("ok" if result is not None else "failed"))
+        return result
+
+    # 结构化输出模式：通过工具调用让LLM按TicketQuery的JSON schema输出，并做字段校验
+    async def generate_structured(self, inputs, timeout):
+        chain = self.structured_prompt | self.llm.with_structured_output(TicketQuery, method="function_calling",
+                                                                         include_raw=True)
+        output = await wait_with_timeout(chain.ainvoke(inputs, config=llm_config("ticket_sql")), timeout)
+        if output["parsed"] is not None:
+            metrics.incr("ticket_output.structured.ok")
+            logger.info(f"结构化输出: {output['parsed']}")
+            return output["parsed"].to_result()
+        metrics.incr("ticket_output.structured.failed")
+        logger.error(f"结构化输出解析失败: {output['parsing_error'] or '模型未调用工具'}")
+        # 模型没有调用工具而是直接回复文本时，尝试按文本格式解析，避免再次调用LLM
+        content = getattr(output["raw"], "content", "")
+        result = parse_ticket_output(content.strip()) if isinstance(content, str) and content.strip() else None
+        if result is not None:
+            metrics.incr("ticket_output.structured.recovered")
+        return result
 
     # 处理任务：提取输入，生成SQL，调用MCP，格式化结果
+    # 同步入口：python_a2a的Flask服务器在请求线程中调用，任务提交到常驻事件循环执行，请求线程阻塞等待结果
     def handle_task(self, task):
+        return run_sync(self.handle_task_async(task))
+
+    # 异步入口：异步服务器（a2a_server/async_app.py）在事件循环中直接await，LLM与MCP调用都不占用线程
+    async def handle_task_async(self, task):
+        # 统计本次任务的LLM调用，结束后输出明细，指标文件在后台延迟写出
+        with track_turn("票务查询任务") as turn:
+            task = await self._handle_task(task)
+        logger.info(turn.summary_line())
+        metrics.dump_soon("ticket_agent")
+        return task
+
+    async def _handle_task(self, task):
+        a2a = await lazy_import_async("python_a2a")
         # 1 提取输入
         content = (task.message or {}).get("content", {})  # 从消息中获取内容
         # 提取conversation，即客户端发起的任务中的query语句
         conversation = content.get("text", "") if isinstance(content, dict) else ""
         logger.info(f"对话历史及用户问题: {conversation}")
+        # 截止时间：优先使用客户端随任务传入的截止时间，各阶段只使用剩余预算，并预留返回余量
+        deadline = task_deadline(task) or new_deadline(conf.agent_task_timeout)
 
         try:
+            # 翻页请求：令牌中已包含查询条件与游标，不再调用LLM
+            token = (task.metadata or {}).get(PAGE_TOKEN_KEY)
+            if token:
+                state = decode_page_token(token)
+                if not valid_page_state(state):
+                    task.status = a2a.TaskStatus(state=a2a.TaskState.FAILED,
+                                                 message={"role": "agent", "content": {"text": "翻页令牌无效，请重新查询。"}})
+                    return task
+                metrics.incr("ticket_query.page")
+                return await self._query_page(task, state, conversation, None, deadline)
+
             # 2 基于用户问题生成SQL查询
-            gen_result = self.generate_sql_query(conversation)
+            gen_result = await self.generate_sql_query(conversation,
+                                                       remaining_budget(deadline, margin=conf.deadline_margin))
             # 检查是否需要追问，如果是则添加追问消息后返回任务
             if gen_result["status"] == "input_required":
-                task.status = TaskStatus(state=TaskState.INPUT_REQUIRED,
-                                         message={"role": "agent", "content": {"text": gen_result["message"]}})
+                task.status = a2a.TaskStatus(state=a2a.TaskState.INPUT_REQUIRED,
+                                             message={"role": "agent", "content": {"text": gen_result["message"]}})
                 return task
 
             # 否则则提取SQL查询，并进行MCP调用
-            sql_query = gen_result["sql"]
+            # 执行前把SQL与槽位中的城市/艺人/场馆解析为规范取值
+            sql_query = resolve_query_sql(gen_result["sql"])
+            slots = resolve_query_slots(gen_result.get("slots"))
             query_type = gen_result["type"]
             logger.info(f"执行 SQL 查询: {sql_query} (类型: {query_type})")
 
-            # 3 调用MCP
-            ticket_result = asyncio.run(get_ticket_info(sql_query))
-
-            # 4 格式化结果
-            response = json.loads(ticket_result) if isinstance(ticket_result, str) else ticket_result
-            logger.info(f"MCP 返回: {response}")
-
-            # 检查响应状态
-            if response.get("status") == "success":
-                data = response.get("data", [])  # 提取数据列表
-                response_text = ""  # 初始化响应文本
-                for d in data:  # 遍历每个数据项
-                    if query_type == "train":  # 火车票类型
-                        response_text += f"{d['departure_city']} 到 {d['arrival_city']} {d['departure_time']}: 车次 {d['train_number']}，{d['seat_type']}，票价 {d['price']}元，剩余 {d['remaining_seats']} 张\n"  # 格式化火车票文本
-                    elif query_type == "flight":  # 机票类型
-                        response_text += f"{d['departure_city']} 到 {d['arrival_city']} {d['departure_time']}: 航班 {d['flight_number']}，{d['cabin_type']}，票价 {d['price']}元，剩余 {d['remaining_seats']} 张\n"  # 格式化机票文本
-                    elif query_type == "concert":  # 演唱会类型
-                        response_text += f"{d['city']} {d['start_time']}: {d['artist']} 演唱会，{d['ticket_type']}，场地 {d['venue']}，票价 {d['price']}元，剩余 {d['remaining_seats']} 张\n"  # 格式化演唱会文本
-                if not response_text:  # 检查文本是否为空
-                    response_text = "无结果。如果需要其他日期，请补充。"
-
-                # 设置任务产物为文本部分，并设置任务状态为完成
-                task.artifacts = [{"parts": [{"type": "text", "text": response_text}]}]
-                task.status = TaskStatus(state=TaskState.COMPLETED)
-            elif response.get("status") == "no_data":
-                response_text = response.get("message", "请输出查询票务的详细信息。")
-
-                # 设置任务状态为输入所需，添加追问消息
-                task.status = TaskStatus(state=TaskState.INPUT_REQUIRED,
-                                         message={"role": "agent", "content": {"text": response_text}})
+            # 查询状态：简单的线路查询走内存索引，其余执行SQL；翻页令牌中保存的就是这份状态
+            state = {"type": query_type, "order": ticket_order(conversation)}
+            route_args = route_search_args(query_type, sql_query)
+            if route_args is not None:
+                logger.info(f"线路查询走内存索引: {route_args}")
+                state["route"] = route_args
             else:
-                response_text = response.get("message", "查询失败，请重试或提供更多细节。")
-
-                # 设置任务状态为失败，添加错误信息
-                task.status = TaskStatus(state=TaskState.FAILED,
-                                         message={"role": "agent", "content": {"text": response_text}})
+                # SQL查询按排序方式追加ORDER BY，MCP服务追加的默认LIMIT截取的是排序后的前若干条
+                state["sql"] = append_order_by(sql_query, ticket_sort_columns(query_type, state["order"]))
+            return await self._query_page(task, state, conversation, slots, deadline)
+
+        except asyncio.TimeoutError:
+            logger.error("处理超时，已取消剩余工作")
+            # 设置任务状态为失败，添加超时信息
+            task.status = a2a.TaskStatus(state=a2a.TaskState.FAILED,
+                                         message={"role": "agent", "content": {"text": "查询超时，请稍后重试。"}})
             return task
 
-
         except Exception as e:  # 捕获异常
             logger.error(f"查询失败: {str(e)}")
 
             # 设置任务状态为失败，添加错误信息
-            task.status = TaskStatus(state=TaskState.FAILED,
-                                     message={"role": "agent", "content": {"text": f"查询失败: {str(e)} 请重试或提供更多细节。"}})
+            task.status = a2a.TaskStatus(state=a2a.TaskState.FAILED,
+                                         message={"role": "agent", "content": {"text": f"查询失败: {str(e)} 请重试或提供更多细节。"}})
             return task
 
+    async def _query_page(self, task, state, conversation, slots, deadline):
+        '''
+        执行查询并返回一页结果：按state中的排序方式取游标之后的前 ticket_page_size 条，
+        还有更多结果时在任务metadata中返回下一页的翻页令牌
+        :param state: 查询状态 {"type", "order", "route"或"sql", "after", "shown", "total", "truncated"}
+        :param slots: 结构化输出中的槽位，无直达时用于换乘查询；翻页时为None
+        '''
+        a2a = await lazy_import_async("python_a2a")
+        query_type, route_args = state["type"], state.get("route")
+
+        # 3 调用MCP：线路查询在MCP服务端完成排序分页，SQL查询取回结果后在本地分页
+        if route_args is not None:
+            metrics.incr("ticket_query.index")
+            ticket_call = search_ticket_routes(dict(route_args, order=state["order"], after=state.get("after"),
+                                                    limit=conf.ticket_page_size))
+        else:
+            metrics.incr("ticket_query.sql")
+            ticket_call = get_ticket_info(state["sql"])
+        ticket_result = await wait_with_timeout(ticket_call, remaining_budget(deadline, margin=conf.deadline_margin))
+
+        # 4 格式化结果
+        response = json.loads(ticket_result) if isinstance(ticket_result, str) else ticket_result
+        logger.info(f"MCP 返回: {response.get('status')}，{len(response.get('data', []))} 条")
+
+        # 检查响应状态
+        if response.get("status") == "success":
+            if "next" in response:
+                page, remaining, next_after = response["data"], response["total"], response["next"]
+            else:
+                rows = response.get("data", [])
+                page, remaining, next_after = page_rows(rows, state["order"], state.get("after"))
+                # SQL没有自带LIMIT且结果条数达到默认LIMIT时，说明结果被截断，总数只是下限
+                if "after" not in state:
+                    state["truncated"] = bool(conf.sql_default_limit) and not has_limit(state["sql"]) \
+                        and len(rows) >= conf.sql_default_limit
+            shown = state.get("shown", 0)
+            total = state.get("total") or remaining
+            truncated = state.get("truncated", False)
+            next_token = encode_page_token(dict(state, after=next_after, shown=shown + len(page), total=total)) \
+                if next_after is not None else None
+            response_text = format_ticket_page(query_type, page, total, shown, state["order"], truncated,
+                                               pageable=next_token is not None)
+
+            # 设置任务产物为文本部分和结构化数据部分（供客户端模板渲染），并设置任务状态为完成
+            task.artifacts = [{"parts": [{"type": "text", "text": response_text},
+                                         {"type": "data", "data": {"type": query_type, "rows": page, "total": total,
+                                                                   "offset": shown, "order": state["order"],
+                                                                   "truncated": truncated, "next": next_token}}]}]
+            # 下一页令牌随任务metadata返回，没有更多结果时去掉请求中带来的令牌
+            metadata = {key: value for key, value in (task.metadata or {}).items() if key != PAGE_TOKEN_KEY}
+            if next_token is not None:
+                metadata[PAGE_TOKEN_KEY] = next_token
+            task.metadata = metadata
+            task.status = a2a.TaskStatus(state=a2a.TaskState.COMPLETED)
+        elif response.get("status") == "no_data":
+            # 火车票/机票无直达时改查换乘方案（翻页时不再查）
+            transfer_args = transfer_search_args(query_type, route_args, slots, conversation) \
+                if "after" not in state else None
+            if transfer_args is not None:
+                transfers = await wait_with_timeout(search_ticket_transfers(transfer_args),
+                                                    remaining_budget(deadline, margin=conf.deadline_margin))
+                if transfers.get("status") == "success":
+                    metrics.incr("ticket_query.transfer")
+                    plans = transfers["data"]
+                    response_text = (f"{transfer_args['departure_city']} 到 {transfer_args['arrival_city']} "
+                                     f"{transfer_args['date']} 无直达，可选换乘方案：\n") + format_transfer_plans(plans)
+                    task.artifacts = [{"parts": [{"type": "text", "text": response_text},
+                                                 {"type": "data", "data": {"type": "transfer", "mode": query_type,
+                                                                           "plans": plans}}]}]
+                    task.status = a2a.TaskStatus(state=a2a.TaskState.COMPLETED)
+                    return task
+            response_text = response.get("message", "请输出查询票务的详细信息。")
+
+            # 设置任务状态为输入所需，添加追问消息
+            task.status = a2a.TaskStatus(state=a2a.TaskState.INPUT_REQUIRED,
+                                         message={"role": "agent", "content": {"text": response_text}})
+        else:
+            response_text = response.get("message", "查询失败，请重试或提供更多细节。")
+
+            # 设置任务状态为失败，添加错误信息
+            task.status = a2a.TaskStatus(state=a2a.TaskState.FAILED,
+                                         message={"role": "agent", "content": {"text": response_text}})
+        return task
 
 
 if __name__ == "__main__":
-    # 测试 generate_sql_query
-    server = TicketQueryServer()
-    server.generate_sql_query("火车票 从北京到上海 2025-11-01")
+    # 测试 generate_sql_query（asyncio.run 的事件循环结束后LLM客户端的连接不可复用，仅单独调试时打开）
+    # server = TicketQueryServer()
+    # asyncio.run(server.generate_sql_query("火车票 从北京到上海 2025-11-01"))
 
     # 测试 handle_task
     # server = TicketQueryServer()
@@ -292,12 +672,19 @@ if __name__ == "__main__":
     # 创建并运行服务器
     # 实例化票务查询服务器
     ticket_server = TicketQueryServer()
+    # 启动模式为eager时在开始服务前预热资源，并按配置打印启动耗时分析；lazy时开始服务后在后台预导入
+    if conf.startup_mode == "eager":
+        resources.warm(modules=["python_a2a", "mcp", "mcp.client.streamable_http"])
+    else:
+        resources.prefetch(["python_a2a", "mcp", "mcp.client.streamable_http"], ["entity_resolver"])
+    resources.mark("资源就绪")
+    resources.print_profile("票务查询代理")
     # 打印服务器信息
     print("\n=== 服务器信息 ===")
-    print(f"名称: {ticket_server.agent_card.name}")
-    print(f"描述: {ticket_server.agent_card.description}")
+    print(f"名称: {ticket_server.card['name']}")
+    print(f"描述: {ticket_server.card['description']}")
     print("\n技能:")
-    for skill in ticket_server.agent_card.skills:
-        print(f"- {skill.name}: {skill.description}")
+    for skill in ticket_server.card["skills"]:
+        print(f"- {skill['name']}: {skill['description']}")
     # 运行服务器
-    run_server(ticket_server, host="127.0.0.1", port=5006)
\ No newline at end of file
+    serve(ticket_server, host="127.0.0.1", port=5006)
\ No newline at end of file
@@ -1,27 +1,29 @@
 import json
 import asyncio
-from mcp import ClientSession
-from mcp.client.streamable_http import streamablehttp_client
-from python_a2a import A2AServer, run_server, AgentCard, AgentSkill, TaskStatus, TaskState, Message, TextContent, \
-    MessageRole, Task
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+
+# 最先导入资源注册表，以其导入时刻作为启动时刻
+from SmartVoyage.utils.resources import lazy_import, lazy_import_async, resources
 
 from SmartVoyage.config import Config
-from datetime import datetime
-import pytz
+from datetime import date
+import re
 
+from SmartVoyage.a2a_server.async_app import run_sync, serve
 from SmartVoyage.create_logger import logger
+from SmartVoyage.utils.cache import DailyLRUCache, conversation_cache_key
+from SmartVoyage.utils.date_resolver import now_shanghai, resolve_dates
+from SmartVoyage.utils.deadline import new_deadline, remaining_budget, task_deadline, wait_with_timeout
+from SmartVoyage.utils.entity_resolver import resolve_query_slots, resolve_query_sql
+from SmartVoyage.utils.mcp_pool import call_mcp_tool
+from SmartVoyage.utils.metrics import llm_config, metrics, track_turn
 
 conf = Config()
+resources.mark("导入完成")
+
+# SQL生成/槽位抽取结果缓存：同一对话、同一天的解析结果直接复用，不同用户的重复问题不再调用LLM
+sql_cache = DailyLRUCache(maxsize=conf.sql_cache_size)
+metrics.register_cache("weather_sql", sql_cache)
 
-# 初始化LLM
-llm = ChatOpenAI(
-    model=conf.model_name,
-    base_url=conf.base_url,
-    api_key=conf.api_key,
-    temperature=0.1
-)
 
 # 数据表 schema
 table_schema_string = """  # 定义天气数据表的SQL schema字符串，用于Prompt上下文
@@ -60,8 +62,8 @@ UNIQUE KEY unique_city_date (city, fx_date)
 ) ENGINE=INNODB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='天气数据表';
 """
 
-# 生成SQL的提示词
-sql_prompt = ChatPromptTemplate.from_template(
+# 生成SQL的提示词模板，首次使用时才构建ChatPromptTemplate
+sql_prompt_template = (
     """
 系统提示：你是一个专业的天气SQL生成器，需要从对话历史（含用户的问题）中提取关键信息，然后基于weather_data表生成SELECT语句。
 - 如果用户需要查天气，则至少需要城市和时间信息。如果对话历史中缺乏必要的信息，可以向其追问，输出格式为json格式，如示例所示；如果对话历史中信息齐全，则输出纯SQL即可。
@@ -89,158 +91,336 @@ weather_data表结构：{table_schema_string}
 当前日期: {current_date} (Asia/Shanghai)
     """
 )
+resources.register("weather_sql_prompt",
+                   lambda: lazy_import("langchain_core.prompts").ChatPromptTemplate.from_template(sql_prompt_template))
 
-# 定义查询函数
-async def get_weather(sql):
+# 槽位抽取的提示词模板：只输出城市与日期范围，由代理填入固定的参数化查询
+slot_prompt_template = (
+    """
+系统提示：你是一个天气查询信息抽取器，需要从对话历史（含用户的问题）中提取城市和日期范围，不需要生成SQL。
+- 信息齐全时输出纯JSON：{{"city": "城市", "start_date": "YYYY-MM-DD", "end_date": "YYYY-MM-DD"}}，单日查询时start_date与end_date相同。
+- 相对日期（今天、明天、后天、未来N天等）根据当前日期换算；用户的最新问题缺少城市或日期时，可以从对话历史中补全。
+- 如果对话历史中缺乏城市或日期，输出：{{"status": "input_required", "message": "请提供城市和日期，例如 '北京 2025-07-30'。"}}
+- 如果用户问与天气无关的问题，输出：{{"status": "input_required", "message": "请提供天气相关查询，包括城市和日期。"}}
+
+
+示例：
+- 对话: user: 北京 2025-07-30
+输出: {{"city": "北京", "start_date": "2025-07-30", "end_date": "2025-07-30"}}
+- 对话: user: 上海未来3天的天气
+输出: {{"city": "上海", "start_date": "2025-07-30", "end_date": "2025-08-01"}}
+- 对话: user: 北京明天的天气\nassistant: 多云。\nuser: 后天呢
+输出: {{"city": "北京", "start_date": "2025-08-01", "end_date": "2025-08-01"}}
+- 对话: user: 北京的天气
+输出: {{"status": "input_required", "message": "请提供具体的需要查询的日期，例如 '2025-07-30'。"}}
+
+对话历史: {conversation}
+当前日期: {current_date} (Asia/Shanghai)
+    """
+)
+resources.register("weather_slot_prompt",
+                   lambda: lazy_import("langchain_core.prompts").ChatPromptTemplate.from_template(slot_prompt_template))
+
+
+# 定义查询函数：调用天气MCP工具，复用会话池中已初始化的MCP会话
+async def call_weather_tool(tool_name, arguments):
     try:
-        # 启动 MCP server，通过streamable建立连接
-        async with streamablehttp_client("http://127.0.0.1:8002/mcp") as (read, write, _):
-            # 使用读写通道创建 MCP 会话
-            async with ClientSession(read, write) as session:
-                try:
-                    await session.initialize()
-                    # 工具调用
-                    result = await session.call_tool("query_weather", {"sql": sql})
-                    result_data = json.loads(result) if isinstance(result, str) else result
-                    logger.info(f"天气查询结果：{result_data}")
-                    return result_data.content[0].text
-                except Exception as e:
-                    logger.error(f"天气 MCP 测试出错：{str(e)}")
-                    return {"status": "error", "message": f"天气 MCP 查询出错：{str(e)}"}
+        result = await call_mcp_tool("weather", tool_name, arguments)
+        result_data = json.loads(result) if isinstance(result, str) else result
+        logger.info(f"天气查询结果：{result_data}")
+        return result_data.content[0].text
+    except asyncio.TimeoutError:  # 超时交给handle_task处理
+        raise
     except Exception as e:
-        logger.error(f"连接或会话初始化时发生错误: {e}")
-        return {"status": "error", "message": "连接或会话初始化时发生错误"}
-
-
-# Agent卡片定义
-agent_card = AgentCard(
-    name="WeatherQueryAssistant",
-    description="基于LangChain提供天气查询服务的助手",
-    url="http://localhost:5005",
-    version="1.0.0",
-    capabilities={"streaming": True, "memory": True},  # 设置能力：支持流式和内存
-    skills=[  # 定义技能列表
-        AgentSkill(
-            name="execute weather query",
-            description="执行天气查询，返回天气数据库结果，支持自然语言输入",
-            examples=["北京 2025-07-30 天气", "上海未来5天", "今天天气如何"]
-        )
+        logger.error(f"天气 MCP 查询出错：{str(e)}")
+        return {"status": "error", "message": f"天气 MCP 查询出错：{str(e)}"}
+
+
+# 执行LLM生成的SQL
+async def get_weather(sql):
+    return await call_weather_tool("query_weather", {"sql": sql})
+
+
+# 按城市和日期范围查询，MCP端使用固定的参数化语句
+async def get_weather_by_range(city, start_date, end_date):
+    return await call_weather_tool("query_weather_range",
+                                   {"city": city, "start_date": start_date, "end_date": end_date})
+
+
+# Agent卡片定义：以字典声明，python_a2a导入较慢，首次需要AgentCard对象时才导入并构建
+AGENT_CARD = {
+    "name": "WeatherQueryAssistant",
+    "description": "基于LangChain提供天气查询服务的助手",
+    "url": "http://localhost:5005",
+    "version": "1.0.0",
+    "capabilities": {"streaming": True, "memory": True},  # 设置能力：支持流式和内存
+    "skills": [  # 定义技能列表
+        {
+            "name": "execute weather query",
+            "description": "执行天气查询，返回天气数据库结果，支持自然语言输入",
+            "examples": ["北京 2025-07-30 天气", "上海未来5天", "今天天气如何"]
+        }
     ]
-)
+}
+resources.register("weather_agent_card", lambda: lazy_import("python_a2a").AgentCard.from_dict(AGENT_CARD))
 
 
 # 天气查询服务器类
-class WeatherQueryServer(A2AServer):
+class WeatherQueryServer:
+    card = AGENT_CARD
+
     def __init__(self):
-        super().__init__(agent_card=agent_card)
-        self.llm = llm
-        self.sql_prompt = sql_prompt
         self.schema = table_schema_string
+        self.tasks = {}  # 任务ID -> 已处理的任务，供 tasks/get 查询
+
+    @property
+    def agent_card(self):
+        return resources.get("weather_agent_card")
+
+    # LLM客户端与提示模板由资源注册表按需构建，进程内共享
+    @property
+    def llm(self):
+        return resources.get("llm")
+
+    @property
+    def sql_prompt(self):
+        return resources.get("weather_sql_prompt")
+
+    @property
+    def slot_prompt(self):
+        return resources.get("weather_slot_prompt")
+
+    # 校验并规范化槽位：城市非空，日期为YYYY-MM-DD且开始不晚于结束，不合法时返回None
+    @staticmethod
+    def normalize_slots(slots):
+        city = slots.get("city")
+        if not isinstance(city, str) or not city.strip():
+            return None
+        try:
+            start_date = date.fromisoformat(str(slots.get("start_date")))
+            end_date = date.fromisoformat(str(slots.get("end_date") or slots.get("start_date")))
+        except ValueError:
+            return None
+        if start_date > end_date:
+            start_date, end_date = end_date, start_date
+        return {"status": "slots", "city": city.strip(), "start_date": start_date.isoformat(),
+                "end_date": end_date.isoformat()}
+
+    # 本地解析最新一句用户问题：恰好一个已知城市且能解析出日期时直接返回槽位，否则返回None
+    def parse_slots_locally(self, conversation, today=None):
+        lines = [line for line in conversation.strip().split("\n") if line.strip()]
+        if not lines:
+            return None
+        question = lines[-1].split(":", 1)[-1] if lines[-1].startswith("User:") else lines[-1]
+        # 城市词典是实体解析器的视图（识别别名、拼音与错别字），解析器需要查询数据库，在后台线程中构建，
+        # 构建完成前不在本地解析（不阻塞事件循环）
+        dictionary = resources.get_nowait("entity_dictionary")
+        if dictionary is None:
+            return None
+        dates = resolve_dates(question, today)
+        cities = dictionary.find_cities(question)
+        if dates is None or len(cities) != 1:
+            return None
+        return self.normalize_slots({"city": cities[0][2], "start_date": dates[0], "end_date": dates[1]})
+
+    async def extract_slots(self, conversation: str, timeout=None) -> dict:
+        '''
+        槽位抽取模式：先本地解析，解析不出再让LLM只输出城市和日期范围
+        :param conversation: 对话历史及用户问题
+        :param timeout: LLM调用的时间预算（秒）
+        :return: {"status": "slots", "city", "start_date", "end_date"} 或追问JSON
+        '''
+        slots = self.parse_slots_locally(conversation)
+        if slots is not None:
+            logger.info(f"本地解析槽位: {slots}")
+            return slots
+        current_date = now_shanghai().strftime("%Y-%m-%d")
+        key = conversation_cache_key(conversation, current_date, "slots") if conf.sql_cache_enabled else None
+        if key is not None:
+            cached = sql_cache.get(key)
+            if cached is not None:
+                logger.info(f"槽位抽取命中缓存: {cached}")
+                return dict(cached)
+        try:
+            chain = self.slot_prompt | self.llm
+            output = (await wait_with_timeout(chain.ainvoke({"conversation": conversation, "current_date": current_date},
+                                                            config=llm_config("weather_slots")), timeout)).content.strip()
+            logger.info(f"原始 LLM 输出: {output}")
+            result = json.loads(re.sub(r'^```json\s*|\s*```$', '', output).strip())
+            if result.get("status") != "input_required":
+                result = self.normalize_slots(result) or {
+                    "status": "input_required", "message": "请提供城市和日期，例如 '北京 2025-07-30'。"}
+        except asyncio.TimeoutError:  # 超时交给handle_task处理，不当作追问
+            raise
+        except Exception as e:
+            logger.error(f"槽位抽取出错: {e}")
+            return {"status": "input_required", "message": "查询无效，请提供城市和日期。"}
+        # 解析成功才写入缓存，异常时的默认追问不缓存
+        if key is not None:
+            sql_cache.set(key, dict(result))
+        return result
 
     # 定义生成SQL查询方法，输入对话历史，返回SQL或追问JSON
-    def generate_sql_query(self, conversation: str) -> dict:
+    async def generate_sql_query(self, conversation: str, timeout=None) -> dict:
+        current_date = now_shanghai().strftime("%Y-%m-%d")
+        key = conversation_cache_key(conversation, current_date) if conf.sql_cache_enabled else None
+        if key is not None:
+            cached = sql_cache.get(key)
+            if cached is not None:
+                logger.info(f"SQL生成命中缓存: {cached}")
+                return dict(cached)
         try:
             # 组装链
             chain = self.sql_prompt | self.llm
             # 调用链
-            current_date = datetime.now(pytz.timezone('Asia/Shanghai')).strftime("%Y-%m-%d")
-            output = chain.invoke({"conversation": conversation, "current_date": current_date, "table_schema_string": self.schema}).content.strip()
+            output = (await wait_with_timeout(chain.ainvoke({"conversation": conversation, "current_date": current_date, "table_schema_string": self.schema},
+                                                            config=llm_config("weather_sql")), timeout)).content.strip()
             logger.info(f"原始 LLM 输出: {output}")
             # 处理结果，返回字典
             if output.startswith("{"):
-                return json.loads(output)
+                result = json.loads(output)
             else:
-                return {"status": "sql", "sql": output}
+                result = {"status": "sql", "sql": output}
 
+        except asyncio.TimeoutError:  # 超时交给handle_task处理，不当作追问
+            raise
         except Exception as e:
             logger.error(f"生成SQL查询出错: {e}")
             return {"status": "input_required", "message": "查询无效，请提供城市和日期。"}
+        # 解析成功才写入缓存，异常时的默认追问不缓存
+        if key is not None:
+            sql_cache.set(key, dict(result))
+        return result
 
     # 处理任务：提取输入，生成SQL，调用MCP，格式化结果
+    # 同步入口：python_a2a的Flask服务器在请求线程中调用，任务提交到常驻事件循环执行，请求线程阻塞等待结果
     def handle_task(self, task):
+        return run_sync(self.handle_task_async(task))
+
+    # 异步入口：异步服务器（a2a_server/async_app.py）在事件循环中直接await，LLM与MCP调用都不占用线程
+    async def handle_task_async(self, task):
+        # 统计本次任务的LLM调用，结束后输出明细，指标文件在后台延迟写出
+        with track_turn("天气任务") as turn:
+            task = await self._handle_task(task)
+        logger.info(turn.summary_line())
+        metrics.dump_soon("weather_agent")
+        return task
+
+    async def _handle_task(self, task):
+        a2a = await lazy_import_async("python_a2a")
         # 1. 提取输入
         content = (task.message or {}).get("content", {})  # 从消息中获取内容
         # 提取conversation，即客户端发起的任务中的query语句
         conversation = content.get("text", "") if isinstance(content, dict) else ""
         logger.info(f"对话历史及用户问题: {conversation}")
+        # 截止时间：优先使用客户端随任务传入的截止时间，各阶段只使用剩余预算，并预留返回余量
+        deadline = task_deadline(task) or new_deadline(conf.agent_task_timeout)
 
-        # 2. 生成SQL
+        # 2. 生成SQL（sql模式）或抽取槽位（slots模式）
         try:
-            sql_result = self.generate_sql_query(conversation)
+            if conf.weather_query_mode == "slots":
+                sql_result = await self.extract_slots(conversation,
+                                                      remaining_budget(deadline, margin=conf.deadline_margin))
+            else:
+                sql_result = await self.generate_sql_query(
+                    conversation, remaining_budget(deadline, margin=conf.deadline_margin))
             # 检查是否需要追问，如果需要追问则将追问信息返回给客户端
             if sql_result.get("status") == "input_required":
                 # 追问逻辑，这里是指在无法正常生成sql时，设置任务状态为输入所需，添加追问消息
-                task.status = TaskStatus(state=TaskState.INPUT_REQUIRED,
-                                         message={"role": "agent", "content": {"text": sql_result["message"]}})
+                task.status = a2a.TaskStatus(state=a2a.TaskState.INPUT_REQUIRED,
+                                             message={"role": "agent", "content": {"text": sql_result["message"]}})
                 return task
+            elif sql_result.get("status") == "slots":  # 槽位齐全，调用固定的参数化范围查询
+                sql_result = resolve_query_slots(sql_result)
+                logger.info(f"天气查询槽位: {sql_result}")
+
+                # 3. 调用MCP工具
+                weather_result = await wait_with_timeout(
+                    get_weather_by_range(sql_result["city"], sql_result["start_date"], sql_result["end_date"]),
+                    remaining_budget(deadline, margin=conf.deadline_margin))
             else: # 否则，生成SQL成功，需要调用MCP工具，返回具体的内容
-                sql_query = sql_result["sql"]
+                sql_query = resolve_query_sql(sql_result["sql"])
                 logger.info(f"SQL查询语句: {sql_query}")
 
                 # 3. 调用MCP工具
-                weather_result = asyncio.run(get_weather(sql_query))
+                weather_result = await wait_with_timeout(get_weather(sql_query),
+                                                         remaining_budget(deadline, margin=conf.deadline_margin))
                 # logger.info(f"调用MCP得到的天气查询结果: {weather_result}")
 
-                # 4. 格式化结果
-                response = json.loads(weather_result) if isinstance(weather_result, str) else weather_result
-                logger.info(f"MCP 返回: {response}")
-                # 检查响应状态
-                if response.get("status") == "success":
-                    data = response.get("data", [])  # 提取数据列表
-                    response_text = "\n".join([
-                                                  f"{d['city']} {d['fx_date']}: {d['text_day']}（夜间 {d['text_night']}），温度 {d['temp_min']}-{d['temp_max']}°C，湿度 {d['humidity']}%，风向 {d['wind_dir_day']}，降水 {d['precip']}mm"
-                                                  for d in data])  # 格式化每个数据项为友好文本，连接成多行
-
-                    # 设置任务产物为文本部分，并设置任务状态为完成
-                    task.artifacts = [{"parts": [{"type": "text", "text": response_text}]}]
-                    task.status = TaskStatus(state=TaskState.COMPLETED)
-                elif response.get("status") == "no_data":
-                    response_text = response.get("message", "请重新输入查询的城市和日期。")
-
-                    # 设置任务状态为输入所需，添加追问消息
-                    task.status = TaskStatus(state=TaskState.INPUT_REQUIRED,
+            # 4. 格式化结果
+            response = json.loads(weather_result) if isinstance(weather_result, str) else weather_result
+            logger.info(f"MCP 返回: {response}")
+            # 检查响应状态
+            if response.get("status") == "success":
+                data = response.get("data", [])  # 提取数据列表
+                response_text = "\n".join([
+                                              f"{d['city']} {d['fx_date']}: {d['text_day']}（夜间 {d['text_night']}），温度 {d['temp_min']}-{d['temp_max']}°C，湿度 {d['humidity']}%，风向 {d['wind_dir_day']}，降水 {d['precip']}mm"
+                                              for d in data])  # 格式化每个数据项为友好文本，连接成多行
+
+                # 设置任务产物为文本部分和结构化数据部分（供客户端模板渲染），并设置任务状态为完成
+                task.artifacts = [{"parts": [{"type": "text", "text": response_text},
+                                             {"type": "data", "data": {"type": "weather", "rows": data}}]}]
+                task.status = a2a.TaskStatus(state=a2a.TaskState.COMPLETED)
+            elif response.get("status") == "no_data":
+                response_text = response.get("message", "请重新输入查询的城市和日期。")
+
+                # 设置任务状态为输入所需，添加追问消息
+                task.status = a2a.TaskStatus(state=a2a.TaskState.INPUT_REQUIRED,
                                              message={"role": "agent", "content": {"text": response_text}})
-                else:
-                    response_text = response.get("message", "查询失败，请重试或提供更多细节。")
+            else:
+                response_text = response.get("message", "查询失败，请重试或提供更多细节。")
 
-                    # 设置任务状态为失败，添加错误信息
-                    task.status = TaskStatus(state=TaskState.FAILED,
+                # 设置任务状态为失败，添加错误信息
+                task.status = a2a.TaskStatus(state=a2a.TaskState.FAILED,
                                              message={"role": "agent", "content": {"text": response_text}})
 
-                return task
+            return task
 
+        except asyncio.TimeoutError:
+            logger.error("处理超时，已取消剩余工作")
+            # 设置任务状态为失败，添加超时信息
+            task.status = a2a.TaskStatus(state=a2a.TaskState.FAILED,
+                                         message={"role": "agent", "content": {"text": "查询超时，请稍后重试。"}})
+            return task
         except Exception as e:
             logger.error(f"查询失败: {str(e)}")
 
             # 设置任务状态为失败，添加错误信息
-            task.status = TaskStatus(state=TaskState.FAILED,
-                                     message={"role": "agent",
-                                              "content": {"text": f"查询失败: {str(e)} 请重试或提供更多细节。"}})
+            task.status = a2a.TaskStatus(state=a2a.TaskState.FAILED,
+                                         message={"role": "agent",
+                                         "content": {"text": f"查询失败: {str(e)} 请重试或提供更多细节。"}})
             return task
 
 
 if __name__ == "__main__":
     # 测试 generate_sql_query
     # server = WeatherQueryServer()
-    # server.generate_sql_query('今天北京的天气如何')
+    # asyncio.run(server.generate_sql_query('今天北京的天气如何'))
 
 
-    # 测试 handle_task
-    server = WeatherQueryServer()
-    message = Message(content=TextContent(text="查询北京今天的天气"), role=MessageRole.USER)
-    # Task中存储和封装Message
-    task = Task(message=message.to_dict())
-    server.handle_task(task)
+    # 测试 handle_task（会在服务使用的事件循环之外初始化LLM客户端、连接池等资源，仅单独调试时打开）
+    # server = WeatherQueryServer()
+    # message = Message(content=TextContent(text="查询北京今天的天气"), role=MessageRole.USER)
+    # # Task中存储和封装Message
+    # task = Task(message=message.to_dict())
+    # server.handle_task(task)
 
     # 创建并运行服务器
     # 实例化天气查询服务器
     weather_server = WeatherQueryServer()
+    # 启动模式为eager时在开始服务前预热资源，并按配置打印启动耗时分析；lazy时开始服务后在后台预导入
+    if conf.startup_mode == "eager":
+        resources.warm(modules=["python_a2a", "mcp", "mcp.client.streamable_http"])
+    else:
+        resources.prefetch(["python_a2a", "mcp", "mcp.client.streamable_http"], ["entity_dictionary"])
+    resources.mark("资源就绪")
+    resources.print_profile("天气代理")
     # 打印服务器信息
     print("\n=== 服务器信息 ===")
-    print(f"名称: {weather_server.agent_card.name}")
-    print(f"描述: {weather_server.agent_card.description}")
+    print(f"名称: {weather_server.card['name']}")
+    print(f"描述: {weather_server.card['description']}")
     print("\n技能:")
-    for skill in weather_server.agent_card.skills:
-        print(f"- {skill.name}: {skill.description}")
+    for skill in weather_server.card["skills"]:
+        print(f"- {skill['name']}: {skill['description']}")
     # 运行服务器
-    run_server(weather_server, host="127.0.0.1", port=5005)
\ No newline at end of file
+    serve(weather_server, host="127.0.0.1", port=5005)
\ No newline at end of file
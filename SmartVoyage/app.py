@@ -1,21 +1,32 @@
 import os
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
-import asyncio
-import uuid
+# 最先导入资源注册表，以其导入时刻作为启动时刻；Streamlit每次rerun时模块已缓存，不会重复导入
+from SmartVoyage.utils.resources import resources
 import streamlit as st
-from python_a2a import AgentNetwork, Message, TextContent, MessageRole, Task
-from langchain_openai import ChatOpenAI
 import json
-from datetime import datetime
-import pytz
-import re  # 用于清理响应
 
 from SmartVoyage.config import Config
 from SmartVoyage.create_logger import logger
-from SmartVoyage.main_prompts import SmartVoyagePrompts
+from SmartVoyage.orchestrator.intent import intent_cache, fast_classifier
+from SmartVoyage.orchestrator.pipeline import handle_turn
+from SmartVoyage.orchestrator.runtime import get_runtime
+from SmartVoyage.orchestrator.speculation import speculation_stats
+from SmartVoyage.orchestrator.turn_store import TurnStore
+from SmartVoyage.utils.metrics import metrics
 
 conf = Config()
+# 编排运行时在进程内唯一，Streamlit每次rerun都复用同一个常驻事件循环和连接池
+runtime = get_runtime()
+# 首次运行时按启动模式预热资源并打印启动耗时分析，后续rerun跳过
+if not resources.marks:
+    # 启动模式为eager时在开始服务前导入python_a2a、构建全部资源；lazy时在后台预导入并构建实体词典
+    if conf.startup_mode == "eager":
+        resources.warm(modules=["python_a2a"])
+    else:
+        resources.prefetch(["python_a2a"], ["entity_dictionary"])
+    resources.mark("资源就绪")
+    resources.print_profile("Streamlit前端")
 
 # 设置页面配置
 st.set_page_config(page_title="基于A2A的SmartVoyage旅行助手系统", layout="wide", page_icon="🤖")
@@ -60,50 +71,13 @@ if "messages" not in st.session_state:
     st.session_state.messages = []
 if "agent_network" not in st.session_state:
     # 存储代理URL信息，便于查看
-    st.session_state.agent_urls = {
-        "WeatherQueryAssistant": "http://localhost:5005",
-        "TicketQueryAssistant": "http://localhost:5006",
-        "TicketOrderAssistant": "http://localhost:5007"
-    }
-    # 初始化网络
-    network = AgentNetwork(name="Travel Assistant Network")
-    network.add("WeatherQueryAssistant", "http://localhost:5005")
-    network.add("TicketQueryAssistant", "http://localhost:5006")
-    network.add("TicketOrderAssistant", "http://localhost:5007")
-    st.session_state.agent_network = network
-    # 加载配置并创建LLM
-    st.session_state.llm = ChatOpenAI(
-        model=conf.model_name,
-        api_key=conf.api_key,
-        base_url=conf.base_url,
-        temperature=0.1
-    )
-    # 存储对话历史用于意图识别
-    st.session_state.conversation_history = ""
-
-# 意图识别agent
-def intent_agent(user_input):
-    # 创建意图识别链：提示模板 + LLM
-    chain = SmartVoyagePrompts.intent_prompt() | st.session_state.llm
-
-    # 调用LLM进行意图识别
-    current_date = datetime.now(pytz.timezone('Asia/Shanghai')).strftime('%Y-%m-%d')  # 获取当前日期（Asia/Shanghai时区）
-    intent_response = chain.invoke(
-        {"conversation_history": '\n'.join(st.session_state.conversation_history.split("\n")[-6:]), "query": user_input,
-         "current_date": current_date}).content.strip()
-    logger.info(f"意图识别原始响应: {intent_response}")
-
-    # 清理响应：移除可能的Markdown代码块标记
-    intent_response = re.sub(r'^```json\s*|\s*```$', '', intent_response).strip()
-    logger.info(f"清理后响应: {intent_response}")
-    intent_output = json.loads(intent_response)
-    # 提取意图、改写问题和追问消息
-    intents = intent_output.get("intents", [])
-    user_queries = intent_output.get("user_queries", {})
-    follow_up_message = intent_output.get("follow_up_message", "")
-    logger.info(f"intents: {intents}||user_queries: {user_queries}||follow_up_message: {follow_up_message} ")
-
-    return intents, user_queries, follow_up_message
+    st.session_state.agent_urls = conf.agent_urls
+    # 初始化网络：所有代理共用运行时的长连接池
+    st.session_state.agent_network = runtime.create_network("Travel Assistant Network", conf.agent_urls)
+    # 共享的LLM客户端：所有会话复用资源注册表中的同一个实例，rerun不会重复创建
+    st.session_state.llm = resources.get("llm")
+    # 会话轮次存储：环形缓冲区 + 槽位记忆，用于意图识别和代理调用
+    st.session_state.turn_store = TurnStore()
 
 
 # 主界面布局
@@ -127,90 +101,14 @@ with col1:
         with st.chat_message("user"):
             st.markdown(prompt)
         st.session_state.messages.append({"role": "user", "content": prompt})
-        st.session_state.conversation_history += f"\nUser: {prompt}"
-
-        # 获取 LLM 和当前日期
-        llm = st.session_state.llm
-        current_date = datetime.now(pytz.timezone('Asia/Shanghai')).strftime('%Y-%m-%d')
 
         # 意图识别
         with st.spinner("正在分析您的意图..."):
             try:
-                # 意图识别过程
-                intents, user_queries, follow_up_message = intent_agent(prompt)
-
-                # 根据意图输出生成响应
-                if "out_of_scope" in intents:
-                    # 如果意图超出范围，返回大模型直接回复
-                    response = follow_up_message
-                    st.session_state.conversation_history += f"\nAssistant: {response}"
-                elif follow_up_message != "":
-                    # 如果有追问消息，则直接返回
-                    response = follow_up_message
-                    st.session_state.conversation_history += f"\nAssistant: {response}"  # 更新历史
-                else:  # 处理有效意图
-                    responses = []  # 存储每个意图的响应列表
-                    routed_agents = []  # 记录路由到的代理列表
-                    for intent in intents:
-                        logger.info(f"处理意图：{intent}")
-                        # 根据意图确定代理名称
-                        if intent == "weather":
-                            agent_name = "WeatherQueryAssistant"
-                        elif intent in ["flight", "train", "concert"]:
-                            agent_name = "TicketQueryAssistant"
-                        elif intent == "order":
-                            agent_name = "TicketOrderAssistant"
-                        else:
-                            agent_name = None
-
-                        # 不同意图处理方式
-                        if intent == "attraction":
-                            # 对于景点推荐，直接使用LLM生成
-                            chain = SmartVoyagePrompts.attraction_prompt() | llm
-                            rec_response = chain.invoke({"query": prompt}).content.strip()
-                            responses.append(rec_response)
-                        elif agent_name:
-                            # 对于代理意图，则调用代理
-                            # 1）获取问题
-                            query_str = user_queries.get(intent, {})
-                            logger.info(f"{agent_name} 查询：{query_str}")
-                            # 2）获取代理实例
-                            agent = st.session_state.agent_network.get_agent(agent_name)
-                            # 3）构建历史对话信息+新查询，然后调用代理
-                            chat_history = '\n'.join(st.session_state.conversation_history.split("\n")[-7:-1]) + f'\nUser: {query_str}'
-                            message = Message(content=TextContent(text=chat_history), role=MessageRole.USER)
-                            task = Task(id="task-" + str(uuid.uuid4()), message=message.to_dict())
-                            raw_response = asyncio.run(agent.send_task_async(task))
-                            logger.info(f"{agent_name} 原始响应: {raw_response}")  # 记录原始响应日志
-                            # 4）处理结果
-                            if raw_response.status.state == 'completed':  # 正常结果
-                                agent_result = raw_response.artifacts[0]['parts'][0]['text']
-                            else:  # 异常结果
-                                agent_result = raw_response.status.message['content']['text']
-
-                            # 根据代理类型总结响应
-                            if agent_name == "WeatherQueryAssistant":
-                                chain = SmartVoyagePrompts.summarize_weather_prompt() | llm
-                                final_response = chain.invoke(
-                                    {"query": query_str, "raw_response": agent_result}).content.strip()
-                            elif agent_name == "TicketQueryAssistant":
-                                chain = SmartVoyagePrompts.summarize_ticket_prompt() | llm
-                                final_response = chain.invoke(
-                                    {"query": query_str, "raw_response": agent_result}).content.strip()
-                            else:
-                                final_response = agent_result
-
-                            # 5）添加到历史
-                            responses.append(final_response)  # 添加到响应列表
-                            routed_agents.append(agent_name)  # 记录路由代理
-                        else:
-                            # 不支持的意图
-                            responses.append("暂不支持此意图。")
-
-                    response = "\n\n".join(responses)
-                    if routed_agents:
-                        logger.info(f"路由到代理：{routed_agents}")
-                    st.session_state.conversation_history += f"\nAssistant: {response}"
+                # 意图识别、并发路由与响应生成，在编排运行时中执行
+                response, intents, routed_agents = runtime.run(
+                    handle_turn(prompt, st.session_state.turn_store, st.session_state.llm,
+                                st.session_state.agent_network))
 
                 # 显示助手消息
                 with st.chat_message("assistant"):
@@ -236,14 +134,38 @@ with col2:
         agent_card = st.session_state.agent_network.get_agent_card(agent_name)
         agent_url = st.session_state.agent_urls.get(agent_name, "未知地址")
         with st.expander(f"Agent: {agent_name}", expanded=False):
+            # 卡片由后台探测拉取，代理离线或尚未探测到时为空
+            skills = agent_card.skills if agent_card is not None else "尚未获取"
+            description = agent_card.description if agent_card is not None else "尚未获取"
             st.markdown(f"<div class='card-title'>技能</div>", unsafe_allow_html=True)
-            st.markdown(f"<div class='card-content'>{agent_card.skills}</div>", unsafe_allow_html=True)
+            st.markdown(f"<div class='card-content'>{skills}</div>", unsafe_allow_html=True)
             st.markdown(f"<div class='card-title'>描述</div>", unsafe_allow_html=True)
-            st.markdown(f"<div class='card-content'>{agent_card.description}</div>", unsafe_allow_html=True)
+            st.markdown(f"<div class='card-content'>{description}</div>", unsafe_allow_html=True)
             st.markdown(f"<div class='card-title'>地址</div>", unsafe_allow_html=True)
             st.markdown(f"<div class='card-content'>{agent_url}</div>", unsafe_allow_html=True)
             st.markdown(f"<div class='card-title'>状态</div>", unsafe_allow_html=True)
-            st.markdown(f"<div class='card-content'>在线</div>", unsafe_allow_html=True)
+            st.markdown(f"<div class='card-content'>{st.session_state.agent_network.status(agent_name)}</div>",
+                        unsafe_allow_html=True)
+    # 运行统计：连接池与意图缓存
+    with st.expander("📊 运行统计", expanded=False):
+        for url, stats in runtime.pool_stats().items():
+            st.markdown(f"**{url}**：请求 {stats['requests']}，复用 {stats['hits']}，新建 {stats['opens']}，空闲回收 {stats['idle_evictions']}")
+        stats = intent_cache.stats()
+        st.markdown(f"**意图缓存**：条目 {stats['size']}，命中 {stats['hits']}，未命中 {stats['misses']}，命中率 {stats['hit_rate']:.2%}")
+        for agent_name, stats in st.session_state.agent_network.registry_stats().items():
+            st.markdown(f"**{agent_name}**：状态 {stats['status']}，熔断 {stats['opens']} 次，快速失败 {stats['rejected']} 次")
+        stats = fast_classifier.stats()
+        st.markdown(f"**快速意图**：阈值 {stats['threshold']}，请求 {stats['total']}，命中 {stats['hits']}，命中率 {stats['hit_rate']:.2%}")
+        stats = speculation_stats.stats()
+        st.markdown(f"**预测执行**：预测 {stats['attempts']}，命中 {stats['hits']}，准确率 {stats['accuracy']:.2%}，累计节省 {stats['saved_seconds']}s")
+        summary = metrics.summary()
+        for stage, stats in summary["stages"].items():
+            st.markdown(f"**LLM {stage}**：调用 {stats['count']}，p50 {stats['p50']}s，p95 {stats['p95']}s，"
+                        f"p99 {stats['p99']}s，平均token {stats['avg_prompt_tokens']}+{stats['avg_completion_tokens']}")
+        if summary["turns"]:
+            stats = summary["turns"]
+            st.markdown(f"**每轮**：p50 {stats['p50']}s，p95 {stats['p95']}s，平均token {stats['avg_tokens']}，"
+                        f"平均LLM调用 {stats['avg_llm_calls']} 次")
 
 # 页脚
 st.markdown("---")
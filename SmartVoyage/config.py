@@ -18,8 +18,112 @@ class Config:
         self.password = 'root'
         self.database = 'travel_rag'
 
+        # 代理配置
+        self.agent_urls = {
+            "WeatherQueryAssistant": "http://localhost:5005",  # 天气代理URL
+            "TicketQueryAssistant": "http://localhost:5006",  # 票务代理URL
+            "TicketOrderAssistant": "http://localhost:5007"  # 票务预定代理URL
+        }
+        # 代理服务的运行方式：async（FastAPI + uvicorn，任务在事件循环中异步处理）或 flask（python_a2a自带的Flask服务器，每个请求一个线程）
+        self.a2a_server_mode = 'async'
+        # 各代理的工作进程数（仅async模式）：大于1时预先fork多个进程共同监听同一端口，未列出的代理为1
+        self.a2a_workers = {"WeatherQueryAssistant": 1, "TicketQueryAssistant": 4, "TicketOrderAssistant": 1}
+        self.a2a_worker_shutdown_timeout = 30  # 退出时等待工作进程处理完进行中请求的最长时间（秒）
+        self.a2a_pool_size = 20  # 每个代理URL的最大长连接数
+        self.a2a_pool_idle_timeout = 60  # 连接池空闲回收时间（秒）
+
+        # 代理注册表配置（健康探测 + 熔断）
+        self.agent_card_ttl = 300  # 代理卡片缓存有效期（秒），过期后在后台重新拉取
+        self.agent_probe_interval = 10  # 健康探测间隔（秒）
+        self.agent_probe_timeout = 2  # 单次健康探测超时（秒）
+        self.circuit_failure_threshold = 3  # 连续失败多少次后熔断
+        self.circuit_reset_timeout = 30  # 熔断后多久允许一次试探请求（秒）
+
+        # 天气代理配置
+        # 查询方式：slots（本地解析或LLM只抽取城市和日期范围，执行固定的参数化查询）或 sql（LLM生成完整SQL）
+        self.weather_query_mode = 'slots'
+
+        # 票务代理配置
+        # LLM输出方式：structured（工具调用按JSON schema输出并校验）或 text（两行文本格式，手工解析）
+        self.ticket_output_mode = 'structured'
+        self.ticket_page_size = 10  # 每页返回的票务条数，更多结果通过翻页令牌获取
+        # 翻页令牌的签名密钥，由部署环境通过环境变量提供，没有默认值；未配置时各进程使用启动时随机生成的密钥，重启后旧令牌失效
+        self.page_token_secret = os.environ.get('SMARTVOYAGE_PAGE_TOKEN_SECRET', '')
+
+        # 票务索引配置：MCP票务服务把火车票/机票按 (出发城市, 到达城市, 日期) 加载到内存，线路查询不访问数据库
+        self.ticket_index_enabled = True  # 是否启用内存索引；关闭时线路查询走参数化SQL
+        self.ticket_index_refresh_interval = 10  # 增量刷新间隔（秒），只拉取新插入的记录
+        self.ticket_index_full_reload_interval = 600  # 全量重建间隔（秒），同步余票变化与删除
+        # 换乘查询配置：无直达时基于内存索引构建的换乘图搜索中转方案
+        self.transfer_max_legs = 3  # 最多乘坐的行程段数（2表示最多中转一次）
+        self.transfer_results = 5  # 返回的换乘方案数
+        self.transfer_min_connection = 30  # 同种交通工具之间的最短换乘时间（分钟）
+        self.transfer_mode_change_connection = 120  # 火车与飞机之间的最短换乘时间（分钟）
+        self.transfer_max_wait = 360  # 换乘最长等待时间（分钟）
+        self.transfer_max_expansions = 20000  # 单次搜索最多扩展的部分行程数
+
+        # SQL改写配置：MCP服务执行LLM生成的SQL前，把 DATE(col) 条件改写为可走索引的区间条件
+        self.sql_rewrite_enabled = True  # 是否启用SQL改写
+        self.sql_default_limit = 100  # 没有LIMIT的查询追加的默认LIMIT，0表示不追加
+        self.sql_explain_rewrites = False  # 是否对改写过的SQL执行EXPLAIN并记录改写前后的执行计划（额外两次查询，排查时开启）
+
+        # MCP客户端配置：代理通过会话池复用已初始化的MCP会话
+        self.mcp_urls = {
+            "ticket": "http://127.0.0.1:8001/mcp",  # 票务查询MCP服务
+            "weather": "http://127.0.0.1:8002/mcp",  # 天气查询MCP服务
+            "order": "http://127.0.0.1:8003/mcp"  # 票务预定MCP服务
+        }
+        # 各MCP服务的传输方式：http（连接上面的URL）或 local（在代理进程内构建MCP服务，通过内存流调用，适合同机部署）
+        self.mcp_transports = {"ticket": "http", "weather": "http", "order": "http"}
+        self.mcp_pool_size = 8  # 每个MCP服务的最大会话数，同时也是并发调用上限
+        self.mcp_db_workers = 8  # MCP服务执行数据库查询的工作线程数（每个线程一条连接），不小于mcp_pool_size时池中各会话的查询可以并行
+        self.mcp_connect_timeout = 5  # 建立会话（连接+初始化握手）与健康检查ping的超时（秒）
+        self.mcp_health_check_interval = 30  # 会话空闲超过该时间（秒），复用前先ping一次
+        self.mcp_pool_idle_timeout = 300  # 会话空闲超过该时间（秒）后关闭
+
+        # 实体解析配置：代理执行查询前把城市/艺人/场馆的简称、别名、拼音、错别字解析为数据库中的规范取值
+        self.entity_resolver_enabled = True  # 是否启用实体解析
+        self.entity_alias_file = os.path.join(project_root, 'SmartVoyage', 'data', 'entity_aliases.json')  # 别名文件
+
+        # 代理查询缓存配置：天气/票务代理对LLM生成的SQL（或抽取的槽位）按对话和日期缓存，零点过期
+        self.sql_cache_enabled = True  # 是否启用SQL生成结果缓存
+        self.sql_cache_size = 1024  # 每个代理缓存的最大条目数（LRU淘汰）
+
+        # 编排配置
+        self.branch_timeout = 30  # 多意图并发时，单个意图分支的超时时间（秒）
+        self.turn_deadline = 45  # 每轮对话的整体截止时间（秒），随A2A任务metadata传给各代理
+        self.agent_task_timeout = 30  # 代理处理单个任务的默认时间预算（秒），任务未携带截止时间时使用
+        self.deadline_margin = 0.5  # 代理在截止时间前预留的返回余量（秒）
+        self.intent_cache_enabled = True  # 是否启用意图识别结果缓存
+        self.intent_cache_size = 2048  # 意图识别缓存的最大条目数（LRU淘汰，Asia/Shanghai零点过期）
+        self.fast_intent_enabled = True  # 是否启用本地快速意图分类（关键词+实体词典+相对日期）
+        self.fast_intent_threshold = 0.8  # 快速意图分类的置信度阈值，低于阈值时回退到LLM
+        self.speculative_dispatch_enabled = False  # 是否启用预测执行：按关键词预测意图，与意图识别并发调用代理
+        # 各意图的结果总结方式：template（根据代理返回的结构化数据直接渲染）或 llm（大模型总结）
+        self.summarizer_modes = {"weather": "template", "flight": "template", "train": "template",
+                                 "concert": "template"}
+        self.render_ticket_limit = 10  # 模板渲染时最多展示的票务条数
+        self.batch_summarize_enabled = True  # 多个代理结果需要LLM总结时，是否合并为一次批量总结调用
+        self.turn_store_max_turns = 50  # 每个会话保留的最大轮次数（环形缓冲区容量）
+        self.history_token_budget = 600  # 提示词中对话历史的token预算
+        self.history_reply_max_chars = 120  # 历史中助手回复的最大保留字符数
+
+        # 编排服务配置（orchestrator/service.py）
+        self.service_host = '127.0.0.1'
+        self.service_port = 8000
+        self.service_max_sessions = 5000  # 同时保留的最大会话数，超出时淘汰最久未活跃的会话
+        self.service_session_idle_timeout = 1800  # 会话空闲超时时间（秒）
+
+        # 启动配置
+        self.startup_mode = 'lazy'  # lazy：LLM客户端、MCP等资源首次使用时再构建；eager：开始服务前预热全部资源
+        self.startup_profile = False  # 是否在启动完成时打印导入与冷启动耗时分析
+
         # 日志配置
         self.log_file = os.path.join(project_root, 'SmartVoyage', 'logs/app.log')
+        # LLM调用指标：每个进程把按阶段汇总的耗时分位数与token用量写入 metrics_dir/metrics_{进程名}.json
+        self.metrics_dir = os.path.join(project_root, 'SmartVoyage', 'logs')
+        self.metrics_max_samples = 1000  # 每个阶段保留的最近调用样本数
+        self.metrics_dump_interval = 5  # 指标文件的写出间隔（秒）：处理任务后延迟写出，期间的多次更新合并为一次
 
 
 if __name__ == '__main__':
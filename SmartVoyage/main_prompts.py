@@ -1,4 +1,4 @@
-from langchain_core.prompts import ChatPromptTemplate
+from SmartVoyage.utils.resources import lazy_import
 
 
 class SmartVoyagePrompts:
@@ -6,7 +6,7 @@ class SmartVoyagePrompts:
     # 定义意图识别提示模板
     @staticmethod
     def intent_prompt():
-        return ChatPromptTemplate.from_template(
+        return lazy_import("langchain_core.prompts").ChatPromptTemplate.from_template(
 """
 系统提示：您是一个专业的旅行意图识别专家，基于用户查询和对话历史，识别其意图，用于调用专门的agent server来执行；为方便后续的agent server处理，可以基于对话历史对用户查询进行改写，使问题更明确。严格遵守规则：
 - 支持意图：['weather' (天气查询), 'flight' (机票查询), 'train' (高铁/火车票查询), 'order' (票务预定), 'concert' (演唱会票查询), 'attraction' (景点推荐)] 或其组合（如 ['weather', 'flight']）。如果意图超出范围，返回意图 'out_of_scope'。
@@ -30,7 +30,7 @@ class SmartVoyagePrompts:
     # 定义天气结果总结提示模板，用于LLM总结天气查询的原始响应
     @staticmethod
     def summarize_weather_prompt():
-        return ChatPromptTemplate.from_template(
+        return lazy_import("langchain_core.prompts").ChatPromptTemplate.from_template(
 """
 系统提示：您是一位专业的天气预报员，以生动、准确的风格总结天气信息。基于查询和结果：
 - 核心描述点：城市、日期、温度范围、天气描述、湿度、风向、降水等。
@@ -46,7 +46,7 @@ class SmartVoyagePrompts:
     # 定义票务结果总结提示模板，用于LLM总结票务查询的原始响应
     @staticmethod
     def summarize_ticket_prompt():
-        return ChatPromptTemplate.from_template(
+        return lazy_import("langchain_core.prompts").ChatPromptTemplate.from_template(
 """
 系统提示：您是一位专业的旅行顾问，以热情、精确的风格总结票务信息。基于查询和结果：
 - 核心描述点：出发/到达、时间、类型、价格、剩余座位等。
@@ -58,12 +58,26 @@ class SmartVoyagePrompts:
 
 查询：{query}
 结果：{raw_response}
+""")
+
+    # 定义批量总结提示模板，用于一次LLM调用总结同一轮的多条代理结果
+    @staticmethod
+    def summarize_batch_prompt():
+        return lazy_import("langchain_core.prompts").ChatPromptTemplate.from_template(
+"""
+系统提示：您需要一次性总结多条查询结果，对每一条分别总结。规则：
+- 天气结果（type=weather）：以专业天气预报员的风格，描述城市、日期、温度范围、天气描述、湿度、风向、降水等；结果为空或者意思为需要补充数据，则委婉提示“未找到数据，请确认城市/日期”。
+- 票务结果（type=ticket）：以热情的旅行顾问风格，描述出发/到达、时间、类型、价格、剩余座位等；结果为空或者意思为需要补充数据，则委婉提示“未找到数据，请确认或修改条件”。
+- 每条总结只依据该条的查询和结果，不混入其他条目的信息；保持中文，100-150字。
+- 输出纯JSON对象，键为条目的id，值为该条的总结，不输出其他内容，例如：{{"weather": "根据最新数据，北京2025-07-31的天气预报为...", "flight": "为您推荐北京到上海的机票选项..."}}
+
+条目：{items}
 """)
 
     # 定义景点推荐提示模板，用于LLM直接生成景点推荐内容
     @staticmethod
     def attraction_prompt():
-        return ChatPromptTemplate.from_template(
+        return lazy_import("langchain_core.prompts").ChatPromptTemplate.from_template(
 """
 系统提示：您是一位旅行专家，基于用户查询生成景点推荐。规则：
 - 推荐3-5个景点，包含描述、理由、注意事项。
@@ -72,6 +86,20 @@ class SmartVoyagePrompts:
 - 备注：内容生成，仅供参考。
 - 保持中文，150-250字。
 
+查询：{query}
+""")
+
+    @staticmethod
+    def fallback_prompt():
+        return lazy_import("langchain_core.prompts").ChatPromptTemplate.from_template(
+"""
+系统提示：您是一位旅行助手。{service}暂时不可用，无法获取实时数据。基于用户查询生成降级回复。规则：
+- 开头说明实时数据暂不可用，请稍后重试。
+- 基于常识给出简要参考，如当地该季节的气候特点、常见出行方式与购票建议。
+- 不得编造具体的温度、车次、航班、票价或余票。
+- 备注：非实时数据，仅供参考。
+- 保持中文，80-150字。
+
 查询：{query}
 """)
 
@@ -0,0 +1,32 @@
+import threading
+
+import anyio
+
+from SmartVoyage.config import Config
+
+conf = Config()
+
+
+# 数据库工作线程：MCP工具中的mysql查询是阻塞调用，放到工作线程中执行，不阻塞事件循环
+# （进程内传输时MCP服务运行在代理自身的事件循环中，一次慢查询会卡住代理正在处理的所有任务）
+# mysql连接不能在线程间并发使用，每个工作线程各用一条连接
+class DbWorkers:
+    def __init__(self, connect, size=None):
+        self.connect = connect
+        self._local = threading.local()
+        self._limiter = anyio.CapacityLimiter(size or conf.mcp_db_workers)
+
+    # 当前线程的数据库连接，首次使用时建立
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self.connect()
+        return conn
+
+    async def run(self, fn, *args):
+        '''
+        在工作线程中执行 fn(*args)，并发数不超过工作线程数
+        :return: fn的返回值
+        '''
+        return await anyio.to_thread.run_sync(fn, *args, limiter=self._limiter)
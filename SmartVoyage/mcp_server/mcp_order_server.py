@@ -63,6 +63,11 @@ def order_concert(start_date: str, aritist: str, venue: str, seat_type: str, num
     return "恭喜，演出票预定成功！"
 
 
+# 票务预定MCP服务器的工具在模块导入时注册，代理进程内调用（mcp_transports为local时）直接复用该实例
+def build_order_mcp():
+    return order_mcp
+
+
 # 创建票务预定MCP服务器
 def create_order_mcp_server():
     # 打印服务器信息
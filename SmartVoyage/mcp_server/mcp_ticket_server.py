@@ -2,31 +2,59 @@ import mysql.connector
 import json
 from datetime import date, datetime, timedelta
 from decimal import Decimal
+from typing import Optional
 from mcp.server.fastmcp import FastMCP
 
 from SmartVoyage.config import Config
 from SmartVoyage.create_logger import logger
+from SmartVoyage.mcp_server.db_workers import DbWorkers
+from SmartVoyage.mcp_server.ticket_index import TICKET_TABLES, TicketIndex
 from SmartVoyage.utils.format import DateEncoder, default_encoder
+from SmartVoyage.utils.paging import PAGE_ORDERS, page_rows
+from SmartVoyage.utils.sql_rewrite import log_rewrite_plan, rewrite_sql
 
 conf = Config()
 
+NO_DATA = {"status": "no_data", "message": "未找到票务数据，请确认查询条件。"}
+
+
+# 建立数据库连接
+def connect_db():
+    return mysql.connector.connect(
+        host=conf.host,
+        user=conf.user,
+        password=conf.password,
+        database=conf.database
+    )
+
 
 # 票务服务类
 class TicketService:  # 定义票务服务类，封装数据库操作逻辑
-    def __init__(self):  # 初始化方法，建立数据库连接
-        # 连接数据库
-        self.conn = mysql.connector.connect(
-            host=conf.host,
-            user=conf.user,
-            password=conf.password,
-            database=conf.database
-        )
-
-    # 定义执行SQL查询方法，输入SQL字符串，返回JSON字符串
-    def execute_query(self, sql: str) -> str:
+    def __init__(self):  # 初始化方法
+        # 数据库查询在工作线程中执行，每个工作线程首次查询时建立自己的连接
+        self.db = DbWorkers(connect_db)
+        # 线路内存索引，启用时在后台线程中定期刷新
+        self.index = None
+        if conf.ticket_index_enabled:
+            self.index = TicketIndex(connect_db)
+            self.index.start()
+
+    # 当前线程的数据库连接
+    @property
+    def conn(self):
+        return self.db.conn
+
+    # 定义执行SQL查询方法，输入SQL字符串（可带参数），返回JSON字符串
+    def execute_query(self, sql: str, params=None) -> str:
         try:
-            cursor = self.conn.cursor(dictionary=True)
-            cursor.execute(sql)
+            # LLM生成的SQL（不带参数）先改写为可走索引的形式
+            if params is None and conf.sql_rewrite_enabled:
+                rewritten = rewrite_sql(sql, conf.sql_default_limit)
+                if rewritten != sql and conf.sql_explain_rewrites:
+                    log_rewrite_plan(self.conn, sql, rewritten)
+                sql = rewritten
+            cursor = self.conn.cursor(dictionary=True, prepared=params is not None)
+            cursor.execute(sql, params)
             results = cursor.fetchall()
             cursor.close()
             # 格式化结果
@@ -35,17 +63,82 @@ class TicketService:  # 定义票务服务类，封装数据库操作逻辑
                     if isinstance(value, (date, datetime, timedelta, Decimal)):  # 检查值是否为特殊类型
                         result[key] = default_encoder(value)  # 使用自定义编码器格式化该值
             # 序列化为JSON，如果有结果返回success，否则no_data；使用DateEncoder，非ASCII不转义
-            return json.dumps({"status": "success", "data": results} if results else {"status": "no_data",
-                                                                                      "message": "未找到票务数据，请确认查询条件。"},
+            return json.dumps({"status": "success", "data": results} if results else NO_DATA,
                               cls=DateEncoder, ensure_ascii=False)
         except Exception as e:
             logger.error(f"票务查询错误: {str(e)}")
             # 返回错误JSON响应
             return json.dumps({"status": "error", "message": str(e)}, ensure_ascii=False)
 
+    def search_routes(self, kind, departure_city, arrival_city, start_date, end_date=None, seat=None, number=None,
+                      order=None, after=None, limit=None):
+        '''
+        按线路和日期查询火车票/机票：索引就绪时直接查内存索引，否则走按出发时间范围过滤的参数化SQL
+        :param kind: 票种 train/flight
+        :param start_date: 开始日期 date
+        :param end_date: 结束日期 date，为None时只查开始日期当天
+        :param seat: 座位类型/舱位，为None时不过滤
+        :param number: 车次/航班号，为None时不过滤
+        :param order: 分页排序方式 time/price，为None时返回全部结果
+        :param after: 上一页最后一条的排序键（翻页游标）
+        :param limit: 每页条数
+        :return: JSON字符串，格式与execute_query相同；分页时另有total（游标之后的总条数）和next（下一页游标）
+        '''
+        if self.index is not None and self.index.ready:
+            results = self.index.search(kind, departure_city, arrival_city, start_date, end_date, seat, number)
+        else:
+            table, number_column, seat_column = TICKET_TABLES[kind]
+            sql = (f"SELECT id, departure_city, arrival_city, departure_time, arrival_time, {number_column}, "
+                   f"{seat_column}, price, remaining_seats FROM {table} "
+                   f"WHERE departure_city = %s AND arrival_city = %s AND departure_time >= %s AND departure_time < %s")
+            params = [departure_city, arrival_city, start_date.isoformat(),
+                      ((end_date or start_date) + timedelta(days=1)).isoformat()]
+            if seat:
+                sql += f" AND {seat_column} = %s"
+                params.append(seat)
+            if number:
+                sql += f" AND {number_column} = %s"
+                params.append(number)
+            response = json.loads(self.execute_query(sql + " ORDER BY departure_time", tuple(params)))
+            if response["status"] != "success":
+                return json.dumps(response, ensure_ascii=False)
+            results = response["data"]
+        if not results:
+            return json.dumps(NO_DATA, ensure_ascii=False)
+        if order is None:
+            return json.dumps({"status": "success", "data": results}, ensure_ascii=False)
+        page, total, next_after = page_rows(results, order, after, limit)
+        if not page:
+            return json.dumps({"status": "no_data", "message": "没有更多结果了。"}, ensure_ascii=False)
+        return json.dumps({"status": "success", "data": page, "total": total, "next": next_after}, ensure_ascii=False)
 
-# 创建票务MCP服务器
-def create_ticket_mcp_server():
+    def search_transfers(self, departure_city, arrival_city, start_date, objective="arrival", max_legs=None):
+        '''
+        在内存索引构建的换乘图上搜索中转方案（火车、飞机可混合）
+        :return: JSON字符串，data为方案列表，每个方案包含各行程段、总价、出发/到达时间、全程耗时和换乘次数
+        '''
+        if self.index is None or not self.index.ready:
+            return json.dumps({"status": "error", "message": "换乘查询需要启用票务索引（ticket_index_enabled）"},
+                              ensure_ascii=False)
+        plans = []
+        for legs in self.index.search_transfers(departure_city, arrival_city, start_date, objective=objective,
+                                                max_legs=max_legs):
+            plans.append({
+                "legs": [leg.to_dict() for leg in legs],
+                "total_price": round(sum(leg.price for leg in legs), 2),
+                "departure_time": legs[0].row.departure_time,
+                "arrival_time": legs[-1].row.arrival_time,
+                "duration_minutes": int((legs[-1].arrival_ts - legs[0].departure_ts) // 60),
+                "transfers": len(legs) - 1,
+            })
+        if not plans:
+            return json.dumps({"status": "no_data", "message": "未找到可行的换乘方案，请尝试其他日期。"},
+                              ensure_ascii=False)
+        return json.dumps({"status": "success", "data": plans}, ensure_ascii=False)
+
+
+# 构建票务MCP服务器（注册工具），独立部署与代理进程内调用（mcp_transports为local时）共用同一份工具定义
+def build_ticket_mcp():
     # 创建FastMCP实例
     ticket_mcp = FastMCP(name="TicketTools",
                          instructions="票务查询工具，基于 train_tickets, flight_tickets, concert_tickets 表。只支持查询。",
@@ -59,14 +152,61 @@ def create_ticket_mcp_server():
         name="query_tickets",
         description="查询票务数据，输入 SQL，如 'SELECT * FROM train_tickets WHERE departure_city = \"北京\" AND arrival_city = \"上海\"'"
     )
-    def query_tickets(sql: str) -> str:
+    async def query_tickets(sql: str) -> str:
         logger.info(f"执行票务查询: {sql}")
-        return service.execute_query(sql)
+        return await service.db.run(service.execute_query, sql)
+
+    @ticket_mcp.tool(
+        name="search_tickets",
+        description="按线路和日期查询火车票或机票，不需要SQL。type 为 train 或 flight，date/end_date 格式 YYYY-MM-DD"
+                    "（end_date为空时只查date当天），seat_type 为座位类型或舱位，number 为车次或航班号，可为空；"
+                    "order 为 time 或 price 时按该顺序分页返回 limit 条，after 为上一页返回的 next 游标"
+    )
+    async def search_tickets(type: str, departure_city: str, arrival_city: str, date: str, end_date: str = "",
+                             seat_type: str = "", number: str = "", order: str = "", after: Optional[list] = None,
+                             limit: int = 0) -> str:
+        logger.info(f"线路查询: {type} {departure_city}->{arrival_city} {date}~{end_date} {seat_type} {number}")
+        if type not in TICKET_TABLES:
+            return json.dumps({"status": "error", "message": f"不支持的票种: {type}"}, ensure_ascii=False)
+        try:
+            start = datetime.strptime(date, "%Y-%m-%d").date()
+            end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+        except ValueError as e:
+            return json.dumps({"status": "error", "message": f"日期格式错误: {e}"}, ensure_ascii=False)
+        if order and order not in PAGE_ORDERS:
+            return json.dumps({"status": "error", "message": f"不支持的排序方式: {order}"}, ensure_ascii=False)
+        # 索引未就绪时回退到SQL查询，同样放到工作线程中执行
+        return await service.db.run(service.search_routes, type, departure_city, arrival_city, start, end,
+                                    seat_type or None, number or None, order or None, after, limit or None)
+
+    @ticket_mcp.tool(
+        name="search_transfers",
+        description="无直达时查询中转方案（火车、飞机可混合换乘）。date 格式 YYYY-MM-DD，为首段出发日期；"
+                    "objective 为 arrival（最早到达）或 price（最低总价）；max_legs 为最多乘坐段数，0 表示使用默认值"
+    )
+    async def search_transfers(departure_city: str, arrival_city: str, date: str, objective: str = "arrival",
+                               max_legs: int = 0) -> str:
+        logger.info(f"换乘查询: {departure_city}->{arrival_city} {date} {objective} {max_legs}")
+        if objective not in ("arrival", "price"):
+            return json.dumps({"status": "error", "message": f"不支持的排序目标: {objective}"}, ensure_ascii=False)
+        try:
+            start = datetime.strptime(date, "%Y-%m-%d").date()
+        except ValueError as e:
+            return json.dumps({"status": "error", "message": f"日期格式错误: {e}"}, ensure_ascii=False)
+        # 换乘搜索只查内存索引，但扩展的部分行程较多时耗时可达数十毫秒，同样不占用事件循环
+        return await service.db.run(service.search_transfers, departure_city, arrival_city, start, objective,
+                                    max_legs or None)
 
     # 打印服务器信息
     logger.info("=== 票务MCP服务器信息 ===")
     logger.info(f"名称: {ticket_mcp.name}")
     logger.info(f"描述: {ticket_mcp.instructions}")
+    return ticket_mcp
+
+
+# 创建并启动票务MCP服务器
+def create_ticket_mcp_server():
+    ticket_mcp = build_ticket_mcp()
 
     # 运行服务器
     try:
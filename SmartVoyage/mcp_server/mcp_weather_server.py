@@ -6,27 +6,50 @@ from mcp.server.fastmcp import FastMCP
 
 from SmartVoyage.config import Config
 from SmartVoyage.create_logger import logger
+from SmartVoyage.mcp_server.db_workers import DbWorkers
 from SmartVoyage.utils.format import DateEncoder, default_encoder
+from SmartVoyage.utils.sql_rewrite import log_rewrite_plan, rewrite_sql
 
 conf = Config()
 
+# 固定的天气范围查询语句：参数化执行（prepared statement），城市与日期作为参数传入，不拼接SQL
+WEATHER_RANGE_SQL = ("SELECT city, fx_date, temp_max, temp_min, text_day, text_night, humidity, wind_dir_day, precip "
+                     "FROM weather_data WHERE city = %s AND fx_date BETWEEN %s AND %s ORDER BY fx_date")
+
+
+# 建立数据库连接
+def connect_db():
+    return mysql.connector.connect(
+        host=conf.host,
+        user=conf.user,
+        password=conf.password,
+        database=conf.database
+    )
+
+
 # 天气服务类
 class WeatherService:  # 定义天气服务类，封装数据库操作逻辑
     def __init__(self):
-        # 连接数据库
-        self.conn = mysql.connector.connect(
-            host=conf.host,
-            user=conf.user,
-            password=conf.password,
-            database=conf.database
-        )
-
-    # 具体的查询方法：输出一个SQL字符串，输入一个格式化的json字符串
-    def execute_query(self, sql: str) -> str:
+        # 数据库查询在工作线程中执行，每个工作线程首次查询时建立自己的连接
+        self.db = DbWorkers(connect_db)
+
+    # 当前线程的数据库连接
+    @property
+    def conn(self):
+        return self.db.conn
+
+    # 具体的查询方法：输出一个SQL字符串，输入一个格式化的json字符串；传入params时按预编译语句执行
+    def execute_query(self, sql: str, params=None) -> str:
         try:
+            # LLM生成的SQL（不带参数）先改写为可走索引的形式
+            if params is None and conf.sql_rewrite_enabled:
+                rewritten = rewrite_sql(sql, conf.sql_default_limit)
+                if rewritten != sql and conf.sql_explain_rewrites:
+                    log_rewrite_plan(self.conn, sql, rewritten)
+                sql = rewritten
             # 执行sql，获取数据
-            cursor = self.conn.cursor(dictionary=True)
-            cursor.execute(sql)
+            cursor = self.conn.cursor(dictionary=True, prepared=params is not None)
+            cursor.execute(sql, params)
             results = cursor.fetchall()
             cursor.close()
 
@@ -46,9 +69,13 @@ class WeatherService:  # 定义天气服务类，封装数据库操作逻辑
             # 返回错误JSON响应
             return json.dumps({"status": "error", "message": str(e)}, ensure_ascii=False)
 
+    # 按城市和日期范围查询天气，使用固定的参数化语句
+    def query_by_range(self, city: str, start_date: str, end_date: str) -> str:
+        return self.execute_query(WEATHER_RANGE_SQL, (city, start_date, end_date))
 
-# 创建天气MCP服务器
-def create_weather_mcp_server():
+
+# 构建天气MCP服务器（注册工具），独立部署与代理进程内调用（mcp_transports为local时）共用同一份工具定义
+def build_weather_mcp():
     # 创建FastMCP实例
     weather_mcp = FastMCP(name="WeatherTools",
                           instructions="天气查询工具，基于 weather_data 表。",
@@ -62,14 +89,28 @@ def create_weather_mcp_server():
         name="query_weather",
         description="查询天气数据，输入 SQL，如 'SELECT * FROM weather_data WHERE city = \"上海\" AND fx_date = \"2025-12-24\"'"
     )
-    def query_weather(sql: str) -> str:
+    async def query_weather(sql: str) -> str:
         logger.info(f"执行天气查询: {sql}")
-        return service.execute_query(sql)
+        return await service.db.run(service.execute_query, sql)
+
+    @weather_mcp.tool(
+        name="query_weather_range",
+        description="按城市和日期范围查询天气数据，日期格式为 YYYY-MM-DD，单日查询时开始日期与结束日期相同"
+    )
+    async def query_weather_range(city: str, start_date: str, end_date: str) -> str:
+        logger.info(f"执行天气范围查询: {city} {start_date}~{end_date}")
+        return await service.db.run(service.query_by_range, city, start_date, end_date)
 
     # 打印服务器信息
     logger.info("=== 天气MCP服务器信息 ===")
     logger.info(f"名称: {weather_mcp.name}")
     logger.info(f"描述: {weather_mcp.instructions}")
+    return weather_mcp
+
+
+# 创建并启动天气MCP服务器
+def create_weather_mcp_server():
+    weather_mcp = build_weather_mcp()
 
     # 运行服务器
     try:
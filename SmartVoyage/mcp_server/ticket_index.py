@@ -0,0 +1,308 @@
+import bisect
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+
+from SmartVoyage.config import Config
+from SmartVoyage.create_logger import logger
+
+conf = Config()
+
+# 各票种的表名与列名差异：车次/航班号列、座位类型/舱位列
+TICKET_TABLES = {
+    "train": ("train_tickets", "train_number", "seat_type"),
+    "flight": ("flight_tickets", "flight_number", "cabin_type"),
+}
+
+
+# 一条紧凑的票务记录：只保留查询返回的字段，时间保存为格式化后的字符串，可直接按字典序排序
+class TicketRow:
+    __slots__ = ("id", "departure_city", "arrival_city", "departure_time", "arrival_time", "number", "seat",
+                 "price", "remaining_seats")
+
+    def __init__(self, id, departure_city, arrival_city, departure_time, arrival_time, number, seat, price,
+                 remaining_seats):
+        self.id = id
+        self.departure_city = departure_city
+        self.arrival_city = arrival_city
+        self.departure_time = departure_time.strftime('%Y-%m-%d %H:%M:%S')
+        self.arrival_time = arrival_time.strftime('%Y-%m-%d %H:%M:%S')
+        self.number = number
+        self.seat = seat
+        self.price = float(price)
+        self.remaining_seats = remaining_seats
+
+    # 还原为与SQL查询结果相同的字段名，票务代理的渲染逻辑无需区分数据来源
+    def to_dict(self, number_column, seat_column):
+        return {"id": self.id, "departure_city": self.departure_city, "arrival_city": self.arrival_city,
+                "departure_time": self.departure_time, "arrival_time": self.arrival_time,
+                number_column: self.number, seat_column: self.seat, "price": self.price,
+                "remaining_seats": self.remaining_seats}
+
+
+# 单张票务表的线路索引：(出发城市, 到达城市, 日期) -> 按出发时间排序的记录列表
+class RouteIndex:
+    def __init__(self, kind):
+        self.kind = kind
+        self.table, self.number_column, self.seat_column = TICKET_TABLES[kind]
+        self.routes = {}
+        self.last_id = 0  # 已加载的最大id，增量刷新只拉取更新的记录
+        self.size = 0
+        self.loaded_at = 0.0  # 上次全量加载时间
+
+    def _select(self, conn, where, params):
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT id, departure_city, arrival_city, departure_time, arrival_time, {self.number_column}, "
+                       f"{self.seat_column}, price, remaining_seats FROM {self.table} {where} ORDER BY id", params)
+        rows = [TicketRow(*row) for row in cursor.fetchall()]
+        cursor.close()
+        return rows
+
+    @staticmethod
+    def _add(routes, row):
+        key = (row.departure_city, row.arrival_city, row.departure_time[:10])
+        bisect.insort(routes.setdefault(key, []), row, key=lambda r: r.departure_time)
+
+    # 全量加载：构建新索引后整体替换，查询方始终看到完整的一份索引；余票变化与删除只在全量加载时同步
+    def load(self, conn):
+        rows = self._select(conn, "", ())
+        routes = {}
+        for row in rows:
+            self._add(routes, row)
+        self.routes = routes
+        self.last_id = max((row.id for row in rows), default=0)
+        self.size = len(rows)
+        self.loaded_at = time.monotonic()
+        return len(rows)
+
+    # 增量刷新：只拉取 id 大于 last_id 的新记录（按自增id与created_at单调递增插入），插入到对应线路的有序列表
+    def refresh(self, conn):
+        rows = self._select(conn, "WHERE id > %s", (self.last_id,))
+        if not rows:
+            return 0
+        routes = {key: list(value) for key, value in self.routes.items()}
+        for row in rows:
+            self._add(routes, row)
+        self.routes = routes
+        self.last_id = rows[-1].id
+        self.size += len(rows)
+        return len(rows)
+
+    def search(self, departure_city, arrival_city, start_date, end_date=None, seat=None, number=None):
+        '''
+        按线路和日期范围查询
+        :param start_date: 开始日期 date
+        :param end_date: 结束日期 date，为None时只查开始日期当天
+        :param seat: 座位类型/舱位，为None时不过滤
+        :param number: 车次/航班号，为None时不过滤
+        :return: 与SQL查询结果字段相同的字典列表，按出发时间排序
+        '''
+        routes = self.routes
+        result = []
+        day = start_date
+        while day <= (end_date or start_date):
+            for row in routes.get((departure_city, arrival_city, day.isoformat()), ()):
+                if (seat is None or row.seat == seat) and (number is None or row.number == number):
+                    result.append(row.to_dict(self.number_column, self.seat_column))
+            day += timedelta(days=1)
+        return result
+
+
+# 换乘图中的一段行程：同一车次/航班同一出发时间的多个座位类型合并为一段，取有余票的最低价
+class Leg:
+    __slots__ = ("kind", "row", "departure_city", "arrival_city", "departure_ts", "arrival_ts", "price")
+
+    def __init__(self, kind, row):
+        self.kind = kind
+        self.row = row
+        self.departure_city = row.departure_city
+        self.arrival_city = row.arrival_city
+        self.departure_ts = datetime.fromisoformat(row.departure_time).timestamp()
+        self.arrival_ts = datetime.fromisoformat(row.arrival_time).timestamp()
+        self.price = row.price
+
+    def to_dict(self):
+        number_column, seat_column = TICKET_TABLES[self.kind][1:]
+        return dict(self.row.to_dict(number_column, seat_column), type=self.kind)
+
+
+# 时间展开的换乘图：出发城市 -> 按出发时间排序的行程段，换乘时二分查找满足最短换乘时间、最长等待时间的后续行程段
+class TransferGraph:
+    def __init__(self, indexes):
+        best = {}  # (票种, 车次/航班号, 出发时间) -> 有余票的最低价座位
+        for kind, index in indexes.items():
+            for rows in index.routes.values():
+                for row in rows:
+                    if row.remaining_seats <= 0:
+                        continue
+                    key = (kind, row.number, row.departure_time)
+                    if key not in best or row.price < best[key].price:
+                        best[key] = row
+        adjacency, direct = {}, {}
+        for (kind, _, _), row in best.items():
+            leg = Leg(kind, row)
+            adjacency.setdefault(row.departure_city, []).append(leg)
+            direct.setdefault((row.departure_city, row.arrival_city), []).append(leg)
+        # 出发城市 -> (出发时间戳列表, 行程段列表)；(出发城市, 到达城市) -> 同样结构，用于最后一段只看直达终点的行程段
+        self.adjacency = self._sorted(adjacency)
+        self.direct = self._sorted(direct)
+        self.size = len(best)
+
+    @staticmethod
+    def _sorted(groups):
+        result = {}
+        for key, legs in groups.items():
+            legs.sort(key=lambda leg: leg.departure_ts)
+            result[key] = ([leg.departure_ts for leg in legs], legs)
+        return result
+
+    def _departures(self, key, earliest, latest, table=None):
+        times, legs = (self.adjacency if table is None else table).get(key, ((), ()))
+        start = bisect.bisect_left(times, earliest)
+        end = bisect.bisect_right(times, latest, lo=start)
+        return legs[start:end]
+
+    def search(self, origin, destination, start_date, objective="arrival", max_legs=None, k=None,
+               min_connection=None, mode_change_connection=None, max_wait=None, max_expansions=None):
+        '''
+        有界的k最短路搜索：按目标（最早到达或最低总价）从小到大扩展部分行程，每个行程段最多被扩展k次，
+        依次得到的完整行程即为代价最小的k个方案
+        :param start_date: 出发日期 date，首段行程在当天出发
+        :param objective: arrival（最早到达，同时刻按总价）或 price（最低总价，同价按到达时间）
+        :param max_legs: 最多乘坐的行程段数
+        :param k: 返回的方案数
+        :param min_connection: 同种交通工具之间的最短换乘时间（分钟）
+        :param mode_change_connection: 火车与飞机之间的最短换乘时间（分钟）
+        :param max_wait: 换乘最长等待时间（分钟）
+        :param max_expansions: 最多扩展的部分行程数，防止稀疏线路上的搜索失控
+        :return: 方案列表，每个方案为行程段列表
+        '''
+        max_legs = max_legs or conf.transfer_max_legs
+        k = k or conf.transfer_results
+        min_connection = (min_connection or conf.transfer_min_connection) * 60
+        mode_change_connection = (mode_change_connection or conf.transfer_mode_change_connection) * 60
+        max_wait = (max_wait or conf.transfer_max_wait) * 60
+        max_expansions = max_expansions or conf.transfer_max_expansions
+
+        def cost(legs, price):
+            if objective == "price":
+                return price, legs[-1].arrival_ts
+            return legs[-1].arrival_ts, price
+
+        day_start = datetime.combine(start_date, datetime.min.time()).timestamp()
+        heap = []
+        counter = 0  # 代价相同时按入队顺序出队，避免比较行程段对象
+        for leg in self._departures(origin, day_start, day_start + 86400 - 1):
+            if leg.arrival_city != origin:
+                heapq.heappush(heap, (cost([leg], leg.price), counter, (leg,), leg.price))
+                counter += 1
+
+        plans = []
+        expanded = {}  # 行程段 -> 已被扩展的次数
+        expansions = 0
+        while heap and len(plans) < k and expansions < max_expansions:
+            _, _, legs, price = heapq.heappop(heap)
+            last = legs[-1]
+            if last.arrival_city == destination:
+                plans.append(list(legs))
+                continue
+            if len(legs) >= max_legs or expanded.get(id(last), 0) >= k:
+                continue
+            expanded[id(last)] = expanded.get(id(last), 0) + 1
+            expansions += 1
+            visited = {leg.departure_city for leg in legs}
+            # 只剩最后一段时，只需要看直达终点的行程段
+            if len(legs) == max_legs - 1:
+                candidates = self._departures((last.arrival_city, destination), last.arrival_ts + min_connection,
+                                              last.arrival_ts + max_wait, self.direct)
+            else:
+                candidates = self._departures(last.arrival_city, last.arrival_ts + min_connection,
+                                              last.arrival_ts + max_wait)
+            for leg in candidates:
+                if leg.arrival_city in visited:
+                    continue
+                if leg.kind != last.kind and leg.departure_ts < last.arrival_ts + mode_change_connection:
+                    continue
+                next_legs = legs + (leg,)
+                heapq.heappush(heap, (cost(next_legs, price + leg.price), counter, next_legs, price + leg.price))
+                counter += 1
+        return plans
+
+
+# 火车票与机票的内存索引：后台线程定期增量刷新，定期全量重建
+class TicketIndex:
+    def __init__(self, connect):
+        self.connect = connect  # 创建数据库连接的函数，索引刷新使用独立连接
+        self.indexes = {kind: RouteIndex(kind) for kind in TICKET_TABLES}
+        self.graph = TransferGraph(self.indexes)  # 换乘图，索引有变化时整体重建后替换
+        self.ready = False
+        self._thread = None
+        self._stop = threading.Event()
+        # 索引统计：查询次数、累计查询耗时、增量刷新新增条数
+        self.stats = {"searches": 0, "search_seconds": 0.0, "refreshed_rows": 0}
+
+    def load(self):
+        conn = self.connect()
+        try:
+            for index in self.indexes.values():
+                count = index.load(conn)
+                logger.info(f"票务索引加载完成：{index.table} {count} 条")
+        finally:
+            conn.close()
+        self.graph = TransferGraph(self.indexes)
+        self.ready = True
+
+    def refresh(self, full=False):
+        conn = self.connect()
+        changed = 0
+        try:
+            for index in self.indexes.values():
+                if full:
+                    changed += index.load(conn)
+                else:
+                    added = index.refresh(conn)
+                    self.stats["refreshed_rows"] += added
+                    changed += added
+        finally:
+            conn.close()
+        if changed:
+            self.graph = TransferGraph(self.indexes)
+
+    def _refresh_loop(self):
+        while not self._stop.wait(conf.ticket_index_refresh_interval):
+            try:
+                full = any(time.monotonic() - index.loaded_at > conf.ticket_index_full_reload_interval
+                           for index in self.indexes.values())
+                self.refresh(full=full)
+            except Exception as e:
+                logger.error(f"票务索引刷新失败: {e}")
+
+    def start(self):
+        self.load()
+        self._thread = threading.Thread(target=self._refresh_loop, name="ticket-index-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def search(self, kind, departure_city, arrival_city, start_date, end_date=None, seat=None, number=None):
+        started = time.perf_counter()
+        rows = self.indexes[kind].search(departure_city, arrival_city, start_date, end_date, seat, number)
+        self.stats["searches"] += 1
+        self.stats["search_seconds"] += time.perf_counter() - started
+        return rows
+
+    def search_transfers(self, origin, destination, start_date, **options):
+        started = time.perf_counter()
+        plans = self.graph.search(origin, destination, start_date, **options)
+        logger.info(f"换乘查询 {origin}->{destination} {start_date}：{len(plans)} 个方案，"
+                    f"耗时 {(time.perf_counter() - started) * 1000:.2f}ms")
+        return plans
+
+    def index_stats(self):
+        searches = self.stats["searches"]
+        return {"ready": self.ready, "rows": {kind: index.size for kind, index in self.indexes.items()},
+                "transfer_legs": self.graph.size,
+                "searches": searches, "refreshed_rows": self.stats["refreshed_rows"],
+                "avg_search_us": round(self.stats["search_seconds"] / searches * 1e6, 2) if searches else 0.0}
@@ -0,0 +1,284 @@
+import asyncio
+import json
+import re
+import uuid
+
+from SmartVoyage.config import Config
+from SmartVoyage.create_logger import logger
+from SmartVoyage.main_prompts import SmartVoyagePrompts
+from SmartVoyage.orchestrator.registry import AgentRegistry
+from SmartVoyage.orchestrator.renderer import extract_data_part, render_agent_result
+from SmartVoyage.utils.deadline import DEADLINE_KEY, expired, remaining_budget
+from SmartVoyage.utils.metrics import llm_config
+from SmartVoyage.utils.paging import PAGE_TOKEN_KEY
+from SmartVoyage.utils.resources import lazy_import_async
+
+conf = Config()
+
+# 意图到代理名称的映射
+INTENT_AGENT_MAP = {
+    "weather": "WeatherQueryAssistant",
+    "flight": "TicketQueryAssistant",
+    "train": "TicketQueryAssistant",
+    "concert": "TicketQueryAssistant",
+    "order": "TicketOrderAssistant",
+}
+
+# 需要LLM总结结果的代理及其结果类型
+SUMMARY_TYPES = {"WeatherQueryAssistant": "weather", "TicketQueryAssistant": "ticket"}
+
+# 分页返回结果的代理：结果任务的metadata中带有下一页的翻页令牌
+PAGED_AGENTS = {"TicketQueryAssistant"}
+
+# 代理不可用时降级回复中的服务名称
+AGENT_SERVICE_NAMES = {
+    "WeatherQueryAssistant": "天气查询服务",
+    "TicketQueryAssistant": "票务查询服务",
+    "TicketOrderAssistant": "票务预定服务",
+}
+
+
+# 景点推荐分支：直接使用LLM生成
+async def attraction_branch(prompt, llm):
+    chain = SmartVoyagePrompts.attraction_prompt() | llm
+    rec_response = await chain.ainvoke({"query": prompt}, config=llm_config("attraction"))
+    return rec_response.content.strip()
+
+
+# 降级分支：代理熔断或连接失败时，查询类意图由LLM给出非实时的参考回复，预定类意图直接失败
+async def degraded_branch(agent_name, query_str, llm):
+    service = AGENT_SERVICE_NAMES.get(agent_name, agent_name)
+    if agent_name == "TicketOrderAssistant":
+        return f"{service}暂时不可用，请稍后重试。"
+    chain = SmartVoyagePrompts.fallback_prompt() | llm
+    fallback_response = await chain.ainvoke({"service": service, "query": query_str}, config=llm_config("fallback"))
+    return fallback_response.content.strip()
+
+
+# 待总结的代理结果：需要LLM总结时由 fetch_agent_result 返回，可单独总结，也可与同轮其他结果批量总结
+class PendingSummary:
+    __slots__ = ("intent", "agent_name", "query", "raw")
+
+    def __init__(self, intent, agent_name, query, raw):
+        self.intent = intent
+        self.agent_name = agent_name
+        self.query = query
+        self.raw = raw
+
+
+# 调用代理并处理结果：能直接回复时返回文本，需要LLM总结时返回PendingSummary
+# page_token 随任务发给代理（翻页或按当前页订票）；on_page(intent, 本页令牌, 下一页令牌) 记录分页代理返回的一页
+async def fetch_agent_result(intent, agent_name, query_str, chat_history, llm, agent_network, deadline=None,
+                             page_token=None, on_page=None):
+    logger.info(f"{agent_name} 查询：{query_str}")
+    if expired(deadline):
+        return f"{intent} 查询超时，请稍后重试。"
+    # python_a2a导入较慢，首次调用代理时在工作线程中导入（通常已由启动时的后台预导入完成）
+    a2a = await lazy_import_async("python_a2a")
+    registry = agent_network if isinstance(agent_network, AgentRegistry) else None
+    # 1）熔断检查：代理已熔断时不再等待连接超时，直接降级
+    if registry is not None and not registry.allow(agent_name):
+        logger.warning(f"{agent_name} 已熔断，降级处理")
+        return await degraded_branch(agent_name, query_str, llm)
+    # 2）获取代理实例
+    agent = agent_network.get_agent(agent_name)
+    # 3）构建历史对话信息+新查询，然后调用代理
+    message = a2a.Message(content=a2a.TextContent(text=chat_history + f'\nUser: {query_str}'),
+                          role=a2a.MessageRole.USER)
+    # 本轮截止时间随任务metadata传给代理，代理据此控制自身的LLM与MCP调用
+    metadata = {DEADLINE_KEY: deadline} if deadline is not None else {}
+    if page_token:
+        metadata[PAGE_TOKEN_KEY] = page_token
+    task = a2a.Task(id="task-" + str(uuid.uuid4()), message=message.to_dict(), metadata=metadata or None)
+    try:
+        raw_response = await agent.send_task_async(task)
+    except a2a.A2AConnectionError:
+        if registry is None:
+            raise
+        registry.record_failure(agent_name)
+        return await degraded_branch(agent_name, query_str, llm)
+    except asyncio.TimeoutError:
+        if registry is not None:
+            registry.record_failure(agent_name)
+        raise
+    except BaseException:
+        # 取消（预测执行未命中、追问、分支超时、客户端断开）等不说明代理不可用，不计入熔断，
+        # 只归还半开状态的试探名额，否则熔断器会一直拒绝后续请求
+        if registry is not None:
+            registry.release(agent_name)
+        raise
+    if registry is not None:
+        registry.record_success(agent_name)
+    logger.info(f"{agent_name} 原始响应: {raw_response}")  # 记录原始响应日志
+    if on_page is not None and agent_name in PAGED_AGENTS:
+        on_page(intent, page_token, (raw_response.metadata or {}).get(PAGE_TOKEN_KEY))
+    # 4）处理结果
+    if raw_response.status.state == 'completed':  # 正常结果
+        agent_result = raw_response.artifacts[0]['parts'][0]['text']
+    else:  # 异常结果
+        agent_result = raw_response.status.message['content']['text']
+
+    # 5）模板模式：根据代理返回的结构化数据直接渲染，省去一次LLM调用
+    if conf.summarizer_modes.get(intent) == "template":
+        data = extract_data_part(raw_response)
+        rendered = render_agent_result(data) if data else None
+        if rendered is not None:
+            return rendered
+        if raw_response.status.state != 'completed':  # 追问或失败信息直接返回
+            return agent_result
+
+    # 6）查询类代理的结果交给LLM总结，其余直接返回
+    if agent_name not in SUMMARY_TYPES:
+        return agent_result
+    return PendingSummary(intent, agent_name, query_str, agent_result)
+
+
+# 单条总结：根据代理类型选择总结提示词
+async def summarize_result(pending, llm):
+    if pending.agent_name == "WeatherQueryAssistant":
+        chain, stage = SmartVoyagePrompts.summarize_weather_prompt() | llm, "summarize_weather"
+    else:
+        chain, stage = SmartVoyagePrompts.summarize_ticket_prompt() | llm, "summarize_ticket"
+    final_response = await chain.ainvoke({"query": pending.query, "raw_response": pending.raw},
+                                         config=llm_config(stage))
+    return final_response.content.strip()
+
+
+# 解析批量总结的输出：必须是包含全部意图的JSON对象，否则抛出ValueError
+def parse_batch_summary(output, intents):
+    output = re.sub(r'^```json\s*|\s*```$', '', output.strip()).strip()
+    summaries = json.loads(output)
+    if not isinstance(summaries, dict):
+        raise ValueError("批量总结输出不是JSON对象")
+    missing = [intent for intent in intents
+               if not isinstance(summaries.get(intent), str) or not summaries[intent].strip()]
+    if missing:
+        raise ValueError(f"批量总结缺少意图：{missing}")
+    return {intent: summaries[intent].strip() for intent in intents}
+
+
+async def summarize_batch(pendings, llm):
+    '''
+    把同一轮的多条代理结果放在一次LLM调用中总结，共用一份总结规则
+    :param pendings: PendingSummary列表，意图互不相同
+    :param llm: 大语言模型实例
+    :return: {intent: 总结文本}；输出无法解析时抛出异常，由调用方回退到逐条总结
+    '''
+    items = [{"id": p.intent, "type": SUMMARY_TYPES[p.agent_name], "query": p.query, "raw_response": p.raw}
+             for p in pendings]
+    chain = SmartVoyagePrompts.summarize_batch_prompt() | llm
+    batch_response = await chain.ainvoke({"items": json.dumps(items, ensure_ascii=False, indent=1)},
+                                         config=llm_config("summarize_batch"))
+    logger.info(f"批量总结原始响应: {batch_response.content}")
+    return parse_batch_summary(batch_response.content, [p.intent for p in pendings])
+
+
+# 代理分支：调用代理，并根据代理类型总结响应
+async def agent_branch(intent, agent_name, query_str, chat_history, llm, agent_network, deadline=None,
+                       page_token=None, on_page=None):
+    result = await fetch_agent_result(intent, agent_name, query_str, chat_history, llm, agent_network, deadline,
+                                      page_token, on_page)
+    if isinstance(result, PendingSummary):
+        return await summarize_result(result, llm)
+    return result
+
+
+# 为单个分支加上超时与异常兜底，保证一个慢分支不会拖住整轮回复
+async def guarded_branch(intent, coro, timeout):
+    try:
+        return await asyncio.wait_for(coro, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"意图 {intent} 处理超时（{timeout:.1f}s）")
+        return f"{intent} 查询超时，请稍后重试。"
+    except Exception as e:
+        logger.error(f"意图 {intent} 处理异常: {str(e)}")
+        return f"{intent} 处理失败：{str(e)}。请重试。"
+
+
+# 多意图并发分发
+async def dispatch_intents(prompt, intents, user_queries, turn_store, llm, agent_network, timeout=None,
+                          prefetched=None, deadline=None, page=None):
+    '''
+    并发处理一轮对话中的所有意图，并按意图顺序返回结果
+    :param prompt: 用户的原始问题
+    :param intents: 意图识别得到的意图列表
+    :param user_queries: 每个意图改写后的问题
+    :param turn_store: 会话轮次存储（已包含本轮用户问题）
+    :param llm: 大语言模型实例
+    :param agent_network: 代理网络实例
+    :param timeout: 单个分支的超时时间（秒），默认取配置 branch_timeout
+    :param prefetched: 已经提前启动的代理分支 {intent: 任务}（预测执行命中时），直接等待其结果
+    :param deadline: 本轮截止时间（Unix时间戳），分支超时不超过剩余预算，超时的分支返回超时提示，其余分支照常返回
+    :param page: 上一轮展示的分页结果（TurnStore.page），订票时带上本页令牌，让预定代理看到的余票与用户看到的一致
+    多个查询类代理的结果需要LLM总结时，合并为一次批量总结调用，解析失败时回退到逐条总结
+    :return: responses 按意图顺序排列的响应列表, routed_agents 路由到的代理列表
+    '''
+    timeout = remaining_budget(deadline, timeout or conf.branch_timeout)
+    # 所有代理分支共享同一段历史对话（去掉本轮用户问题），只需计算一次
+    chat_history = turn_store.render(6, skip_last=1)
+
+    branches = []  # 需要并发执行的分支，记录其在结果列表中的位置
+    responses = [None] * len(intents)  # 按意图顺序存储响应
+    routed_agents = []  # 记录路由到的代理列表
+    # 启用批量总结时，代理分支只取结果，总结留到所有分支返回后统一进行
+    branch = fetch_agent_result if conf.batch_summarize_enabled else agent_branch
+    for i, intent in enumerate(intents):
+        logger.info(f"处理意图：{intent}")
+        agent_name = INTENT_AGENT_MAP.get(intent)
+        if prefetched and intent in prefetched:
+            branches.append((i, guarded_branch(intent, prefetched[intent], timeout)))
+            routed_agents.append(agent_name)
+        elif intent == "attraction":
+            branches.append((i, guarded_branch(intent, attraction_branch(prompt, llm), timeout)))
+        elif agent_name:
+            query_str = user_queries.get(intent, {})
+            page_token = page["current"] if intent == "order" and page else None
+            branches.append((i, guarded_branch(
+                intent, branch(intent, agent_name, query_str, chat_history, llm, agent_network, deadline,
+                               page_token, turn_store.set_page),
+                timeout)))
+            routed_agents.append(agent_name)
+        else:
+            # 不支持的意图
+            responses[i] = "暂不支持此意图。"
+
+    # 并发执行所有分支，整轮耗时约等于最慢的分支
+    results = await asyncio.gather(*(coro for _, coro in branches))
+    for (i, _), result in zip(branches, results):
+        responses[i] = result
+
+    # 总结需要LLM总结的代理结果
+    pending = {i: r for i, r in enumerate(responses) if isinstance(r, PendingSummary)}
+    if pending:
+        summaries = await summarize_pending(list(pending.values()), llm,
+                                            remaining_budget(deadline, conf.branch_timeout))
+        for i, result in pending.items():
+            responses[i] = summaries[result.intent]
+
+    return responses, routed_agents
+
+
+# 翻页追问：带上一页返回的翻页令牌调用同一代理，代理直接从令牌恢复查询，不再生成SQL
+async def next_page_branch(prompt, page, turn_store, llm, agent_network, deadline=None):
+    intent = page["intent"]
+    timeout = remaining_budget(deadline, conf.branch_timeout)
+    result = await guarded_branch(intent, fetch_agent_result(
+        intent, INTENT_AGENT_MAP[intent], prompt, turn_store.render(6, skip_last=1), llm, agent_network, deadline,
+        page["next"], turn_store.set_page), timeout)
+    if isinstance(result, PendingSummary):
+        result = await guarded_branch(intent, summarize_result(result, llm), timeout)
+    return result
+
+
+# 总结一轮中所有待总结的结果：多条时先尝试批量总结，失败则逐条并发总结
+async def summarize_pending(pendings, llm, timeout):
+    if len(pendings) > 1:
+        try:
+            return await asyncio.wait_for(summarize_batch(pendings, llm), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"批量总结超时（{timeout:.1f}s）")
+            return {p.intent: f"{p.intent} 查询超时，请稍后重试。" for p in pendings}
+        except Exception as e:
+            logger.error(f"批量总结失败，回退到逐条总结: {str(e)}")
+    results = await asyncio.gather(*(guarded_branch(p.intent, summarize_result(p, llm), timeout) for p in pendings))
+    return {p.intent: result for p, result in zip(pendings, results)}
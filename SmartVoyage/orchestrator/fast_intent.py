@@ -0,0 +1,160 @@
+import re
+
+from SmartVoyage.config import Config
+from SmartVoyage.create_logger import logger
+from SmartVoyage.utils.date_resolver import DATE_EXPRESSIONS, resolve_dates
+from SmartVoyage.utils import entity_resolver  # 注册实体解析器与实体词典资源（entity_dictionary）
+from SmartVoyage.utils.resources import resources
+
+conf = Config()
+
+# 意图关键词
+INTENT_KEYWORDS = {
+    "weather": re.compile(r"天气|气温|温度|下雨|降雨|降水|刮风|冷不冷|热不热"),
+    "train": re.compile(r"高铁|动车|火车|列车|车次|硬卧|软卧|硬座|二等座|一等座|商务座"),
+    "flight": re.compile(r"机票|航班|飞机|飞往|经济舱|公务舱|头等舱"),
+    "concert": re.compile(r"演唱会|音乐会|演出"),
+}
+# 命中这些关键词时不走快速通道：订票和景点推荐交给LLM处理
+LLM_ONLY_KEYWORDS = re.compile(r"预订|预定|订票|购票|买票|帮我订|下单|景点|好玩|游玩|攻略|打卡")
+# 依赖上下文的表达，需要结合对话历史改写，交给LLM处理
+CONTEXT_MARKERS = re.compile(r"^(那|那么|还有|再|换成|改成|也)|呢[?？]?$|它|这个|那个|刚才|上面|同样")
+# 出发地与到达地之间的方向词
+DIRECTION_MARKERS = re.compile(r"到|至|去|飞往|飞|往|-|—|→")
+# 否定表达：改写只保留城市、日期和座位类型，否定会被改写成相反的条件
+NEGATION_MARKERS = re.compile(r"不要|不是|除了|不坐|不买|别")
+# 改写无法保留的条件：价格、时段、车次/航班号、余票
+CONSTRAINT_MARKERS = re.compile(r"便宜|最低|最贵|价格|票价|多少钱|[0-9一二两三四五六七八九十百千]+[元块]"
+                                r"|上午|下午|中午|晚上|早上|凌晨|傍晚|夜间|今晚|早班|晚班|红眼|[0-9一二两三四五六七八九十]+点"
+                                r"|[GDCZTKYLgdcztkyl]\d{1,5}|[A-Za-z]{2}\d{3,4}"
+                                r"|余票|有票|有没有票|还有票|剩|售罄|卖完|买得到|买到")
+# 不改变查询条件的虚词与标点，去掉实体、日期、座位、意图关键词和方向词之后只允许剩下这些
+FILLER_WORDS = re.compile(r"查询|查一下|查查|查|帮我|帮忙|请问|请|我想|我要|想|看看|看一下|一下|有哪些|有什么|哪些"
+                          r"|怎么样|如何|情况|信息|出发|从|的|票|吗|呢|啊|呀|[\s,，。.!！?？、:：]")
+# 座位/票类型
+SEAT_TYPES = {
+    "train": re.compile(r"二等座|一等座|商务座|硬卧|软卧|硬座|无座"),
+    "flight": re.compile(r"经济舱|公务舱|商务舱|头等舱"),
+    "concert": re.compile(r"VIP|vip|看台|内场|前排|普通票"),
+}
+
+
+# 快速意图分类器：关键词 + 实体词典 + 相对日期解析，置信度足够时跳过意图识别LLM
+class FastIntentClassifier:
+    def __init__(self, dictionary=None, threshold=None):
+        self._dictionary = dictionary
+        self.threshold = threshold if threshold is not None else conf.fast_intent_threshold
+        self.total = 0
+        self.hits = 0
+
+    # 城市/艺人词典是实体解析器的视图，识别别名、拼音与错别字；
+    # 解析器需要查询数据库，在后台线程中构建（classify在事件循环中调用，不能阻塞），构建完成前为None
+    @property
+    def dictionary(self):
+        if self._dictionary is not None:
+            return self._dictionary
+        return resources.get_nowait("entity_dictionary")
+
+    def classify(self, query, today=None):
+        '''
+        对用户问题做本地意图分类与改写
+        :param query: 用户的原始问题
+        :param today: 基准日期，默认取Asia/Shanghai的当天
+        :return: (intents, user_queries, confidence)；无法识别时intents为空、置信度为0
+        '''
+        if LLM_ONLY_KEYWORDS.search(query):
+            return [], {}, 0.0
+        matched = [intent for intent, pattern in INTENT_KEYWORDS.items() if pattern.search(query)]
+        if len(matched) != 1:  # 无意图或多意图都交给LLM
+            return [], {}, 0.0
+        intent = matched[0]
+
+        confidence = 1.0
+        if CONTEXT_MARKERS.search(query):
+            confidence -= 0.4
+        if len(query) > 40:  # 长句往往包含额外条件
+            confidence -= 0.2
+
+        # 含否定或改写无法保留的票务条件时，交给LLM，避免静默丢掉用户的条件（天气按天查询，时段等不影响结果）
+        if NEGATION_MARKERS.search(query) or (intent != "weather" and CONSTRAINT_MARKERS.search(query)):
+            return [intent], {}, 0.0
+
+        dates = resolve_dates(query, today)
+        if dates is None:
+            return [intent], {}, 0.0
+        dictionary = self.dictionary
+        if dictionary is None:  # 词典尚未加载完成，本轮交给LLM
+            return [intent], {}, 0.0
+        start_date, end_date = dates
+        date_text = start_date if start_date == end_date else f"{start_date}至{end_date}"
+        city_spans = dictionary.find_cities(query)
+        cities = [city for _, _, city in city_spans]
+        seat = SEAT_TYPES.get(intent)
+        seat_match = seat.search(query) if seat else None
+        seat_text = f"，{seat_match.group(0)}" if seat_match else ""
+
+        spans = city_spans
+        if intent == "weather":
+            if len(cities) != 1:
+                return [intent], {}, 0.0
+            rewritten = f"查询{cities[0]}{date_text}的天气"
+        elif intent in ("train", "flight"):
+            if len(cities) != 2:
+                return [intent], {}, 0.0
+            # 两个城市之间必须有方向词，才能确定出发地和到达地
+            between = query[city_spans[0][1]:city_spans[1][0]]
+            if not DIRECTION_MARKERS.search(between):
+                return [intent], {}, 0.0
+            if start_date != end_date:  # 票务查询按单日处理，日期区间交给LLM
+                confidence -= 0.3
+            ticket = "火车票" if intent == "train" else "机票"
+            rewritten = f"查询{date_text}从{cities[0]}到{cities[1]}的{ticket}{seat_text}"
+        else:
+            artist_spans = dictionary.find_artists(query)
+            if len(cities) != 1 or len(artist_spans) != 1:
+                return [intent], {}, 0.0
+            rewritten = f"查询{date_text}{cities[0]}{artist_spans[0][2]}的演唱会门票{seat_text}"
+            spans = city_spans + artist_spans
+
+        # 去掉已识别的部分后还有剩余文字，说明用户给出了改写中没有的条件
+        residual = self._residual(query, spans, seat_match, INTENT_KEYWORDS[intent])
+        if residual:
+            logger.info(f"快速意图存在未识别的条件: {residual}")
+            return [intent], {}, 0.0
+
+        return [intent], {intent: rewritten}, round(confidence, 2)
+
+    @staticmethod
+    def _residual(query, spans, seat_match, intent_pattern):
+        '''
+        去掉实体、日期、座位类型、意图关键词、方向词和虚词之后剩下的文字
+        :param spans: 词典找到的实体 [(开始位置, 结束位置, 规范取值)]，按原文位置去掉（原文可能是别名、拼音或错别字）
+        '''
+        chars = list(query)
+        for start, end, _ in spans:
+            chars[start:end] = " " * (end - start)
+        text = "".join(chars)
+        if seat_match:
+            text = text.replace(seat_match.group(0), " ")
+        for pattern in (DATE_EXPRESSIONS, intent_pattern, DIRECTION_MARKERS, FILLER_WORDS):
+            text = pattern.sub("", text)
+        return text
+
+    def try_resolve(self, query, today=None):
+        '''
+        置信度达到阈值时返回与意图识别LLM相同结构的结果，否则返回None
+        :return: (intents, user_queries, follow_up_message) 或 None
+        '''
+        intents, user_queries, confidence = self.classify(query, today)
+        self.total += 1
+        if confidence < self.threshold:
+            logger.info(f"快速意图置信度不足({confidence} < {self.threshold})，回退到LLM")
+            return None
+        self.hits += 1
+        logger.info(f"快速意图命中 intents: {intents}||user_queries: {user_queries}||confidence: {confidence}")
+        return intents, user_queries, ""
+
+    # 返回快速通道命中统计
+    def stats(self):
+        return {"threshold": self.threshold, "total": self.total, "hits": self.hits,
+                "hit_rate": round(self.hits / self.total, 4) if self.total else 0.0}
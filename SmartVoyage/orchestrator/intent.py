@@ -0,0 +1,96 @@
+import hashlib
+import json
+import re
+import unicodedata
+
+from SmartVoyage.config import Config
+from SmartVoyage.create_logger import logger
+from SmartVoyage.main_prompts import SmartVoyagePrompts
+from SmartVoyage.orchestrator.fast_intent import FastIntentClassifier
+from SmartVoyage.utils.cache import DailyLRUCache
+from SmartVoyage.utils.date_resolver import now_shanghai
+from SmartVoyage.utils.metrics import llm_config, metrics
+
+conf = Config()
+
+# 意图识别结果缓存：同一问题、同一历史窗口、同一天的识别结果直接复用
+intent_cache = DailyLRUCache(maxsize=conf.intent_cache_size)
+metrics.register_cache("intent", intent_cache)
+# 快速意图分类器：无歧义的问题直接本地识别，不调用LLM
+fast_classifier = FastIntentClassifier()
+
+
+# 归一化用户问题：全角转半角、去除首尾空白与句末标点、合并空白、英文小写
+def normalize_query(query):
+    query = unicodedata.normalize("NFKC", query).strip().lower()
+    query = re.sub(r"\s+", " ", query)
+    return query.rstrip("?？.。!！~～ ")
+
+
+# 生成缓存键：归一化问题 + 最近6行历史的哈希 + 当前日期
+def intent_cache_key(query, history_window, current_date):
+    history_hash = hashlib.sha1(history_window.encode("utf-8")).hexdigest()
+    return normalize_query(query), history_hash, current_date
+
+
+# 解析意图识别的LLM输出
+def parse_intent_response(intent_response):
+    # 清理响应：移除可能的Markdown代码块标记
+    intent_response = re.sub(r'^```json\s*|\s*```$', '', intent_response).strip()
+    logger.info(f"清理后响应: {intent_response}")
+    intent_output = json.loads(intent_response)
+    # 提取意图、改写问题和追问消息
+    intents = intent_output.get("intents", [])
+    user_queries = intent_output.get("user_queries", {})
+    follow_up_message = intent_output.get("follow_up_message", "")
+    return intents, user_queries, follow_up_message
+
+
+async def _recognize(user_input, history_window, now, llm):
+    current_date = now.strftime('%Y-%m-%d')  # 获取当前日期（Asia/Shanghai时区）
+
+    # 快速通道：本地分类器置信度足够时直接返回
+    if conf.fast_intent_enabled:
+        fast_result = fast_classifier.try_resolve(user_input, now.date())
+        if fast_result is not None:
+            return fast_result
+
+    key = intent_cache_key(user_input, history_window, current_date) if conf.intent_cache_enabled else None
+    if key is not None:
+        cached = intent_cache.get(key)
+        if cached is not None:
+            intents, user_queries, follow_up_message = cached
+            logger.info(f"意图识别命中缓存 intents: {intents}||user_queries: {user_queries}||follow_up_message: {follow_up_message} ")
+            return list(intents), dict(user_queries), follow_up_message
+
+    # 创建意图识别链：提示模板 + LLM
+    chain = SmartVoyagePrompts.intent_prompt() | llm
+    # 调用LLM进行意图识别
+    intent_response = await chain.ainvoke(
+        {"conversation_history": history_window, "query": user_input, "current_date": current_date},
+        config=llm_config("intent"))
+    intent_response = intent_response.content.strip()
+    logger.info(f"意图识别原始响应: {intent_response}")
+
+    intents, user_queries, follow_up_message = parse_intent_response(intent_response)
+    logger.info(f"intents: {intents}||user_queries: {user_queries}||follow_up_message: {follow_up_message} ")
+
+    # 解析成功才写入缓存，解析失败的响应会抛出异常，不会被缓存
+    if key is not None:
+        intent_cache.set(key, (list(intents), dict(user_queries), follow_up_message))
+    return intents, user_queries, follow_up_message
+
+
+async def recognize_intent(user_input, turn_store, llm):
+    '''
+    意图识别：实现意图的分类以及问题的改写；快速通道或缓存命中时跳过LLM调用
+    :param user_input: 用户的原始问题
+    :param turn_store: 会话轮次存储（已包含本轮用户问题）
+    :param llm: 大语言模型实例
+    :return: intents 用户意图, user_queries 改写后的问题, follow_up_message 追问的问题
+    '''
+    now = now_shanghai()
+    intents, user_queries, follow_up_message = await _recognize(user_input, turn_store.render(6), now, llm)
+    # 更新槽位记忆；快速通道已加载词典时顺带抽取城市和艺人
+    turn_store.remember(intents, user_queries, fast_classifier.dictionary if conf.fast_intent_enabled else None)
+    return intents, user_queries, follow_up_message
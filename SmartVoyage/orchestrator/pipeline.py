@@ -0,0 +1,111 @@
+import asyncio
+import re
+import time
+
+from SmartVoyage.config import Config
+from SmartVoyage.create_logger import logger
+from SmartVoyage.orchestrator.dispatcher import INTENT_AGENT_MAP, agent_branch, dispatch_intents, next_page_branch
+from SmartVoyage.orchestrator.intent import recognize_intent
+from SmartVoyage.orchestrator.speculation import Speculation, predict_intent
+from SmartVoyage.utils.deadline import new_deadline, remaining_budget
+from SmartVoyage.utils.metrics import metrics, track_turn
+
+conf = Config()
+
+# 翻页追问：上一轮展示了分页结果时，直接取下一页
+NEXT_PAGE_PATTERN = re.compile(r"^(下一页|下页|再来一页|更多|更多结果|继续|还有吗|还有呢|more|next)[\s。.!！?？]*$",
+                               re.IGNORECASE)
+
+
+# 预测执行：根据关键词预测意图，与意图识别并发启动对应的代理分支（以原始问题作为查询）
+def start_speculation(prompt, turn_store, llm, agent_network, deadline=None):
+    if not conf.speculative_dispatch_enabled:
+        return None
+    intent = predict_intent(prompt)
+    if intent is None:
+        return None
+    logger.info(f"预测执行：{intent} -> {INTENT_AGENT_MAP[intent]}")
+    chat_history = turn_store.render(6, skip_last=1)
+    return Speculation(intent, agent_branch(intent, INTENT_AGENT_MAP[intent], prompt, chat_history, llm,
+                                            agent_network, deadline, on_page=turn_store.set_page))
+
+
+async def handle_turn(prompt, turn_store, llm, agent_network, deadline=None):
+    '''
+    处理一轮用户输入：识别意图、调用代理、生成响应，并更新会话轮次存储
+    核心逻辑：使用LLM进行意图识别，根据意图路由到相应代理或直接生成内容
+    :param prompt: 用户的原始问题
+    :param turn_store: 当前会话的轮次存储
+    :param llm: 大语言模型实例（各会话共享）
+    :param agent_network: 代理网络实例（各会话共享）
+    :param deadline: 本轮截止时间（Unix时间戳），默认为当前时间 + 配置 turn_deadline
+    :return: response 助手回复, intents 意图列表, routed_agents 路由到的代理列表
+    '''
+    # 统计本轮所有LLM调用，结束后输出明细，指标文件在后台延迟写出
+    with track_turn("本轮") as turn:
+        result = await _handle_turn(prompt, turn_store, llm, agent_network, deadline)
+    logger.info(turn.summary_line())
+    metrics.dump_soon("orchestrator")
+    return result
+
+
+async def _handle_turn(prompt, turn_store, llm, agent_network, deadline):
+    deadline = deadline or new_deadline(conf.turn_deadline)
+    # 添加用户消息到历史
+    turn_store.add_user(prompt)
+    # 分页状态只保留一轮：本轮没有返回新的分页结果时清空
+    page, turn_store.page = turn_store.page, None
+    if page is not None and NEXT_PAGE_PATTERN.match(prompt.strip()):
+        if page["next"]:
+            response = await next_page_branch(prompt, page, turn_store, llm, agent_network, deadline)
+        else:
+            response = "已经是最后一页了。"
+            turn_store.page = page
+        turn_store.add_assistant(response)
+        return response, [page["intent"]], [INTENT_AGENT_MAP[page["intent"]]]
+
+    # 预测执行与意图识别并发
+    speculation = start_speculation(prompt, turn_store, llm, agent_network, deadline)
+    started = time.monotonic()
+    # 意图识别过程，不超过本轮剩余预算
+    try:
+        intents, user_queries, follow_up_message = await asyncio.wait_for(
+            recognize_intent(prompt, turn_store, llm), remaining_budget(deadline))
+    except asyncio.TimeoutError:
+        if speculation is not None:
+            speculation.cancel()
+        logger.error("意图识别超时")
+        response = "本轮处理超时，请稍后重试。"
+        turn_store.add_assistant(response)
+        return response, [], []
+    except BaseException:
+        if speculation is not None:
+            speculation.cancel()
+        raise
+    # 意图与预测一致时复用预测任务的结果，否则取消预测任务
+    prefetched = None
+    if speculation is not None:
+        prefetched = speculation.accept(intents, follow_up_message, time.monotonic() - started)
+        if prefetched is None:
+            turn_store.page = None  # 未命中的预测任务可能已记录了一页结果
+
+    routed_agents = []  # 记录路由到的代理列表
+    # 根据意图输出生成响应
+    if "out_of_scope" in intents:
+        # 如果意图超出范围，返回大模型直接回复
+        response = follow_up_message
+    elif follow_up_message != "":
+        # 如果有追问消息，则直接返回
+        response = follow_up_message
+    else:  # 处理有效意图
+        # 并发处理所有意图，结果按意图顺序返回
+        responses, routed_agents = await dispatch_intents(prompt, intents, user_queries, turn_store, llm,
+                                                          agent_network, prefetched=prefetched, deadline=deadline,
+                                                          page=page)
+        # 组合所有响应
+        response = "\n\n".join(responses)
+        if routed_agents:
+            logger.info(f"路由到代理：{routed_agents}")
+
+    turn_store.add_assistant(response)  # 更新历史
+    return response, intents, routed_agents
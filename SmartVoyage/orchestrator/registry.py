@@ -0,0 +1,175 @@
+import asyncio
+import time
+
+from SmartVoyage.config import Config
+from SmartVoyage.create_logger import logger
+from SmartVoyage.utils.resources import lazy_import_async
+
+conf = Config()
+
+# 熔断器状态
+CLOSED = "closed"  # 正常放行
+OPEN = "open"  # 熔断，直接拒绝
+HALF_OPEN = "half_open"  # 熔断到期，放行一次试探请求
+
+# 代理状态的中文展示
+STATUS_LABELS = {"unknown": "未知", "online": "在线", "offline": "离线", "open": "熔断中"}
+
+
+# 单个代理的熔断器：连续失败达到阈值后熔断，到期后放行一次试探请求，成功即恢复
+class CircuitBreaker:
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        self.failure_threshold = failure_threshold or conf.circuit_failure_threshold
+        self.reset_timeout = reset_timeout or conf.circuit_reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        # 熔断统计：熔断次数、被拒绝的请求数
+        self.stats = {"opens": 0, "rejected": 0}
+
+    def allow(self):
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            return True
+        if self.state == CLOSED:
+            return True
+        # 熔断中，或半开状态下试探请求尚未返回
+        self.stats["rejected"] += 1
+        return False
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+
+    # 熔断到期前提前放行一次试探请求：下一次 allow() 即进入半开状态
+    def _allow_trial(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic() - self.reset_timeout
+
+    # 调用被取消（预测执行未命中、分支超时、客户端断开）：不计为失败，半开状态时归还试探名额
+    def release(self):
+        if self.state == HALF_OPEN:
+            self._allow_trial()
+
+    # 健康探测成功：熔断中的代理不直接恢复，而是放行一次真实请求试探，由试探结果决定是否恢复
+    def record_probe_success(self):
+        if self.state == OPEN:
+            self._allow_trial()
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.stats["opens"] += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+
+# 代理注册表：按名称管理代理客户端，缓存代理卡片并定期重新校验，后台健康探测，按代理熔断
+# 只实现编排用到的AgentNetwork接口（agents、get_agent、get_agent_card），不继承它，启动时不必导入python_a2a
+class AgentRegistry:
+    def __init__(self, name, runtime):
+        self.name = name
+        self.runtime = runtime
+        self.agents = {}  # 代理名称 -> 代理客户端
+        self.agent_cards = {}  # 代理名称 -> 代理卡片，由后台探测拉取
+        self.urls = {}  # 代理名称 -> URL
+        self.breakers = {}  # 代理名称 -> CircuitBreaker
+        self.health = {}  # 代理名称 -> unknown/online/offline
+        self.card_fetched_at = {}  # 代理名称 -> 卡片拉取时间
+        self._probe = None
+
+    def register(self, agent_name, url, client):
+        self.agents[agent_name] = client
+        self.agent_cards[agent_name] = getattr(client, "agent_card", None)
+        self.urls[agent_name] = url
+        self.breakers[agent_name] = CircuitBreaker()
+        self.health[agent_name] = "unknown"
+        self.card_fetched_at[agent_name] = time.monotonic()
+
+    def get_agent(self, name):
+        return self.agents.get(name)
+
+    # 返回缓存的代理卡片，不发起网络请求；卡片由后台探测拉取并定期重新校验，尚未拉取到时为None
+    def get_agent_card(self, name):
+        return self.agent_cards.get(name)
+
+    # 代理当前状态（中文），熔断优先于健康探测结果
+    def status(self, name):
+        breaker = self.breakers.get(name)
+        if breaker is not None and breaker.state != CLOSED:
+            return STATUS_LABELS["open"]
+        return STATUS_LABELS[self.health.get(name, "unknown")]
+
+    # 路由前检查：未注册的代理不做限制
+    def allow(self, name):
+        breaker = self.breakers.get(name)
+        return breaker is None or breaker.allow()
+
+    def record_success(self, name):
+        if name in self.breakers:
+            self.breakers[name].record_success()
+            self.health[name] = "online"
+
+    def release(self, name):
+        if name in self.breakers:
+            self.breakers[name].release()
+
+    def record_probe_success(self, name):
+        if name in self.breakers:
+            self.breakers[name].record_probe_success()
+            self.health[name] = "online"
+
+    def record_failure(self, name):
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            return
+        was_open = breaker.state == OPEN
+        breaker.record_failure()
+        self.health[name] = "offline"
+        if breaker.state == OPEN and not was_open:
+            logger.warning(f"代理 {name} 连续失败 {breaker.failures} 次，已熔断 {breaker.reset_timeout}s")
+
+    async def _probe_agent(self, name):
+        pool = self.runtime.get_pool(self.urls[name])
+        try:
+            await pool.get_json("/a2a/health", conf.agent_probe_timeout)
+        except Exception as e:
+            logger.debug(f"代理 {name} 健康探测失败: {str(e)}")
+            self.record_failure(name)
+            return
+        self.record_probe_success(name)
+        # 卡片过期或启动时未能获取，重新拉取
+        card = self.agent_cards.get(name)
+        stale = time.monotonic() - self.card_fetched_at[name] > conf.agent_card_ttl
+        if stale or card is None or card.version == "unknown":
+            try:
+                data = await pool.get_json("/agent.json", conf.agent_probe_timeout)
+                a2a = await lazy_import_async("python_a2a")
+                self.agent_cards[name] = a2a.AgentCard.from_dict(data)
+                self.card_fetched_at[name] = time.monotonic()
+            except Exception as e:
+                logger.debug(f"代理 {name} 卡片拉取失败: {str(e)}")
+
+    # 一轮健康探测：所有代理并发探测
+    async def probe_once(self):
+        await asyncio.gather(*(self._probe_agent(name) for name in list(self.urls)))
+
+    async def _probe_loop(self):
+        while True:
+            await self.probe_once()
+            await asyncio.sleep(conf.agent_probe_interval)
+
+    def start_probing(self):
+        if self._probe is None:
+            self._probe = self.runtime.submit(self._probe_loop())
+
+    def stop_probing(self):
+        if self._probe is not None:
+            self._probe.cancel()
+            self._probe = None
+
+    # 返回各代理的状态与熔断统计
+    def registry_stats(self):
+        return {name: {"status": self.status(name), "state": breaker.state, **breaker.stats}
+                for name, breaker in self.breakers.items()}
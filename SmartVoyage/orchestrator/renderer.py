@@ -0,0 +1,131 @@
+from SmartVoyage.config import Config
+
+conf = Config()
+
+# 票务类型的中文名称
+TICKET_LABELS = {"train": "火车票", "flight": "机票", "concert": "演唱会门票"}
+
+
+# 从代理返回的任务中提取结构化数据部分，没有时返回None
+def extract_data_part(task):
+    for artifact in task.artifacts or []:
+        for part in artifact.get("parts", []):
+            if part.get("type") == "data" and isinstance(part.get("data"), dict):
+                return part["data"]
+    return None
+
+
+def _to_float(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+# 渲染天气结果：逐日天气、整体温度范围、降水提醒
+def render_weather(rows):
+    if not rows:
+        return "未找到数据，请确认城市/日期。"
+    rows = sorted(rows, key=lambda d: (d.get("city", ""), str(d.get("fx_date", ""))))
+    lines = ["根据最新数据，天气预报如下："]
+    for d in rows:
+        lines.append(f"- {d.get('city', '')} {d.get('fx_date', '')}：白天{d.get('text_day', '未知')}，"
+                     f"夜间{d.get('text_night', '未知')}，气温 {d.get('temp_min')}~{d.get('temp_max')}°C，"
+                     f"湿度 {d.get('humidity')}%，{d.get('wind_dir_day', '')}，降水 {d.get('precip', 0)}mm")
+
+    temps_min = [d["temp_min"] for d in rows if d.get("temp_min") is not None]
+    temps_max = [d["temp_max"] for d in rows if d.get("temp_max") is not None]
+    if len(rows) > 1 and temps_min and temps_max:
+        lines.append(f"整体气温 {min(temps_min)}~{max(temps_max)}°C。")
+
+    rainy = [d for d in rows if _to_float(d.get("precip")) > 0
+             or "雨" in str(d.get("text_day", "")) or "雨" in str(d.get("text_night", ""))]
+    if rainy:
+        days = "、".join(f"{d.get('city', '')}{d.get('fx_date', '')}" for d in rainy)
+        lines.append(f"⚠️ 降水提醒：{days} 有降水，出行请携带雨具。")
+    return "\n".join(lines)
+
+
+# 渲染票务结果：按出发/开始时间排序（代理已按票价排好的保持原顺序），标出最低票价
+# 代理分页返回时rows只是一页，total为结果总数，offset为本页第一条的位置，has_next表示代理签发了下一页令牌
+def render_tickets(query_type, rows, limit=None, total=None, order="time", truncated=False, offset=0,
+                   has_next=False):
+    if not rows:
+        return "未找到数据，请确认或修改条件。"
+    limit = limit or conf.render_ticket_limit
+    total = total or len(rows)
+    time_key = "start_time" if query_type == "concert" else "departure_time"
+    if order != "price":
+        rows = sorted(rows, key=lambda d: str(d.get(time_key, "")))
+    label = TICKET_LABELS.get(query_type, "票务")
+    count = f"{total}+" if truncated else f"{total}"  # 结果被默认LIMIT截断时总数只是下限
+
+    first = rows[0]
+    if query_type == "concert":
+        lines = [f"为您找到{first.get('city', '')}{first.get('artist', '')}的{label}共 {count} 条："]
+    else:
+        lines = [f"为您找到{first.get('departure_city', '')}到{first.get('arrival_city', '')}的{label}共 {count} 条："]
+
+    for d in rows[:limit]:
+        sold_out = "（已售罄）" if d.get("remaining_seats") == 0 else ""
+        if query_type == "concert":
+            lines.append(f"- {d.get('start_time', '')} {d.get('venue', '')}，{d.get('ticket_type', '')} "
+                         f"{d.get('price')}元，余票 {d.get('remaining_seats')} 张{sold_out}")
+        else:
+            number = d.get("train_number") or d.get("flight_number", "")
+            seat = d.get("seat_type") or d.get("cabin_type", "")
+            lines.append(f"- {d.get('departure_time', '')} 出发 {number}，{d.get('arrival_time', '')} 到达，"
+                         f"{seat} {d.get('price')}元，余票 {d.get('remaining_seats')} 张{sold_out}")
+    shown = min(limit, len(rows))
+    if offset or total > shown:
+        lines[0] = lines[0][:-1] + f"（第 {offset + 1}-{offset + shown} 条）："
+    if total > offset + shown:
+        more = "，回复“下一页”查看更多" if has_next else ""
+        lines.append(f"……另有 {total - offset - shown} 条结果未展示{more}。")
+
+    available = [d for d in rows if d.get("remaining_seats", 1) != 0] or rows
+    cheapest = min(available, key=lambda d: _to_float(d.get("price"), float("inf")))
+    # 分页按时间排序时只能在本页中比较
+    cheapest_label = "本页最低票价" if order != "price" and total > len(rows) else "最低票价"
+    if query_type == "concert":
+        lines.append(f"{cheapest_label}：{cheapest.get('ticket_type', '')} {cheapest.get('price')}元（{cheapest.get('start_time', '')}）。")
+    else:
+        number = cheapest.get("train_number") or cheapest.get("flight_number", "")
+        seat = cheapest.get("seat_type") or cheapest.get("cabin_type", "")
+        lines.append(f"{cheapest_label}：{number} {seat} {cheapest.get('price')}元（{cheapest.get('departure_time', '')} 出发）。")
+    return "\n".join(lines)
+
+
+# 渲染换乘方案：无直达时票务代理返回的中转方案，按代理给出的顺序展示
+def render_transfers(plans):
+    if not plans:
+        return "未找到可行的换乘方案，请尝试其他日期。"
+    legs = plans[0]["legs"]
+    lines = [f"{legs[0].get('departure_city', '')}到{legs[-1].get('arrival_city', '')}暂无直达，"
+             f"为您找到 {len(plans)} 个换乘方案："]
+    for i, plan in enumerate(plans, 1):
+        hours, minutes = divmod(plan.get("duration_minutes", 0), 60)
+        route = " → ".join([plan["legs"][0].get("departure_city", "")] + [leg.get("arrival_city", "") for leg in plan["legs"]])
+        numbers = "、".join(leg.get("train_number") or leg.get("flight_number", "") for leg in plan["legs"])
+        lines.append(f"- 方案{i}：{route}（{numbers}），{plan.get('departure_time', '')} 出发，"
+                     f"{plan.get('arrival_time', '')} 到达，全程 {hours}小时{minutes}分，总价 {plan.get('total_price')}元")
+    return "\n".join(lines)
+
+
+def render_agent_result(data):
+    '''
+    根据代理返回的结构化数据直接生成回复，替代总结LLM调用
+    :param data: 代理任务产物中的数据部分，形如 {"type": "weather/train/flight/concert", "rows": [...]}，
+                 换乘方案为 {"type": "transfer", "plans": [...]}
+    :return: 回复文本；数据类型不支持时返回None
+    '''
+    query_type = data.get("type")
+    if query_type == "weather":
+        return render_weather(data.get("rows", []))
+    if query_type in TICKET_LABELS:
+        return render_tickets(query_type, data.get("rows", []), total=data.get("total"),
+                              order=data.get("order", "time"), truncated=data.get("truncated", False),
+                              offset=data.get("offset", 0), has_next=bool(data.get("next")))
+    if query_type == "transfer":
+        return render_transfers(data.get("plans", []))
+    return None
@@ -0,0 +1,191 @@
+import asyncio
+import os
+import threading
+import time
+
+import aiohttp
+
+from SmartVoyage.config import Config
+from SmartVoyage.create_logger import logger
+from SmartVoyage.orchestrator.registry import AgentRegistry
+from SmartVoyage.utils.deadline import remaining_budget, task_deadline
+from SmartVoyage.utils.resources import lazy_import_async
+
+conf = Config()
+
+
+# 单个代理URL的长连接池：基于aiohttp的keep-alive连接，只能在运行时的事件循环中使用
+class AgentConnectionPool:
+    def __init__(self, url, limit=None, idle_timeout=None):
+        self.url = url.rstrip("/")
+        self.limit = limit or conf.a2a_pool_size
+        self.idle_timeout = idle_timeout or conf.a2a_pool_idle_timeout
+        self.session = None  # 首次请求时在事件循环中创建
+        self._loop = None  # 会话所属的事件循环
+        self.last_used = 0.0
+        # 连接池统计：请求数、连接复用次数、新建连接次数、空闲回收次数
+        self.stats = {"requests": 0, "hits": 0, "opens": 0, "idle_evictions": 0}
+
+    # 通过aiohttp的trace钩子统计连接的新建与复用
+    def _trace_config(self):
+        async def on_connection_create_end(session, ctx, params):
+            self.stats["opens"] += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self.stats["hits"] += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    # aiohttp会话只能在创建它的事件循环中使用：在另一个事件循环中请求（例如原循环已关闭）时重新创建
+    def _get_session(self):
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed or self._loop is not loop:
+            if self.session is not None and not self.session.closed:
+                logger.warning(f"连接池所属的事件循环已变化，重新建立连接: {self.url}")
+            self._loop = loop
+            connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=self.idle_timeout)
+            self.session = aiohttp.ClientSession(connector=connector, trace_configs=[self._trace_config()])
+        return self.session
+
+    # 发送JSON请求并返回解析后的JSON响应
+    async def post_json(self, path, payload, timeout):
+        self.stats["requests"] += 1
+        self.last_used = time.monotonic()
+        async with self._get_session().post(self.url + path, json=payload,
+                                            timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    # 发送GET请求并返回解析后的JSON响应（健康探测、代理卡片）
+    async def get_json(self, path, timeout):
+        self.stats["requests"] += 1
+        self.last_used = time.monotonic()
+        async with self._get_session().get(self.url + path,
+                                           timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    # 连接池空闲超过idle_timeout时整体回收，下次请求再重新建立
+    async def evict_if_idle(self, now):
+        if self.session and not self.session.closed and now - self.last_used > self.idle_timeout:
+            await self.session.close()
+            self.stats["idle_evictions"] += 1
+            logger.info(f"回收空闲连接池: {self.url}")
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+
+# 使用长连接池发送任务的A2A客户端，接口与python_a2a的A2AClient.send_task_async一致
+# 不继承A2AClient：其构造时会导入python_a2a并同步拉取代理卡片，卡片改由代理注册表的后台探测拉取
+# 连接失败、超时、HTTP错误统一抛出A2AConnectionError，由调用方计入熔断
+class PooledA2AClient:
+    def __init__(self, endpoint_url, pool, timeout=30):
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.pool = pool
+        self.timeout = timeout
+        self.agent_card = None
+
+    async def send_task_async(self, task):
+        a2a = await lazy_import_async("python_a2a")
+        request_data = {"jsonrpc": "2.0", "id": 1, "method": "tasks/send", "params": task.to_dict()}
+        # 任务携带截止时间时，HTTP超时不超过剩余预算
+        timeout = max(remaining_budget(task_deadline(task), self.timeout), 0.1)
+        try:
+            response_data = await self.pool.post_json("/tasks/send", request_data, timeout)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"代理调用失败 {self.endpoint_url}: {str(e)}")
+            raise a2a.A2AConnectionError(f"代理调用失败：{str(e) or type(e).__name__}") from e
+        return a2a.Task.from_dict(response_data.get("result", {}))
+
+
+# 编排运行时：持有一个常驻事件循环（后台线程）和按代理URL划分的长连接池
+class OrchestratorRuntime:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="orchestrator-loop", daemon=True)
+        self._thread.start()
+        self.pools = {}  # 代理URL -> AgentConnectionPool
+        self._pools_lock = threading.Lock()
+        self.networks = {}  # 网络名称 -> AgentRegistry
+        self._sweeper = self.submit(self._sweep_idle_pools())
+
+    # 提交协程到常驻事件循环，返回concurrent.futures.Future
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    # 提交协程并阻塞等待结果，供同步的前端（命令行/Streamlit）调用
+    def run(self, coro, timeout=None):
+        return self.submit(coro).result(timeout)
+
+    def get_pool(self, url):
+        with self._pools_lock:
+            if url not in self.pools:
+                self.pools[url] = AgentConnectionPool(url)
+            return self.pools[url]
+
+    # 构建代理网络（代理注册表），每个代理都使用对应URL的长连接池；同名网络只创建一次，
+    # Streamlit的多个会话共用同一份卡片缓存、健康状态和熔断器
+    def create_network(self, name, agent_urls):
+        with self._pools_lock:
+            network = self.networks.get(name)
+        if network is not None:
+            return network
+        network = AgentRegistry(name, self)
+        for agent_name, url in agent_urls.items():
+            network.register(agent_name, url, PooledA2AClient(url, self.get_pool(url)))
+        with self._pools_lock:
+            network = self.networks.setdefault(name, network)
+        network.start_probing()
+        return network
+
+    # 返回各代理URL连接池的统计信息
+    def pool_stats(self):
+        return {url: dict(pool.stats) for url, pool in self.pools.items()}
+
+    async def _sweep_idle_pools(self):
+        while True:
+            await asyncio.sleep(conf.a2a_pool_idle_timeout / 2)
+            now = time.monotonic()
+            for pool in list(self.pools.values()):
+                await pool.evict_if_idle(now)
+
+    def shutdown(self):
+        self._sweeper.cancel()
+        for network in list(self.networks.values()):
+            network.stop_probing()
+
+        async def close_pools():
+            for pool in list(self.pools.values()):
+                await pool.close()
+
+        self.run(close_pools(), timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+# 获取进程内唯一的编排运行时，命令行和Streamlit前端共用
+def get_runtime():
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = OrchestratorRuntime()
+        return _runtime
+
+
+# fork出的子进程不继承常驻循环线程与探测任务：丢弃从父进程复制的运行时，子进程首次使用时重新创建
+def _reset_runtime_after_fork():
+    global _runtime, _runtime_lock
+    _runtime = None
+    _runtime_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_runtime_after_fork)
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+from SmartVoyage.config import Config
+from SmartVoyage.create_logger import logger
+from SmartVoyage.orchestrator.intent import intent_cache, fast_classifier
+from SmartVoyage.orchestrator.pipeline import handle_turn
+from SmartVoyage.orchestrator.runtime import get_runtime
+from SmartVoyage.orchestrator.speculation import speculation_stats
+from SmartVoyage.orchestrator.turn_store import TurnStore
+from SmartVoyage.utils.metrics import metrics
+from SmartVoyage.utils.resources import resources
+
+conf = Config()
+
+
+# 单个会话的状态：轮次存储 + 串行锁（同一会话的请求按顺序处理）
+class Session:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.turn_store = TurnStore()
+        self.lock = asyncio.Lock()
+        self.last_active = time.monotonic()
+
+
+# 会话管理器：按会话ID隔离状态，超过容量时淘汰最久未活跃的会话，空闲过久的会话自动清理
+class SessionManager:
+    def __init__(self, max_sessions=None, idle_timeout=None):
+        self.max_sessions = max_sessions or conf.service_max_sessions
+        self.idle_timeout = idle_timeout or conf.service_session_idle_timeout
+        self.sessions = OrderedDict()
+
+    def get_or_create(self, session_id=None):
+        self.evict_idle()
+        session_id = session_id or str(uuid.uuid4())
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = Session(session_id)
+            self.sessions[session_id] = session
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        self.sessions.move_to_end(session_id)
+        session.last_active = time.monotonic()
+        return session
+
+    def evict_idle(self):
+        now = time.monotonic()
+        # 会话按活跃时间排序，从最旧的开始检查
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if now - session.last_active <= self.idle_timeout:
+                break
+            self.sessions.popitem(last=False)
+
+    def remove(self, session_id):
+        return self.sessions.pop(session_id, None) is not None
+
+
+# 共享资源：所有会话共用一个LLM、一个代理网络和编排运行时
+runtime = None
+llm = None
+agent_network = None
+sessions = SessionManager()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global runtime, llm, agent_network
+    runtime = get_runtime()
+    agent_network = runtime.create_network("旅行助手网络", conf.agent_urls)
+    llm = resources.get("llm")
+    # 启动模式为eager时在开始服务前导入python_a2a、构建全部资源；lazy时在后台预导入并构建实体词典
+    if conf.startup_mode == "eager":
+        resources.warm(modules=["python_a2a"])
+    else:
+        resources.prefetch(["python_a2a"], ["entity_dictionary"])
+    resources.mark("资源就绪")
+    resources.print_profile("编排服务")
+    logger.info("编排服务已启动")
+    yield
+    runtime.shutdown()
+
+
+app = FastAPI(title="SmartVoyage Orchestrator", lifespan=lifespan)
+
+
+class ChatRequest(BaseModel):
+    message: str
+    session_id: Optional[str] = None
+
+
+class ChatResponse(BaseModel):
+    session_id: str
+    response: str
+    intents: list = []
+    routed_agents: list = []
+
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):
+    prompt = request.message.strip()
+    if not prompt:
+        raise HTTPException(status_code=400, detail="message不能为空")
+    session = sessions.get_or_create(request.session_id)
+    async with session.lock:
+        try:
+            # 在编排运行时的常驻事件循环中处理本轮对话，共享代理长连接池
+            response, intents, routed_agents = await asyncio.wrap_future(
+                runtime.submit(handle_turn(prompt, session.turn_store, llm, agent_network)))
+        except json.JSONDecodeError as json_err:
+            logger.error(f"意图识别JSON解析失败")
+            response, intents, routed_agents = f"意图识别JSON解析失败：{str(json_err)}。请重试。", [], []
+        except Exception as e:
+            logger.error(f"处理异常: {str(e)}")
+            response, intents, routed_agents = f"处理失败：{str(e)}。请重试。", [], []
+    return ChatResponse(session_id=session.session_id, response=response, intents=intents,
+                        routed_agents=routed_agents)
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not sessions.remove(session_id):
+        raise HTTPException(status_code=404, detail="会话不存在")
+    return {"status": "deleted"}
+
+
+@app.get("/stats")
+async def stats():
+    return {"sessions": len(sessions.sessions), "pools": runtime.pool_stats(),
+            "agents": agent_network.registry_stats(), "intent_cache": intent_cache.stats(),
+            "fast_intent": fast_classifier.stats(), "speculation": speculation_stats.stats()}
+
+
+# LLM调用指标：各阶段耗时分位数、token用量，以及每轮耗时与token
+@app.get("/metrics")
+async def llm_metrics():
+    return metrics.summary()
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=conf.service_host, port=conf.service_port)
@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+from SmartVoyage.config import Config
+from SmartVoyage.create_logger import logger
+from SmartVoyage.orchestrator.fast_intent import INTENT_KEYWORDS, LLM_ONLY_KEYWORDS
+
+conf = Config()
+
+
+# 廉价的意图预测：只靠关键词，恰好命中一个查询类意图时才预测；订票有副作用，永不预测
+def predict_intent(prompt):
+    if LLM_ONLY_KEYWORDS.search(prompt):
+        return None
+    matched = [intent for intent, pattern in INTENT_KEYWORDS.items() if pattern.search(prompt)]
+    return matched[0] if len(matched) == 1 else None
+
+
+# 预测执行统计：预测次数、命中次数、取消次数、累计节省的延迟
+class SpeculationStats:
+    def __init__(self):
+        self.attempts = 0
+        self.hits = 0
+        self.cancelled = 0
+        self.saved_seconds = 0.0
+
+    def record_hit(self, saved):
+        self.hits += 1
+        self.saved_seconds += saved
+
+    def stats(self):
+        return {"attempts": self.attempts, "hits": self.hits, "cancelled": self.cancelled,
+                "accuracy": round(self.hits / self.attempts, 4) if self.attempts else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "avg_saved_seconds": round(self.saved_seconds / self.hits, 3) if self.hits else 0.0}
+
+
+speculation_stats = SpeculationStats()
+
+
+# 一次预测执行：与意图识别并发运行的代理分支
+class Speculation:
+    def __init__(self, intent, coro):
+        self.intent = intent
+        self.started = time.monotonic()
+        self.finished = None
+        self.task = asyncio.ensure_future(coro)
+        self.task.add_done_callback(self._on_done)
+        speculation_stats.attempts += 1
+
+    def _on_done(self, task):
+        self.finished = time.monotonic()
+
+    def accept(self, intents, follow_up_message, intent_seconds):
+        '''
+        意图识别完成后判断预测是否成立：成立则保留预测任务，否则取消
+        :param intents: 意图识别得到的意图列表
+        :param follow_up_message: 追问消息，非空时本轮不调用代理
+        :param intent_seconds: 意图识别耗时（秒）
+        :return: 预测成立时返回 {intent: 预测任务}，否则返回None
+        '''
+        if intents == [self.intent] and not follow_up_message:
+            # 串行耗时 = 意图识别 + 代理分支，并发后节省两者中较短的部分；代理分支尚未结束时按已运行时间计
+            branch_seconds = (self.finished or time.monotonic()) - self.started
+            saved = min(intent_seconds, branch_seconds)
+            speculation_stats.record_hit(saved)
+            logger.info(f"预测执行命中：{self.intent}，节省约 {saved:.2f}s")
+            return {self.intent: self.task}
+        self.cancel()
+        logger.info(f"预测执行未命中：预测 {self.intent}，实际 {intents}，已取消")
+        return None
+
+    def cancel(self):
+        if not self.task.done():
+            self.task.cancel()
+        speculation_stats.cancelled += 1
@@ -0,0 +1,130 @@
+import re
+from collections import deque
+
+from SmartVoyage.config import Config
+from SmartVoyage.utils.date_resolver import resolve_dates
+
+conf = Config()
+
+# 槽位的中文名称，按渲染顺序排列
+SLOT_LABELS = {
+    "city": "城市",
+    "departure_city": "出发城市",
+    "arrival_city": "到达城市",
+    "artist": "艺人",
+    "start_date": "开始日期",
+    "end_date": "结束日期",
+    "ticket_type": "票务类型",
+    "seat_type": "座位类型",
+}
+SEAT_PATTERN = re.compile(r"二等座|一等座|商务座|硬卧|软卧|硬座|无座|经济舱|公务舱|商务舱|头等舱|VIP|看台|内场")
+DIRECTION_PATTERN = re.compile(r"到|至|去|飞往|飞|往|-|—|→")
+
+
+# 粗略估算token数：中文字符按1个token，其余字符按4个字符1个token
+def estimate_tokens(text):
+    cjk = len(re.findall(r"[一-鿿]", text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+# 单轮对话
+class Turn:
+    __slots__ = ("role", "text", "intents")
+
+    def __init__(self, role, text, intents=None):
+        self.role = role  # User / Assistant
+        self.text = text
+        self.intents = intents or []
+
+    # 渲染为一行，助手的长回复截断，避免整段回复进入后续提示词
+    def render(self, max_chars):
+        text = " ".join(self.text.split())
+        if self.role == "Assistant" and len(text) > max_chars:
+            text = text[:max_chars] + "…"
+        return f"{self.role}: {text}"
+
+
+# 会话轮次存储：固定容量的环形缓冲区 + 槽位记忆，渲染时受token预算约束
+class TurnStore:
+    def __init__(self, max_turns=None, token_budget=None, reply_max_chars=None):
+        self.turns = deque(maxlen=max_turns or conf.turn_store_max_turns)
+        self.token_budget = token_budget or conf.history_token_budget
+        self.reply_max_chars = reply_max_chars or conf.history_reply_max_chars
+        self.slots = {}
+        # 最近一轮分页查询：{"intent", "current": 取得本页所用的翻页令牌（第一页为None）, "next": 下一页的翻页令牌}
+        self.page = None
+
+    def add_user(self, text):
+        self.turns.append(Turn("User", text))
+
+    def add_assistant(self, text):
+        self.turns.append(Turn("Assistant", text))
+
+    # 记录代理返回的一页结果，供“下一页”追问和从当前页订票使用
+    def set_page(self, intent, current, next_token):
+        self.page = {"intent": intent, "current": current, "next": next_token}
+
+    def remember(self, intents, user_queries, dictionary=None):
+        '''
+        根据意图识别结果更新最近一轮用户输入的意图及槽位记忆
+        :param intents: 意图列表
+        :param user_queries: 改写后的问题，已整合上下文，适合用来抽取槽位
+        :param dictionary: 城市/艺人词典（EntityDictionary），为空时只抽取日期和票务类型
+        '''
+        if self.turns and self.turns[-1].role == "User":
+            self.turns[-1].intents = list(intents)
+        for intent, query in user_queries.items():
+            if not isinstance(query, str):
+                continue
+            if intent in ("train", "flight", "concert"):
+                self.slots["ticket_type"] = intent
+            dates = resolve_dates(query)
+            if dates:
+                self.slots["start_date"], self.slots["end_date"] = dates
+            seat = SEAT_PATTERN.search(query)
+            if seat:
+                self.slots["seat_type"] = seat.group(0)
+            if dictionary is None:
+                continue
+            cities = dictionary.find_cities(query)
+            if intent in ("train", "flight", "order") and len(cities) == 2:
+                between = query[cities[0][1]:cities[1][0]]
+                if DIRECTION_PATTERN.search(between):
+                    self.slots["departure_city"], self.slots["arrival_city"] = cities[0][2], cities[1][2]
+            elif len(cities) == 1:
+                self.slots["city"] = cities[0][2]
+            artists = dictionary.find_artists(query)
+            if len(artists) == 1:
+                self.slots["artist"] = artists[0][2]
+
+    def render_slots(self):
+        items = [f"{label}={self.slots[key]}" for key, label in SLOT_LABELS.items() if self.slots.get(key)]
+        return "已知信息：" + "，".join(items) if items else ""
+
+    def render(self, max_lines=6, skip_last=0):
+        '''
+        渲染最近的对话历史，供提示词使用
+        :param max_lines: 最多渲染的轮次数
+        :param skip_last: 跳过最近的几轮（例如不包含本轮用户问题）
+        :return: 以换行分隔的历史文本，首行为槽位记忆，总长度不超过token预算
+        '''
+        end = len(self.turns) - skip_last
+        start = max(0, end - max_lines)
+        lines = [self.turns[i].render(self.reply_max_chars) for i in range(start, end)]
+        slot_line = self.render_slots()
+        budget = self.token_budget - estimate_tokens(slot_line)
+        # 从最近的轮次往前保留，超出预算的旧轮次丢弃
+        kept, used = [], 0
+        for line in reversed(lines):
+            cost = estimate_tokens(line)
+            if kept and used + cost > budget:
+                break
+            kept.append(line)
+            used += cost
+        kept.reverse()
+        if slot_line:
+            kept.insert(0, slot_line)
+        return "\n".join(kept)
+
+    def __len__(self):
+        return len(self.turns)
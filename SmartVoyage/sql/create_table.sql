@@ -15,7 +15,8 @@ CREATE TABLE train_tickets (
     remaining_seats INT NOT NULL COMMENT '剩余座位数（如 50）',
     price DECIMAL(10, 2) NOT NULL COMMENT '票价（如 553.50）',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间，自动记录插入时间',
-    UNIQUE KEY unique_train (departure_time, train_number) -- 唯一约束，确保同一时间和车次不重复
+    UNIQUE KEY unique_train (departure_time, train_number), -- 唯一约束，确保同一时间和车次不重复
+    KEY idx_train_route (departure_city, arrival_city, departure_time) -- 线路查询索引：出发城市、到达城市等值 + 出发时间区间
 ) COMMENT='火车票信息表';
 
 -- 机票表
@@ -31,7 +32,8 @@ CREATE TABLE flight_tickets (
     remaining_seats INT NOT NULL COMMENT '剩余座位数（如 10）',
     price DECIMAL(10, 2) NOT NULL COMMENT '票价（如 1200.00）',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间，自动记录插入时间',
-    UNIQUE KEY unique_flight (departure_time, flight_number) -- 唯一约束，确保同一时间和航班号不重复
+    UNIQUE KEY unique_flight (departure_time, flight_number), -- 唯一约束，确保同一时间和航班号不重复
+    KEY idx_flight_route (departure_city, arrival_city, departure_time) -- 线路查询索引：出发城市、到达城市等值 + 出发时间区间
 ) COMMENT='航班机票信息表';
 
 -- 演唱会票表
@@ -47,7 +49,8 @@ CREATE TABLE concert_tickets (
     remaining_seats INT NOT NULL COMMENT '剩余座位数（如 100）',
     price DECIMAL(10, 2) NOT NULL COMMENT '票价（如 880.00）',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间，自动记录插入时间',
-    UNIQUE KEY unique_concert (start_time, artist, ticket_type) -- 唯一约束，确保同一时间、艺人和票类型不重复
+    UNIQUE KEY unique_concert (start_time, artist, ticket_type), -- 唯一约束，确保同一时间、艺人和票类型不重复
+    KEY idx_concert_city_artist (city, artist, start_time) -- 演唱会查询索引：城市、艺人等值 + 开始时间区间
 ) COMMENT='演唱会门票信息表';
 
 -- 天气数据表
@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import time
+
+from SmartVoyage.config import Config
+from SmartVoyage.utils.mcp_pool import LOCAL_MCP_SERVERS, McpSessionPool, http_transport, local_transport
+from SmartVoyage.utils.metrics import percentile
+from SmartVoyage.utils.resources import lazy_import
+
+conf = Config()
+
+# 各MCP服务的基准调用：(工具名称, 参数)
+BENCH_CALLS = {
+    "weather": ("query_weather_range", {"city": "北京", "start_date": "2025-10-28", "end_date": "2025-10-30"}),
+    "ticket": ("query_tickets", {"sql": "SELECT * FROM train_tickets WHERE departure_city = '北京' "
+                                        "AND arrival_city = '上海' LIMIT 10"}),
+}
+
+
+# 事件循环延迟：每10ms醒来一次，记录实际醒来时间比预期晚了多少；工具在循环中阻塞时延迟接近单次查询耗时
+async def loop_lag(lags, interval=0.01):
+    while True:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+
+async def bench(pool, tool_name, arguments, requests, concurrency):
+    '''
+    通过会话池重复调用同一个工具
+    :return: (首次调用耗时, 各次调用耗时列表, 总耗时, 事件循环延迟列表)，首次调用包含建立会话的握手
+    '''
+    start = time.perf_counter()
+    await pool.run(lambda session: session.call_tool(tool_name, arguments))
+    first = time.perf_counter() - start
+
+    latencies, lags = [], []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await pool.run(lambda session: session.call_tool(tool_name, arguments))
+            latencies.append(time.perf_counter() - started)
+
+    ticker = asyncio.ensure_future(loop_lag(lags))
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    total = time.perf_counter() - start
+    ticker.cancel()
+    await pool.close()
+    return first, latencies, total, lags
+
+
+def report(label, first, latencies, total, lags):
+    print(f"{label:<14} 首次 {first * 1000:8.2f}ms  p50 {percentile(latencies, 50) * 1000:7.2f}ms  "
+          f"p95 {percentile(latencies, 95) * 1000:7.2f}ms  p99 {percentile(latencies, 99) * 1000:7.2f}ms  "
+          f"吞吐 {len(latencies) / total:8.1f} 次/秒  循环延迟max {max(lags, default=0.0) * 1000:7.2f}ms")
+
+
+async def main(service, requests, concurrency):
+    tool_name, arguments = BENCH_CALLS[service]
+    module_name, factory = LOCAL_MCP_SERVERS[service]
+    server = getattr(lazy_import(module_name), factory)()
+    url = conf.mcp_urls[service]
+
+    print(f"=== MCP传输对比：{service}.{tool_name}，{requests} 次调用 ===")
+    # 串行与并发各测一次：进程内传输时工具的数据库查询在工作线程中执行，并发时吞吐应随并发数提升，循环延迟保持在毫秒级
+    for level in sorted({1, concurrency}):
+        # 远程：需要先启动对应的MCP服务（mcp_server 目录下的脚本）
+        try:
+            report(f"http 并发{level}", *await bench(McpSessionPool(url, lambda: http_transport(url)), tool_name,
+                                                  arguments, requests, level))
+        except Exception as e:
+            print(f"http 并发{level}  调用失败，请确认 {url} 已启动: {e}")
+        report(f"local 并发{level}", *await bench(McpSessionPool(f"local://{service}", lambda: local_transport(server)),
+                                               tool_name, arguments, requests, level))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比MCP工具的远程HTTP调用与进程内调用")
+    parser.add_argument("--service", choices=sorted(BENCH_CALLS), default="weather")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=conf.mcp_pool_size)
+    args = parser.parse_args()
+    asyncio.run(main(args.service, args.requests, args.concurrency))
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+from python_a2a import A2AConnectionError
+
+from SmartVoyage.orchestrator import dispatcher
+from SmartVoyage.orchestrator.registry import CLOSED, HALF_OPEN, OPEN, AgentRegistry, CircuitBreaker
+
+AGENT = "TicketQueryAssistant"
+
+
+class StubAgent:
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.agent_card = None
+
+    async def send_task_async(self, task):
+        return await self.behaviour()
+
+
+def make_registry(behaviour):
+    registry = AgentRegistry("test", runtime=None)
+    registry.register(AGENT, "http://agent", StubAgent(behaviour))
+    return registry
+
+
+def fetch(registry):
+    return dispatcher.fetch_agent_result("train", AGENT, "q", "", None, registry)
+
+
+@pytest.fixture(autouse=True)
+def degraded(monkeypatch):
+    async def degraded_branch(agent_name, query_str, llm):
+        return "degraded"
+    monkeypatch.setattr(dispatcher, "degraded_branch", degraded_branch)
+
+
+# 取消（预测执行未命中、分支超时）不计为失败，多次取消也不会熔断
+def test_cancel_does_not_count_as_failure():
+    async def slow():
+        await asyncio.sleep(10)
+    registry = make_registry(slow)
+    breaker = registry.breakers[AGENT]
+
+    async def main():
+        for _ in range(breaker.failure_threshold + 1):
+            task = asyncio.ensure_future(fetch(registry))
+            await asyncio.sleep(0)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        # 分支超时：wait_for 取消内部调用
+        assert "超时" in await dispatcher.guarded_branch("train", fetch(registry), 0.01)
+    asyncio.run(main())
+    assert breaker.state == CLOSED and breaker.failures == 0
+
+
+# 连接失败与真实超时计入熔断
+def test_connection_errors_and_timeouts_open_the_circuit():
+    async def refused():
+        raise A2AConnectionError("refused")
+
+    async def timeout():
+        raise asyncio.TimeoutError()
+    registry = make_registry(refused)
+    breaker = registry.breakers[AGENT]
+    assert asyncio.run(fetch(registry)) == "degraded"
+    registry.agents[AGENT] = StubAgent(timeout)
+    for _ in range(breaker.failure_threshold - 1):
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(fetch(registry))
+    assert breaker.state == OPEN
+    assert asyncio.run(fetch(registry)) == "degraded"  # 熔断中直接降级
+    assert breaker.stats["rejected"] == 1
+
+
+# 半开试探被取消时归还试探名额，下一次请求仍可试探
+def test_cancelled_half_open_probe_releases_slot():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    assert not breaker.allow()
+    breaker.opened_at -= 60
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()  # 试探请求未返回时拒绝其他请求
+    breaker.release()
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+# 健康探测成功不直接关闭熔断，而是放行一次真实请求试探；试探失败重新熔断
+def test_probe_success_goes_through_half_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_probe_success()
+    assert breaker.state == OPEN
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
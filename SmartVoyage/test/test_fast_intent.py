@@ -0,0 +1,94 @@
+from datetime import date
+
+import pytest
+
+from SmartVoyage.orchestrator.fast_intent import FastIntentClassifier
+from SmartVoyage.utils.entity_resolver import EntityDictionary
+
+TODAY = date(2025, 10, 20)
+
+
+@pytest.fixture
+def classifier():
+    return FastIntentClassifier(EntityDictionary(["北京", "南京", "上海"], ["周杰伦"]), threshold=0.8)
+
+
+@pytest.fixture
+def resolving_classifier():
+    aliases = {"city": {"帝都": "北京", "魔都": "上海", "京": "北京"}, "artist": {"周董": "周杰伦"}}
+    dictionary = EntityDictionary(["北京", "南京", "上海", "哈尔滨", "乌鲁木齐"], ["周杰伦"], aliases)
+    return FastIntentClassifier(dictionary, threshold=0.8)
+
+
+# 改写无法保留的条件（否定、价格、时段、车次、余票、其他剩余文字）都回退到LLM
+@pytest.mark.parametrize("query", [
+    "南京到北京 明天 高铁 不要二等座",
+    "最便宜的南京到北京明天高铁",
+    "明天下午的南京到北京高铁",
+    "G1次 南京到北京 明天",
+    "南京到北京明天高铁有余票吗",
+    "明天上海到北京的火车靠窗",
+    "北京明天天气适合跑步吗",
+])
+def test_unpreserved_constraints_fall_back_to_llm(classifier, query):
+    assert classifier.try_resolve(query, TODAY) is None
+
+
+def test_plain_queries_resolve(classifier):
+    assert classifier.try_resolve("南京到北京 明天 高铁 二等座", TODAY) == (
+        ["train"], {"train": "查询2025-10-21从南京到北京的火车票，二等座"}, "")
+    assert classifier.try_resolve("帮我查一下明天从上海飞北京的机票", TODAY) == (
+        ["flight"], {"flight": "查询2025-10-21从上海到北京的机票"}, "")
+    assert classifier.try_resolve("今晚北京下雨吗", TODAY) == (
+        ["weather"], {"weather": "查询北京2025-10-20的天气"}, "")
+
+
+# 词典在后台线程中加载，加载完成前不阻塞调用方，本轮交给LLM；加载完成后走快速通道
+def test_dictionary_loads_in_background(monkeypatch):
+    import threading
+
+    from SmartVoyage.orchestrator import fast_intent
+    from SmartVoyage.utils.resources import ResourceRegistry
+
+    release = threading.Event()
+
+    def load():
+        release.wait(5)
+        return EntityDictionary(["北京"])
+
+    registry = ResourceRegistry()
+    registry.register("entity_dictionary", load)
+    monkeypatch.setattr(fast_intent, "resources", registry)
+    classifier = FastIntentClassifier(threshold=0.8)
+
+    assert classifier.try_resolve("今晚北京下雨吗", TODAY) is None
+    release.set()
+    registry.get("entity_dictionary")
+    assert classifier.try_resolve("今晚北京下雨吗", TODAY) == (["weather"], {"weather": "查询北京2025-10-20的天气"}, "")
+
+
+# 词典与实体解析器规则一致：别名、拼音、三个字及以上名称的错别字都解析为规范取值
+def test_alias_resolution(resolving_classifier):
+    assert resolving_classifier.dictionary.find_cities("帝都到魔都") == [(0, 2, "北京"), (3, 5, "上海")]
+    assert resolving_classifier.try_resolve("明天帝都到魔都的高铁", TODAY) == (
+        ["train"], {"train": "查询2025-10-21从北京到上海的火车票"}, "")
+    assert resolving_classifier.try_resolve("明天上海周董演唱会", TODAY) == (
+        ["concert"], {"concert": "查询2025-10-21上海周杰伦的演唱会门票"}, "")
+
+
+def test_pinyin_resolution(resolving_classifier):
+    assert resolving_classifier.try_resolve("明天beijing到Shanghai的高铁", TODAY) == (
+        ["train"], {"train": "查询2025-10-21从北京到上海的火车票"}, "")
+    # 拼音错一个字母
+    assert resolving_classifier.try_resolve("今天shangai天气", TODAY) == (
+        ["weather"], {"weather": "查询上海2025-10-20的天气"}, "")
+
+
+def test_edit_distance_resolution(resolving_classifier):
+    assert resolving_classifier.try_resolve("明天哈尔宾天气", TODAY) == (
+        ["weather"], {"weather": "查询哈尔滨2025-10-21的天气"}, "")
+    assert resolving_classifier.try_resolve("乌鲁木其到北京明天的火车", TODAY) == (
+        ["train"], {"train": "查询2025-10-21从乌鲁木齐到北京的火车票"}, "")
+    # 两个字的名称不容忍错别字，单字别名不在句子中匹配（“南京”中的“京”不是北京）
+    assert resolving_classifier.try_resolve("明天北经天气", TODAY) is None
+    assert resolving_classifier.dictionary.find_cities("南京到北京") == [(0, 2, "南京"), (3, 5, "北京")]
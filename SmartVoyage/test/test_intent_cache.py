@@ -0,0 +1,101 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from SmartVoyage.orchestrator import intent
+from SmartVoyage.utils import cache
+from SmartVoyage.utils.cache import DailyLRUCache, next_midnight_timestamp
+from SmartVoyage.utils.date_resolver import shanghai_tz
+
+
+def shanghai(*args):
+    return shanghai_tz().localize(datetime(*args))
+
+
+# 缓存键：问题归一化（全角、空白、句末标点、大小写），历史窗口按内容哈希，日期原样参与
+def test_intent_cache_key():
+    history = "User: 北京明天天气\nAssistant: 晴。"
+    key = intent.intent_cache_key("明天北京到上海的  高铁？", history, "2025-10-20")
+    assert key == intent.intent_cache_key("明天北京到上海的 高铁", history, "2025-10-20")
+    assert key == intent.intent_cache_key("明天北京到上海的　高铁?", history, "2025-10-20")
+    assert key[0] == "明天北京到上海的 高铁"
+    assert key != intent.intent_cache_key("明天北京到上海的 高铁", history + "\nUser: 那后天呢", "2025-10-20")
+    assert key != intent.intent_cache_key("明天北京到上海的 高铁", history, "2025-10-21")
+
+
+# 同一问题、同一历史窗口当天只调用一次LLM；跨天后相对日期要重新换算，重新调用
+def test_intent_cache_hits_within_day_and_misses_after_rollover(monkeypatch):
+    monkeypatch.setattr(intent.conf, "fast_intent_enabled", False)
+    monkeypatch.setattr(intent.conf, "intent_cache_enabled", True)
+    monkeypatch.setattr(intent, "intent_cache", DailyLRUCache(maxsize=8))
+    calls = []
+
+    def respond(prompt):
+        calls.append(prompt.to_string())
+        return AIMessage(content=json.dumps({"intents": ["weather"], "user_queries": {"weather": "北京明天天气"},
+                                             "follow_up_message": ""}, ensure_ascii=False))
+
+    llm = RunnableLambda(respond)
+    history = "User: 北京明天天气"
+    day1 = shanghai(2025, 10, 20, 23, 59)
+    expected = (["weather"], {"weather": "北京明天天气"}, "")
+    assert asyncio.run(intent._recognize("北京明天天气", history, day1, llm)) == expected
+    assert asyncio.run(intent._recognize("北京明天天气？", history, day1, llm)) == expected
+    assert len(calls) == 1
+    asyncio.run(intent._recognize("北京明天天气", history, day1 + timedelta(minutes=2), llm))
+    assert len(calls) == 2
+    assert "2025-10-21" in calls[1]
+    asyncio.run(intent._recognize("北京明天天气", "User: 上海呢", day1, llm))
+    assert len(calls) == 3
+
+
+def test_next_midnight_timestamp():
+    assert next_midnight_timestamp(shanghai(2025, 10, 20, 23, 59, 59)) == shanghai(2025, 10, 21).timestamp()
+    assert next_midnight_timestamp(shanghai(2025, 10, 21)) == shanghai(2025, 10, 22).timestamp()
+
+
+# 条目在上海时间零点统一过期，与写入时刻无关
+def test_daily_cache_expires_at_midnight(monkeypatch):
+    clock = [shanghai(2025, 10, 20, 23, 59, 58).timestamp()]
+    monkeypatch.setattr(cache, "time", SimpleNamespace(time=lambda: clock[0]))
+    monkeypatch.setattr(cache, "next_midnight_timestamp", lambda now=None: shanghai(2025, 10, 21).timestamp())
+    daily = DailyLRUCache(maxsize=8)
+    daily.set("k", "v")
+    clock[0] += 1
+    assert daily.get("k") == "v"
+    clock[0] += 1
+    assert daily.get("k") is None
+    assert len(daily) == 0
+    assert (daily.hits, daily.misses) == (1, 1)
+
+
+def test_daily_cache_ttl_caps_lifetime(monkeypatch):
+    clock = [shanghai(2025, 10, 20, 12).timestamp()]
+    monkeypatch.setattr(cache, "time", SimpleNamespace(time=lambda: clock[0]))
+    daily = DailyLRUCache(maxsize=8, ttl=60)
+    daily.set("k", "v")
+    clock[0] += 59
+    assert daily.get("k") == "v"
+    clock[0] += 1
+    assert daily.get("k") is None
+
+
+# 超出容量时淘汰最久未使用的条目，读取会刷新使用顺序
+def test_daily_cache_lru_eviction():
+    daily = DailyLRUCache(maxsize=2)
+    daily.set("a", 1)
+    daily.set("b", 2)
+    assert daily.get("a") == 1
+    daily.set("c", 3)
+    assert daily.get("b") is None
+    assert (daily.get("a"), daily.get("c")) == (1, 3)
+    daily.set("a", 10)
+    daily.set("d", 4)
+    assert daily.get("c") is None
+    assert (daily.get("a"), daily.get("d")) == (10, 4)
+    assert daily.stats()["evictions"] == 2
+    assert daily.stats()["size"] == 2
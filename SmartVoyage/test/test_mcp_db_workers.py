@@ -0,0 +1,54 @@
+import asyncio
+import threading
+import time
+
+from mcp.server.fastmcp import FastMCP
+
+from SmartVoyage.mcp_server.db_workers import DbWorkers
+from SmartVoyage.utils.mcp_pool import McpSessionPool, local_transport
+
+
+# 进程内传输时，慢查询在工作线程中执行：并发调用互不等待，事件循环不被阻塞，每个工作线程各用一条连接
+def test_blocking_queries_run_off_the_loop():
+    connections = []
+
+    def connect():
+        connections.append(threading.get_ident())
+        return object()
+
+    workers = DbWorkers(connect, size=4)
+    server = FastMCP(name="SlowTools", log_level="ERROR")
+
+    def slow_query():
+        conn = workers.conn
+        time.sleep(0.2)
+        return str(id(conn))
+
+    @server.tool(name="slow")
+    async def slow() -> str:
+        return await workers.run(slow_query)
+
+    async def main():
+        pool = McpSessionPool("local://slow", lambda: local_transport(server), size=4)
+        await pool.run(lambda session: session.send_ping())
+        lags = []
+
+        async def ticker():
+            while True:
+                expected = time.perf_counter() + 0.01
+                await asyncio.sleep(0.01)
+                lags.append(time.perf_counter() - expected)
+        tick = asyncio.ensure_future(ticker())
+        start = time.perf_counter()
+        results = await asyncio.gather(*(pool.run(lambda session: session.call_tool("slow", {}))
+                                         for _ in range(4)))
+        elapsed = time.perf_counter() - start
+        tick.cancel()
+        await pool.close()
+        return results, elapsed, lags
+
+    results, elapsed, lags = asyncio.run(main())
+    assert not any(result.isError for result in results)
+    assert elapsed < 0.6  # 串行执行需要0.8秒
+    assert max(lags) < 0.1
+    assert len(connections) == len(set(connections)) == len({r.content[0].text for r in results})
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+from mcp.server.fastmcp import FastMCP
+
+from SmartVoyage.utils import mcp_pool
+from SmartVoyage.utils.metrics import _current_turn, track_turn
+
+
+@pytest.fixture
+def runtime(monkeypatch):
+    server = FastMCP(name="EchoTools", log_level="ERROR")
+    server.calls = []
+
+    @server.tool(name="echo")
+    async def echo(text: str, delay: float = 0) -> str:
+        server.calls.append(asyncio.get_running_loop())
+        await asyncio.sleep(delay)
+        return text
+    monkeypatch.setattr(mcp_pool, "mcp_transport",
+                        lambda name: (f"local://{name}", lambda: mcp_pool.local_transport(server)))
+    runtime = mcp_pool.McpRuntime()
+    runtime.server = server
+    return runtime
+
+
+# MCP调用在调用方的事件循环中执行，调用方的上下文（本轮明细）在调用期间保持不变
+def test_calls_run_on_the_callers_loop(runtime):
+    async def main():
+        with track_turn() as turn:
+            result = await runtime.call("echo", lambda session: session.call_tool("echo", {"text": "hi"}))
+            assert _current_turn.get() is turn
+        await runtime.shutdown()
+        return result, asyncio.get_running_loop()
+    result, loop = asyncio.run(main())
+    assert result.content[0].text == "hi"
+    assert runtime.server.calls == [loop]
+
+
+# 截止时间到期时直接取消进行中的MCP请求，会话被丢弃，之后的调用重新建立会话
+def test_deadline_cancels_the_call(runtime):
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(runtime.call("echo", lambda session: session.call_tool(
+                "echo", {"text": "slow", "delay": 5})), 0.2)
+        result = await runtime.call("echo", lambda session: session.call_tool("echo", {"text": "fast"}))
+        stats = runtime.pool_stats()["local://echo"]
+        await runtime.shutdown()
+        return result, stats
+    result, stats = asyncio.run(main())
+    assert result.content[0].text == "fast"
+    assert stats["calls"] == 2 and stats["opens"] == 2
+
+
+# 在新的事件循环中调用时重建会话池
+def test_pools_follow_the_running_loop(runtime):
+    async def main():
+        result = await runtime.call("echo", lambda session: session.call_tool("echo", {"text": "x"}))
+        return result.content[0].text, runtime.get_pool("echo")
+    first, first_pool = asyncio.run(main())
+    second, second_pool = asyncio.run(main())
+    assert first == second == "x"
+    assert first_pool is not second_pool
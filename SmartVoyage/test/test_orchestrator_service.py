@@ -0,0 +1,137 @@
+import asyncio
+import json
+import re
+
+import httpx
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from python_a2a import Task, TaskState, TaskStatus
+
+from SmartVoyage.orchestrator import intent, service
+from SmartVoyage.orchestrator.runtime import OrchestratorRuntime
+
+CITIES = ("北京", "上海", "广州", "深圳")
+
+
+# 代替LLM：意图识别时从问题（追问时从本会话的对话历史）中取城市，总结时原样返回代理结果
+def respond(prompt, config):
+    text = prompt.to_string()
+    if config["metadata"]["stage"] == "intent":
+        query = re.search(r"用户查询：(.*)", text).group(1)
+        history = re.search(r"对话历史：(.*)用户查询：", text, re.S).group(1)
+        city = next((c for c in CITIES if c in query), None)
+        if city is None:
+            city = next(c for c in reversed(re.findall("|".join(CITIES), history)))
+            query = city + query.lstrip("那").rstrip("呢") + "天气"
+        return AIMessage(content=json.dumps({"intents": ["weather"], "user_queries": {"weather": query},
+                                             "follow_up_message": ""}, ensure_ascii=False))
+    return AIMessage(content=re.search(r"^结果：(.*)", text, re.M).group(1))
+
+
+# 代替天气代理：等待一段时间后返回本次查询，记录同时处理中的任务数
+class StubAgent:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+
+    async def send_task_async(self, task):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        query = task.message["content"]["text"].rsplit("User: ", 1)[-1]
+        return Task(id=task.id, status=TaskStatus(state=TaskState.COMPLETED),
+                    artifacts=[{"parts": [{"type": "text", "text": f"天气:{query}"}]}])
+
+
+class StubNetwork:
+    def __init__(self, agent):
+        self.agent = agent
+
+    def get_agent(self, name):
+        assert name == "WeatherQueryAssistant"
+        return self.agent
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    agent = StubAgent()
+    runtime = OrchestratorRuntime()
+    monkeypatch.setattr(intent.conf, "fast_intent_enabled", False)
+    monkeypatch.setattr(intent.conf, "intent_cache_enabled", False)
+    monkeypatch.setattr(service, "runtime", runtime)
+    monkeypatch.setattr(service, "llm", RunnableLambda(respond))
+    monkeypatch.setattr(service, "agent_network", StubNetwork(agent))
+    monkeypatch.setattr(service, "sessions", service.SessionManager(max_sessions=10, idle_timeout=600))
+    yield agent
+    runtime.shutdown()
+
+
+# 不经过lifespan，直接向服务的ASGI应用发送请求
+async def chat(client, message, session_id=None):
+    response = await client.post("/chat", json={"message": message, "session_id": session_id})
+    assert response.status_code == 200
+    return response.json()
+
+
+def run_client(scenario):
+    async def main():
+        transport = httpx.ASGITransport(app=service.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await scenario(client)
+
+    return asyncio.run(main())
+
+
+# 每个会话有各自的对话历史：追问只参考本会话的上文
+def test_session_isolation(agent):
+    async def scenario(client):
+        first = await chat(client, "北京明天天气")
+        second = await chat(client, "上海明天天气")
+        assert first["session_id"] != second["session_id"]
+        follow_a = await chat(client, "那后天呢", first["session_id"])
+        follow_b = await chat(client, "那后天呢", second["session_id"])
+        assert follow_a == {"session_id": first["session_id"], "response": "天气:北京后天天气",
+                            "intents": ["weather"], "routed_agents": ["WeatherQueryAssistant"]}
+        assert follow_b["response"] == "天气:上海后天天气"
+        assert (await client.delete(f"/sessions/{second['session_id']}")).status_code == 200
+        assert (await client.delete(f"/sessions/{second['session_id']}")).status_code == 404
+        return first["session_id"]
+
+    session_id = run_client(scenario)
+    assert list(service.sessions.sessions) == [session_id]
+    turns = service.sessions.sessions[session_id].turn_store.turns
+    assert [turn.text for turn in turns] == ["北京明天天气", "天气:北京明天天气", "那后天呢", "天气:北京后天天气"]
+
+
+# 不同会话的轮次并发处理，代理同时处理各会话的任务
+def test_concurrent_turns_across_sessions(agent):
+    agent.delay = 0.3
+
+    async def scenario(client):
+        return await asyncio.gather(*(chat(client, f"{city}明天天气") for city in CITIES))
+
+    results = run_client(scenario)
+    assert [result["response"] for result in results] == [f"天气:{city}明天天气" for city in CITIES]
+    assert len({result["session_id"] for result in results}) == len(CITIES)
+    assert agent.max_active == len(CITIES)
+
+
+# 同一会话的并发请求按到达顺序串行处理，轮次不会交错
+def test_concurrent_turns_in_one_session_are_serialized(agent):
+    async def scenario(client):
+        session_id = (await chat(client, "北京明天天气"))["session_id"]
+        agent.delay = 0.1
+        await asyncio.gather(chat(client, "广州明天天气", session_id), chat(client, "深圳明天天气", session_id))
+        return session_id
+
+    session_id = run_client(scenario)
+    assert agent.max_active == 1
+    turns = service.sessions.sessions[session_id].turn_store.turns
+    texts = [turn.text for turn in turns]
+    assert [turn.role for turn in turns] == ["User", "Assistant"] * 3
+    assert all(texts[i + 1] == f"天气:{texts[i]}" for i in range(0, len(texts), 2))
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from mcp import types
+
+from SmartVoyage.a2a_server import order_server
+from SmartVoyage.utils.mcp_pool import get_mcp_runtime
+from SmartVoyage.utils.metrics import track_turn
+from SmartVoyage.utils.resources import resources
+
+
+# 工具调用代理需要bind_tools，假模型按顺序返回预设消息，并记录在哪个线程中被调用
+class FakeToolModel(GenericFakeChatModel):
+    threads: list = []
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    async def _agenerate(self, *args, **kwargs):
+        self.threads.append(threading.current_thread().name)
+        return await super()._agenerate(*args, **kwargs)
+
+
+# 代替会话池：记录工具请求在哪个线程中执行
+class StubPool:
+    url = "stub://order"
+
+    def __init__(self):
+        self.threads = []
+
+    async def run(self, fn, retry=True):
+        return await fn(self)
+
+    async def list_tools(self, cursor=None):
+        self.threads.append(threading.current_thread().name)
+        tool = types.Tool(name="order_train", description="预定火车票",
+                          inputSchema={"type": "object", "properties": {"train_number": {"type": "string"}}})
+        return types.ListToolsResult(tools=[tool])
+
+    async def call_tool(self, name, arguments=None):
+        self.threads.append(threading.current_thread().name)
+        return types.CallToolResult(content=[types.TextContent(type="text", text="预定成功")])
+
+
+# 订票代理的LLM调用与工具调用都在服务自己的事件循环中执行，LLM调用计入本次任务的明细
+def test_order_agent_calls_are_tracked(monkeypatch):
+    model = FakeToolModel(messages=iter([
+        AIMessage(content="", tool_calls=[{"name": "order_train", "args": {"train_number": "G1"}, "id": "call-1"}]),
+        AIMessage(content="已为您预定G1次列车"),
+    ]), disable_streaming=True, threads=[])
+    monkeypatch.setitem(resources._instances, "llm", model)
+    runtime, pool = get_mcp_runtime(), StubPool()
+    monkeypatch.setattr(runtime, "get_pool", lambda name: pool)
+
+    async def main():
+        with track_turn("订票任务") as turn:
+            result = await order_server.order_tickets("预定明天G1次火车票")
+        return result, turn
+    result, turn = asyncio.run(main())
+    assert result == {"status": "success", "message": "已为您预定G1次列车"}
+    assert [call["stage"] for call in turn.calls] == ["order_agent", "order_agent"]
+    assert model.threads == ["MainThread", "MainThread"]
+    assert pool.threads == ["MainThread", "MainThread"]
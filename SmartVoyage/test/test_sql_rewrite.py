@@ -0,0 +1,11 @@
+from SmartVoyage.utils.sql_rewrite import rewrite_sql
+
+
+# 改写后的区间条件整体加括号，NOT 与 OR 的作用范围不变
+def test_rewritten_predicates_keep_precedence():
+    sql = "SELECT * FROM weather_data WHERE NOT DATE(fx_date) = '2025-10-01' OR city = '北京'"
+    assert rewrite_sql(sql) == ("SELECT * FROM weather_data WHERE NOT (fx_date >= '2025-10-01' AND "
+                                "fx_date < '2025-10-02') OR city = '北京'")
+    sql = "SELECT * FROM train_tickets WHERE city = '上海' OR DATE(departure_time) BETWEEN '2025-10-01' AND '2025-10-03'"
+    assert rewrite_sql(sql, 100) == ("SELECT * FROM train_tickets WHERE city = '上海' OR (departure_time >= "
+                                     "'2025-10-01' AND departure_time < '2025-10-04') LIMIT 100")
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from SmartVoyage.orchestrator.dispatcher import PendingSummary, summarize_pending
+
+
+# 代替LLM：按调用阶段（llm_config中的stage）返回预设输出，并记录调用过的阶段
+class StubLLM:
+    def __init__(self, batch_output):
+        self.batch_output = batch_output
+        self.stages = []
+        self.runnable = RunnableLambda(self.respond)
+
+    def respond(self, prompt, config):
+        stage = config["metadata"]["stage"]
+        self.stages.append(stage)
+        if stage == "summarize_batch":
+            return AIMessage(content=self.batch_output)
+        return AIMessage(content=f"{stage}：单条总结")
+
+
+PENDINGS = [PendingSummary("weather", "WeatherQueryAssistant", "北京明天天气", "北京 2025-10-21: 晴"),
+            PendingSummary("train", "TicketQueryAssistant", "明天北京到上海的火车票", "G1 北京-上海 二等座 553元")]
+
+
+def summarize(stub, pendings):
+    return asyncio.run(summarize_pending(pendings, stub.runnable, timeout=5))
+
+
+def test_batch_summary_in_one_call():
+    stub = StubLLM('```json\n{"weather": "明天北京晴。", "train": "G1 二等座 553元。"}\n```')
+    assert summarize(stub, PENDINGS) == {"weather": "明天北京晴。", "train": "G1 二等座 553元。"}
+    assert stub.stages == ["summarize_batch"]
+
+
+# 批量总结输出不是JSON、不是对象、缺少意图或意图为空时，回退到逐条总结
+@pytest.mark.parametrize("output", [
+    "明天北京晴，G1二等座553元。",
+    '{"weather": "明天北京晴。", "train": ',
+    '["明天北京晴。", "G1 二等座 553元。"]',
+    '{"weather": "明天北京晴。"}',
+    '{"weather": "明天北京晴。", "train": "  "}',
+])
+def test_malformed_or_partial_batch_falls_back_to_per_intent(output):
+    stub = StubLLM(output)
+    assert summarize(stub, PENDINGS) == {"weather": "summarize_weather：单条总结",
+                                         "train": "summarize_ticket：单条总结"}
+    assert stub.stages[0] == "summarize_batch"
+    assert sorted(stub.stages[1:]) == ["summarize_ticket", "summarize_weather"]
+
+
+def test_single_pending_skips_batch():
+    stub = StubLLM("不应被调用")
+    assert summarize(stub, PENDINGS[:1]) == {"weather": "summarize_weather：单条总结"}
+    assert stub.stages == ["summarize_weather"]
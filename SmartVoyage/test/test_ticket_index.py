@@ -0,0 +1,231 @@
+import json
+import sqlite3
+from datetime import date, datetime
+
+import pytest
+
+from SmartVoyage.mcp_server import mcp_ticket_server
+from SmartVoyage.mcp_server.ticket_index import TICKET_TABLES, TicketIndex
+
+sqlite3.register_converter("DATETIME", lambda value: datetime.fromisoformat(value.decode()))
+
+ROUTE_ROWS = {
+    "train": [
+        (1, "北京", "上海", "2025-11-01 09:00:00", "2025-11-01 13:30:00", "G2", "二等座", 553, 10),
+        (2, "北京", "上海", "2025-11-01 07:00:00", "2025-11-01 11:30:00", "G1", "二等座", 553, 0),
+        (3, "北京", "上海", "2025-11-01 07:00:00", "2025-11-01 11:30:00", "G1", "一等座", 933, 3),
+        (4, "北京", "上海", "2025-11-01 21:00:00", "2025-11-02 07:00:00", "D9", "软卧", 760, 2),
+        (5, "北京", "上海", "2025-11-02 08:00:00", "2025-11-02 12:30:00", "G3", "二等座", 498, 8),
+        (6, "上海", "北京", "2025-11-01 08:00:00", "2025-11-01 12:30:00", "G4", "二等座", 553, 8),
+        (7, "北京", "上海", "2025-11-03 00:00:00", "2025-11-03 04:30:00", "G5", "二等座", 400, 8),
+    ],
+    "flight": [
+        (1, "北京", "上海", "2025-11-01 10:00:00", "2025-11-01 12:10:00", "MU5101", "经济舱", 880, 20),
+        (2, "北京", "上海", "2025-11-01 10:00:00", "2025-11-01 12:10:00", "MU5101", "公务舱", 2600, 4),
+        (3, "北京", "上海", "2025-11-01 06:30:00", "2025-11-01 08:40:00", "CA1501", "经济舱", 640, 9),
+    ],
+}
+
+# 北京 -> 上海 没有直达，可经济南中转一次，或经南京、合肥中转两次
+TRANSFER_ROWS = {
+    "train": [
+        (1, "北京", "济南", "2025-11-01 08:00:00", "2025-11-01 10:00:00", "G11", "二等座", 200, 5),
+        (2, "北京", "济南", "2025-11-01 08:00:00", "2025-11-01 10:00:00", "G11", "一等座", 400, 5),
+        (3, "济南", "上海", "2025-11-01 10:20:00", "2025-11-01 13:00:00", "G12", "二等座", 300, 5),  # 换乘不足30分钟
+        (4, "济南", "上海", "2025-11-01 10:40:00", "2025-11-01 13:30:00", "G13", "二等座", 300, 5),
+        (5, "济南", "上海", "2025-11-01 12:00:00", "2025-11-01 14:30:00", "G14", "二等座", 150, 5),
+        (6, "济南", "上海", "2025-11-01 17:00:00", "2025-11-01 19:00:00", "G15", "二等座", 100, 5),  # 等待超过6小时
+        (7, "济南", "上海", "2025-11-01 11:00:00", "2025-11-01 12:10:00", "G16", "二等座", 50, 0),  # 无余票
+        (8, "北京", "南京", "2025-11-01 08:00:00", "2025-11-01 11:00:00", "G21", "二等座", 300, 5),
+        (9, "南京", "合肥", "2025-11-01 11:40:00", "2025-11-01 12:40:00", "G22", "二等座", 100, 5),
+        (10, "合肥", "上海", "2025-11-01 13:20:00", "2025-11-01 14:00:00", "G23", "二等座", 100, 5),
+    ],
+    "flight": [
+        (1, "济南", "上海", "2025-11-01 11:00:00", "2025-11-01 12:00:00", "MU1", "经济舱", 500, 5),  # 火车转飞机不足2小时
+        (2, "济南", "上海", "2025-11-01 12:30:00", "2025-11-01 13:20:00", "MU2", "经济舱", 600, 5),
+    ],
+}
+
+
+# 票务服务与索引只用到 cursor/execute/fetchall/close，测试中用SQLite代替MySQL：%s 占位符改为 ?
+class SqliteCursor:
+    def __init__(self, cursor, dictionary):
+        self.cursor = cursor
+        self.dictionary = dictionary
+
+    def execute(self, sql, params=None):
+        self.cursor.execute(sql.replace("%s", "?"), params or ())
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        if not self.dictionary:
+            return rows
+        names = [column[0] for column in self.cursor.description]
+        return [dict(zip(names, row)) for row in rows]
+
+    def close(self):
+        self.cursor.close()
+
+
+class SqliteConnection:
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+
+    def cursor(self, dictionary=False, prepared=False):
+        return SqliteCursor(self.conn.cursor(), dictionary)
+
+    def close(self):
+        self.conn.close()
+
+
+def insert(path, kind, rows):
+    table, number_column, seat_column = TICKET_TABLES[kind]
+    with sqlite3.connect(path) as conn:
+        conn.executemany(f"INSERT INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def create_db(path, tables):
+    with sqlite3.connect(path) as conn:
+        for table, number_column, seat_column in TICKET_TABLES.values():
+            conn.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, departure_city TEXT, arrival_city TEXT, "
+                         f"departure_time DATETIME, arrival_time DATETIME, {number_column} TEXT, "
+                         f"{seat_column} TEXT, price REAL, remaining_seats INTEGER)")
+    for kind, rows in tables.items():
+        insert(path, kind, rows)
+    return lambda: SqliteConnection(path)
+
+
+@pytest.fixture
+def route_db(tmp_path):
+    return create_db(str(tmp_path / "routes.db"), ROUTE_ROWS)
+
+
+@pytest.fixture
+def transfer_db(tmp_path):
+    path = str(tmp_path / "transfers.db")
+    return path, create_db(path, TRANSFER_ROWS)
+
+
+def ticket_service(monkeypatch, connect, index_enabled):
+    monkeypatch.setattr(mcp_ticket_server, "connect_db", connect)
+    monkeypatch.setattr(mcp_ticket_server.conf, "ticket_index_enabled", index_enabled)
+    monkeypatch.setattr(mcp_ticket_server.conf, "ticket_index_refresh_interval", 3600)
+    return mcp_ticket_server.TicketService()
+
+
+def numbers(plans):
+    return [[leg.row.number for leg in legs] for legs in plans]
+
+
+# 索引与参数化SQL对同一查询返回相同的结果（字段、顺序）
+@pytest.mark.parametrize("args", [
+    ("train", "北京", "上海", date(2025, 11, 1)),
+    ("train", "北京", "上海", date(2025, 11, 1), date(2025, 11, 3)),
+    ("train", "北京", "上海", date(2025, 11, 1), None, "二等座"),
+    ("train", "北京", "上海", date(2025, 11, 1), date(2025, 11, 2), None, "G1"),
+    ("train", "上海", "北京", date(2025, 11, 1)),
+    ("train", "北京", "广州", date(2025, 11, 1)),
+    ("flight", "北京", "上海", date(2025, 11, 1), None, "经济舱"),
+])
+def test_route_search_matches_sql(monkeypatch, route_db, args):
+    sql_service = ticket_service(monkeypatch, route_db, False)
+    index_service = ticket_service(monkeypatch, route_db, True)
+    assert index_service.index.ready
+    assert json.loads(index_service.search_routes(*args)) == json.loads(sql_service.search_routes(*args))
+    index_service.index.stop()
+
+
+# 分页：逐页比较，翻页游标来自上一页的返回
+@pytest.mark.parametrize("kind, order", [("train", "price"), ("train", "time"), ("flight", "price")])
+def test_route_paging_matches_sql(monkeypatch, route_db, kind, order):
+    sql_service = ticket_service(monkeypatch, route_db, False)
+    index_service = ticket_service(monkeypatch, route_db, True)
+    after, pages = None, 0
+    while True:
+        args = (kind, "北京", "上海", date(2025, 11, 1), date(2025, 11, 3), None, None, order, after, 2)
+        response = json.loads(index_service.search_routes(*args))
+        assert response == json.loads(sql_service.search_routes(*args))
+        if response["status"] != "success" or response["next"] is None:
+            break
+        after, pages = response["next"], pages + 1
+    assert pages == (2 if kind == "train" else 1)
+    index_service.index.stop()
+
+
+def test_index_build_and_refresh(transfer_db):
+    path, connect = transfer_db
+    index = TicketIndex(connect)
+    index.load()
+    assert index.ready
+    assert index.index_stats()["rows"] == {"train": 10, "flight": 2}
+    assert index.index_stats()["transfer_legs"] == 10  # G11两个座位合并为一段，G16无余票
+    assert numbers(index.search_transfers("北京", "上海", date(2025, 11, 1), max_legs=2)) == [
+        ["G11", "MU2"], ["G11", "G13"], ["G11", "G14"]]
+
+    # 增量刷新：新插入的记录进入线路索引（按出发时间排序）和换乘图
+    insert(path, "train", [(11, "济南", "上海", "2025-11-01 10:35:00", "2025-11-01 12:50:00", "G17", "二等座", 250, 5)])
+    assert "G17" not in [row["train_number"] for row in index.search("train", "济南", "上海", date(2025, 11, 1))]
+    index.refresh()
+    assert [row["train_number"] for row in index.search("train", "济南", "上海", date(2025, 11, 1))] == [
+        "G12", "G17", "G13", "G16", "G14", "G15"]
+    assert index.stats["refreshed_rows"] == 1
+    assert numbers(index.search_transfers("北京", "上海", date(2025, 11, 1), max_legs=2))[0] == ["G11", "G17"]
+
+    # 余票变化只在全量重建时同步
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE train_tickets SET remaining_seats = 0 WHERE train_number = 'G17'")
+    index.refresh()
+    assert numbers(index.search_transfers("北京", "上海", date(2025, 11, 1), max_legs=2))[0] == ["G11", "G17"]
+    index.refresh(full=True)
+    assert numbers(index.search_transfers("北京", "上海", date(2025, 11, 1), max_legs=2))[0] == ["G11", "MU2"]
+    assert index.index_stats()["rows"] == {"train": 11, "flight": 2}
+
+
+# 换乘时间：同种交通工具至少30分钟，火车与飞机之间至少2小时，等待不超过6小时
+def test_transfer_min_layover(transfer_db):
+    index = TicketIndex(transfer_db[1])
+    index.load()
+    plans = numbers(index.search_transfers("北京", "上海", date(2025, 11, 1), max_legs=2))
+    assert ["G11", "G12"] not in plans and ["G11", "MU1"] not in plans
+    assert ["G11", "G15"] not in plans and ["G11", "G16"] not in plans
+    relaxed = numbers(index.search_transfers("北京", "上海", date(2025, 11, 1), max_legs=2, min_connection=15,
+                                             mode_change_connection=45))
+    assert relaxed[:2] == [["G11", "MU1"], ["G11", "G12"]]
+
+
+# 最多乘坐段数限制了中转次数；首段只在出发日期当天出发
+def test_transfer_max_legs(transfer_db):
+    index = TicketIndex(transfer_db[1])
+    index.load()
+    assert ["G21", "G22", "G23"] not in numbers(index.search_transfers("北京", "上海", date(2025, 11, 1),
+                                                                       max_legs=2))
+    assert ["G21", "G22", "G23"] in numbers(index.search_transfers("北京", "上海", date(2025, 11, 1), max_legs=3))
+    assert index.search_transfers("北京", "合肥", date(2025, 11, 1), max_legs=1) == []
+    assert index.search_transfers("北京", "上海", date(2025, 11, 2), max_legs=3) == []
+
+
+# k最短路：方案按目标代价从小到大依次产生，最多返回k个
+def test_transfer_k_shortest_order(transfer_db):
+    index = TicketIndex(transfer_db[1])
+    index.load()
+    by_arrival = index.search_transfers("北京", "上海", date(2025, 11, 1), max_legs=3)
+    assert numbers(by_arrival) == [["G11", "MU2"], ["G11", "G13"], ["G21", "G22", "G23"], ["G11", "G14"]]
+    arrivals = [legs[-1].arrival_ts for legs in by_arrival]
+    assert arrivals == sorted(arrivals)
+    # 总价相同时先到达的在前
+    by_price = index.search_transfers("北京", "上海", date(2025, 11, 1), objective="price", max_legs=3)
+    assert numbers(by_price) == [["G11", "G14"], ["G11", "G13"], ["G21", "G22", "G23"], ["G11", "MU2"]]
+    assert [sum(leg.price for leg in legs) for legs in by_price] == [350, 500, 500, 800]
+    assert numbers(index.search_transfers("北京", "上海", date(2025, 11, 1), objective="price", max_legs=3,
+                                          k=2)) == [["G11", "G14"], ["G11", "G13"]]
+
+
+def test_service_transfer_plans(monkeypatch, transfer_db):
+    service = ticket_service(monkeypatch, transfer_db[1], True)
+    response = json.loads(service.search_transfers("北京", "上海", date(2025, 11, 1), "price", 2))
+    plan = response["data"][0]
+    assert [leg["train_number"] for leg in plan["legs"]] == ["G11", "G14"]
+    assert plan["legs"][0]["seat_type"] == "二等座"
+    assert (plan["total_price"], plan["duration_minutes"], plan["transfers"]) == (350, 390, 1)
+    assert json.loads(service.search_transfers("北京", "西安", date(2025, 11, 1)))["status"] == "no_data"
+    service.index.stop()
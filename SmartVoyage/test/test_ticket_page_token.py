@@ -0,0 +1,41 @@
+from SmartVoyage.a2a_server.ticket_server import valid_page_state
+from SmartVoyage.utils import paging
+from SmartVoyage.utils.sql_rewrite import append_order_by, is_single_select
+
+SQL = ("SELECT id, departure_city, arrival_city, departure_time, arrival_time, train_number, seat_type, price, "
+       "remaining_seats FROM train_tickets WHERE departure_city = '北京' AND DATE(departure_time) = '2025-11-01'")
+
+
+# 令牌中的SQL只允许是查询对应票务表的单条SELECT
+def test_page_state_rejects_other_statements():
+    assert valid_page_state({"type": "train", "order": "time", "sql": SQL})
+    assert valid_page_state({"type": "train", "order": "time", "sql": append_order_by(SQL, ["departure_time"])})
+    for sql in ["DELETE FROM train_tickets",
+                SQL + "; DROP TABLE train_tickets",
+                "SELECT * FROM users",
+                "SELECT * FROM train_tickets, users",
+                "SELECT * FROM train_tickets t JOIN users u ON t.id = u.id",
+                "SELECT * FROM train_tickets WHERE id IN (SELECT id FROM users)",
+                "SELECT * FROM train_tickets INTO OUTFILE '/tmp/x'",
+                "SELECT * FROM train_tickets WHERE SLEEP(10)",
+                "SELECT * FROM flight_tickets"]:
+        assert not valid_page_state({"type": "train", "order": "time", "sql": sql}), sql
+    assert not valid_page_state({"type": "hotel", "order": "time", "sql": SQL})
+    assert not valid_page_state({"type": "train", "order": "id", "sql": SQL})
+
+
+def test_string_literals_do_not_affect_validation():
+    assert is_single_select("SELECT * FROM concert_tickets WHERE venue = 'a; DROP -- FROM users'",
+                            {"concert_tickets"})
+
+
+# 未配置签名密钥时使用进程随机密钥签发；换用其他密钥签名的令牌不被接受
+def test_tokens_are_signed(monkeypatch):
+    monkeypatch.setattr(paging.conf, "page_token_secret", "")
+    token = paging.encode_page_token({"type": "train"})
+    assert paging.decode_page_token(token) == {"type": "train"}
+    monkeypatch.setattr(paging.conf, "page_token_secret", "test-secret")
+    assert paging.decode_page_token(token) is None
+    token = paging.encode_page_token({"type": "train"})
+    assert paging.decode_page_token(token) == {"type": "train"}
+    assert paging.decode_page_token(token[:-2] + ("A" if token[-2] != "A" else "B") + token[-1]) is None
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import re
+
+import pytest
+from python_a2a import Task
+
+from SmartVoyage.a2a_server import ticket_server
+from SmartVoyage.orchestrator import dispatcher, pipeline
+from SmartVoyage.orchestrator.turn_store import TurnStore
+from SmartVoyage.utils import entity_resolver
+
+SQL = ("SELECT id, departure_city, arrival_city, departure_time, arrival_time, train_number, seat_type, price, "
+       "remaining_seats FROM train_tickets WHERE departure_city = '北京' AND arrival_city = '上海' "
+       "AND DATE(departure_time) = '2025-11-01' AND price < 1000")
+ROWS = [{"id": i, "departure_city": "北京", "arrival_city": "上海",
+         "departure_time": f"2025-11-01 {6 + i // 2:02d}:{i % 2 * 30:02d}:00",
+         "arrival_time": f"2025-11-01 {11 + i // 2:02d}:{i % 2 * 30:02d}:00",
+         "train_number": f"G{100 + i}", "seat_type": "二等座", "price": 553, "remaining_seats": 5}
+        for i in range(25)]
+
+
+# 编排器把票务代理当作进程内服务调用：任务经过一次序列化，与HTTP往返一致
+class InProcessAgent:
+    def __init__(self, server):
+        self.server = server
+        self.agent_card = server.agent_card
+        self.tasks = []
+
+    async def send_task_async(self, task):
+        self.tasks.append(task)
+        return await self.server.handle_task_async(Task.from_dict(task.to_dict()))
+
+
+class Network:
+    def __init__(self, agent):
+        self.agent = agent
+
+    def get_agent(self, name):
+        return self.agent
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    server = ticket_server.TicketQueryServer()
+    sql_calls = []
+
+    async def generate_sql_query(conversation, timeout=None):
+        sql_calls.append(conversation)
+        return {"status": "success", "type": "train", "sql": SQL, "slots": None}
+
+    async def get_ticket_info(sql):
+        return json.dumps({"status": "success", "data": ROWS}, ensure_ascii=False)
+
+    async def recognize_intent(prompt, turn_store, llm):
+        if prompt == "你好":
+            return ["out_of_scope"], {}, "你好！"
+        return ["train"], {"train": "查询2025-11-01从北京到上海的火车票"}, ""
+    monkeypatch.setattr(server, "generate_sql_query", generate_sql_query)
+    monkeypatch.setattr(ticket_server, "get_ticket_info", get_ticket_info)
+    monkeypatch.setattr(ticket_server.conf, "ticket_page_size", 10)
+    monkeypatch.setattr(entity_resolver.conf, "entity_resolver_enabled", False)
+    monkeypatch.setattr(pipeline, "recognize_intent", recognize_intent)
+    monkeypatch.setattr(pipeline.conf, "speculative_dispatch_enabled", False)
+    monkeypatch.setitem(dispatcher.conf.summarizer_modes, "train", "template")
+    monkeypatch.setattr(dispatcher.conf, "render_ticket_limit", 10)
+    agent = InProcessAgent(server)
+    agent.sql_calls = sql_calls
+    return agent
+
+
+def numbers(response):
+    return re.findall(r"^- .*?(G1\d\d)", response, re.MULTILINE)
+
+
+# 第一页 → 令牌存入会话 → “下一页”带令牌取第二页，不再生成SQL
+def test_next_page_follow_up(agent):
+    store, network = TurnStore(), Network(agent)
+
+    async def main():
+        first, _, _ = await pipeline.handle_turn("明天北京到上海的高铁", store, None, network)
+        assert numbers(first) == [f"G{100 + i}" for i in range(10)]
+        assert "下一页" in first and store.page["next"]
+        second, intents, agents = await pipeline.handle_turn("下一页", store, None, network)
+        assert intents == ["train"] and agents == ["TicketQueryAssistant"]
+        assert numbers(second) == [f"G{100 + i}" for i in range(10, 20)]
+        assert "第 11-20 条" in second
+        third, _, _ = await pipeline.handle_turn("更多", store, None, network)
+        assert numbers(third) == [f"G{100 + i}" for i in range(20, 25)]
+        assert "下一页" not in third and store.page["next"] is None
+        last, _, _ = await pipeline.handle_turn("下一页", store, None, network)
+        assert last == "已经是最后一页了。"
+    asyncio.run(main())
+    assert len(agent.sql_calls) == 1
+    assert [bool((task.metadata or {}).get("continuation_token")) for task in agent.tasks] == [False, True, True]
+
+
+# 其他问题会清空分页状态，之后的“下一页”按普通问题处理
+def test_page_state_lasts_one_turn(agent):
+    store, network = TurnStore(), Network(agent)
+
+    async def main():
+        await pipeline.handle_turn("明天北京到上海的高铁", store, None, network)
+        assert store.page is not None
+        await pipeline.handle_turn("你好", store, None, network)
+        assert store.page is None
+        await pipeline.handle_turn("下一页", store, None, network)
+    asyncio.run(main())
+    assert len(agent.sql_calls) == 2
@@ -0,0 +1,50 @@
+from SmartVoyage.orchestrator.turn_store import TurnStore, estimate_tokens
+
+
+def filled_store(turns, **kwargs):
+    store = TurnStore(**kwargs)
+    for i in range(turns):
+        store.add_user(f"问题{i}")
+        store.add_assistant(f"回答{i}")
+    return store
+
+
+# 环形缓冲区只保留最近 max_turns 轮，旧轮次自动丢弃
+def test_ring_buffer_keeps_latest_turns():
+    store = filled_store(5, max_turns=4, token_budget=1000)
+    assert len(store) == 4
+    assert [turn.text for turn in store.turns] == ["问题3", "回答3", "问题4", "回答4"]
+
+
+# 历史窗口：最多 max_lines 行，skip_last 跳过本轮用户问题
+def test_render_window():
+    store = filled_store(3, max_turns=20, token_budget=1000)
+    store.add_user("本轮问题")
+    assert store.render(max_lines=3, skip_last=1).splitlines() == ["Assistant: 回答1", "User: 问题2",
+                                                                 "Assistant: 回答2"]
+    assert store.render(max_lines=2).splitlines() == ["Assistant: 回答2", "User: 本轮问题"]
+    assert store.render(max_lines=20, skip_last=1).splitlines()[0] == "User: 问题0"
+
+
+# 槽位记忆放在首行，助手的长回复截断并压缩空白
+def test_render_slot_line_and_reply_truncation():
+    store = TurnStore(max_turns=20, token_budget=1000, reply_max_chars=10)
+    store.add_user("北京明天天气")
+    store.add_assistant("北京明天晴，\n气温 10~20 度，东北风3级，空气质量良")
+    store.slots.update({"city": "北京", "start_date": "2025-10-21"})
+    assert store.render().splitlines() == ["已知信息：城市=北京，开始日期=2025-10-21",
+                                           "User: 北京明天天气",
+                                           "Assistant: 北京明天晴， 气温 …"]
+
+
+# 超出token预算时从最旧的轮次开始丢弃，槽位行占用预算，最近一轮总会保留
+def test_render_token_budget_drops_oldest():
+    store = filled_store(3, max_turns=20, token_budget=1000)
+    recent = ["Assistant: 回答1", "User: 问题2", "Assistant: 回答2"]
+    store.token_budget = sum(estimate_tokens(line) for line in recent)
+    assert store.render().splitlines() == recent
+    store.slots["city"] = "北京"
+    store.token_budget = estimate_tokens(store.render_slots()) + sum(estimate_tokens(line) for line in recent[1:])
+    assert store.render().splitlines() == ["已知信息：城市=北京"] + recent[1:]
+    store.token_budget = 1
+    assert store.render().splitlines() == ["已知信息：城市=北京", "Assistant: 回答2"]
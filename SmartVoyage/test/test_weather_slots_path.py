@@ -0,0 +1,35 @@
+import asyncio
+import json
+
+from python_a2a import Message, MessageRole, Task, TextContent
+
+from SmartVoyage.a2a_server import weather_server
+from SmartVoyage.utils import entity_resolver
+
+ROWS = [{"city": "北京", "fx_date": "2025-10-28", "text_day": "晴", "text_night": "多云", "temp_min": 8,
+         "temp_max": 18, "humidity": 40, "wind_dir_day": "北风", "precip": 0.0}]
+
+
+# 槽位模式（默认模式）下槽位齐全时，应调用参数化范围查询并返回完成状态的任务，而不是None
+def test_slots_path_returns_completed_task(monkeypatch):
+    calls = []
+
+    async def extract_slots(self, conversation, timeout=None):
+        return {"status": "slots", "city": "北京", "start_date": "2025-10-28", "end_date": "2025-10-28"}
+
+    async def get_weather_by_range(city, start_date, end_date):
+        calls.append((city, start_date, end_date))
+        return json.dumps({"status": "success", "data": ROWS}, ensure_ascii=False)
+
+    monkeypatch.setattr(weather_server.conf, "weather_query_mode", "slots")
+    monkeypatch.setattr(entity_resolver.conf, "entity_resolver_enabled", False)
+    monkeypatch.setattr(weather_server.WeatherQueryServer, "extract_slots", extract_slots)
+    monkeypatch.setattr(weather_server, "get_weather_by_range", get_weather_by_range)
+
+    message = Message(content=TextContent(text="北京明天天气"), role=MessageRole.USER)
+    task = asyncio.run(weather_server.WeatherQueryServer()._handle_task(Task(message=message.to_dict())))
+
+    assert task is not None
+    assert calls == [("北京", "2025-10-28", "2025-10-28")]
+    assert task.status.state == "completed"
+    assert task.artifacts[0]["parts"][1]["data"] == {"type": "weather", "rows": ROWS}
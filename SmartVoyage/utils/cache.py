@@ -0,0 +1,84 @@
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from SmartVoyage.utils.date_resolver import now_shanghai, shanghai_tz
+
+
+# 计算下一个Asia/Shanghai零点的时间戳，缓存条目最晚在该时刻过期
+def next_midnight_timestamp(now=None):
+    now = now or now_shanghai()
+    midnight = shanghai_tz().localize(datetime.combine(now.date() + timedelta(days=1), datetime.min.time()))
+    return midnight.timestamp()
+
+
+# 归一化对话文本：全角转半角、逐行合并空白并去除句末标点、丢弃空行
+def normalize_conversation(conversation):
+    lines = []
+    for line in unicodedata.normalize("NFKC", conversation).split("\n"):
+        line = re.sub(r"\s+", " ", line).strip().rstrip("?？.。!！~～ ")
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+# 生成代理查询缓存键：查询方式 + 归一化对话的哈希 + 当前日期（相对日期按当天换算，跨天必须失效）
+def conversation_cache_key(conversation, current_date, kind="sql"):
+    digest = hashlib.sha1(normalize_conversation(conversation).encode("utf-8")).hexdigest()
+    return kind, digest, current_date
+
+
+# LRU + TTL 缓存：条目在Asia/Shanghai零点统一过期（可额外指定ttl），线程安全，带命中统计
+class DailyLRUCache:
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl  # 额外的存活时间上限（秒），为None时只在零点过期
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if time.time() >= expires_at:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        now = time.time()
+        expires_at = next_midnight_timestamp()
+        if self.ttl:
+            expires_at = min(expires_at, now + self.ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    # 返回命中统计信息
+    def stats(self):
+        total = self.hits + self.misses
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0}
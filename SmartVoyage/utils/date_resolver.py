@@ -0,0 +1,122 @@
+import re
+from datetime import date, datetime, timedelta
+
+from SmartVoyage.utils.resources import lazy_import
+
+# 中文数字映射
+CN_NUMBERS = {"一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+# 星期映射，周一为0
+WEEKDAYS = {"一": 0, "二": 1, "三": 2, "四": 3, "五": 4, "六": 5, "日": 6, "天": 6}
+# 相对日期词，按长度从长到短匹配，避免“后天”先于“大后天”命中
+RELATIVE_DAYS = [("大后天", 3), ("后天", 2), ("明天", 1), ("明日", 1), ("今天", 0), ("今日", 0), ("今晚", 0)]
+
+# 日期表达，与 resolve_dates 识别的写法一致；用于从文本中去掉已解析的日期，检查是否还有其他条件
+DATE_EXPRESSIONS = re.compile(
+    r"\d{4}[-/年.]\d{1,2}[-/月.]\d{1,2}[日号]?"
+    r"|\d{1,2}月\d{1,2}[日号]"
+    r"|大后天|后天|明天|明日|今天|今日|今晚"
+    r"|(?:下下|下|本|这)?(?:周|星期|礼拜)[一二三四五六日天]"
+    r"|(?:未来|接下来|最近|近)[0-9一二两三四五六七八九十]+天"
+    r"|下?(?:这个|本)?周末")
+
+
+# Asia/Shanghai时区，pytz首次使用时才导入
+def shanghai_tz():
+    return lazy_import("pytz").timezone('Asia/Shanghai')
+
+
+def now_shanghai():
+    return datetime.now(shanghai_tz())
+
+
+def today_shanghai():
+    return now_shanghai().date()
+
+
+def _to_int(token):
+    if token.isdigit():
+        return int(token)
+    if token.startswith("十"):  # 十一、十五
+        return 10 + CN_NUMBERS.get(token[1:], 0)
+    if "十" in token:  # 二十、二十一
+        tens, _, ones = token.partition("十")
+        return CN_NUMBERS.get(tens, 0) * 10 + CN_NUMBERS.get(ones, 0)
+    return CN_NUMBERS.get(token)
+
+
+# 不带年份的日期，已过去的日期顺延到下一年
+def _month_day(today, month, day):
+    try:
+        result = date(today.year, month, day)
+    except ValueError:
+        return None
+    if result < today - timedelta(days=1):
+        result = date(today.year + 1, month, day)
+    return result
+
+
+def _find_dates(text, today):
+    '''按出现顺序返回文本中的所有单日日期，每项为(位置, 日期)'''
+    found = []
+    for m in re.finditer(r"(\d{4})[-/年.](\d{1,2})[-/月.](\d{1,2})[日号]?", text):
+        try:
+            found.append((m.start(), date(int(m.group(1)), int(m.group(2)), int(m.group(3)))))
+        except ValueError:
+            continue
+    for m in re.finditer(r"(?<![\d年/.-])(\d{1,2})月(\d{1,2})[日号]", text):
+        d = _month_day(today, int(m.group(1)), int(m.group(2)))
+        if d:
+            found.append((m.start(), d))
+    for word, offset in RELATIVE_DAYS:
+        for m in re.finditer(word, text):
+            # “大后天”中的“后天”不重复计算
+            if word == "后天" and m.start() > 0 and text[m.start() - 1] == "大":
+                continue
+            found.append((m.start(), today + timedelta(days=offset)))
+    for m in re.finditer(r"(下下|下|本|这)?(?:周|星期|礼拜)([一二三四五六日天])", text):
+        prefix, weekday = m.group(1), WEEKDAYS[m.group(2)]
+        monday = today - timedelta(days=today.weekday())
+        if prefix == "下":
+            d = monday + timedelta(days=7 + weekday)
+        elif prefix == "下下":
+            d = monday + timedelta(days=14 + weekday)
+        else:
+            d = monday + timedelta(days=weekday)
+            if not prefix and d < today:  # 未指明本周且已过去，理解为即将到来的那一天
+                d += timedelta(days=7)
+        found.append((m.start(), d))
+    found.sort(key=lambda item: item[0])
+    return found
+
+
+def resolve_dates(text, today=None):
+    '''
+    解析文本中的日期表达，支持绝对日期、相对日期、星期、周末以及“未来N天”
+    :param text: 用户问题
+    :param today: 基准日期，默认取Asia/Shanghai的当天
+    :return: (start_date, end_date) 形如 '2025-07-30' 的字符串元组；未识别到日期时返回None
+    '''
+    today = today or today_shanghai()
+
+    # 未来N天 / 接下来N天 / 最近N天
+    m = re.search(r"(?:未来|接下来|最近|近)([0-9一二两三四五六七八九十]+)天", text)
+    if m:
+        days = _to_int(m.group(1))
+        if days:
+            return today.isoformat(), (today + timedelta(days=days - 1)).isoformat()
+
+    # 周末：即将到来的周六至周日
+    m = re.search(r"(下)?(?:这个|本)?周末", text)
+    if m:
+        saturday = today + timedelta(days=(5 - today.weekday()) % 7)
+        if today.weekday() == 6:  # 周日当天说周末，指今天
+            saturday = today - timedelta(days=1)
+        if m.group(1):
+            saturday += timedelta(days=7)
+        return saturday.isoformat(), (saturday + timedelta(days=1)).isoformat()
+
+    found = _find_dates(text, today)
+    if not found:
+        return None
+    dates = [d for _, d in found]
+    return min(dates).isoformat(), max(dates).isoformat()
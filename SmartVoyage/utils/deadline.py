@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+from SmartVoyage.config import Config
+
+conf = Config()
+
+# 截止时间在A2A任务metadata中的键名，值为Unix时间戳（秒）；编排器与各代理部署在同一批机器上，共用系统时钟
+DEADLINE_KEY = "deadline"
+
+
+# 创建截止时间：当前时间 + seconds
+def new_deadline(seconds):
+    return time.time() + seconds
+
+
+# 从A2A任务的metadata中读取截止时间，没有或格式错误时返回None
+def task_deadline(task):
+    try:
+        return float((task.metadata or {})[DEADLINE_KEY])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def remaining_budget(deadline, default=None, margin=0.0):
+    '''
+    计算距离截止时间的剩余预算
+    :param deadline: 截止时间（Unix时间戳），为None时表示未设置截止时间
+    :param default: 预算上限（秒），未设置截止时间时直接返回该值
+    :param margin: 预留的余量（秒），例如代理需要留出返回结果的网络耗时
+    :return: 剩余秒数（可能小于等于0），未设置截止时间且无上限时返回None
+    '''
+    if deadline is None:
+        return default
+    left = deadline - time.time() - margin
+    return left if default is None else min(left, default)
+
+
+def expired(deadline, margin=0.0):
+    return deadline is not None and deadline - time.time() - margin <= 0
+
+
+# 等待协程，超过timeout秒时取消并抛出asyncio.TimeoutError；timeout为None时不限时，预算已耗尽时不再启动协程
+async def wait_with_timeout(coro, timeout):
+    if timeout is not None and timeout <= 0:
+        coro.close()
+        raise asyncio.TimeoutError()
+    return await asyncio.wait_for(coro, timeout)
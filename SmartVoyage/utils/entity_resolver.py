@@ -0,0 +1,315 @@
+import json
+import os
+import re
+import time
+
+from SmartVoyage.config import Config
+from SmartVoyage.create_logger import logger
+from SmartVoyage.utils.metrics import metrics
+from SmartVoyage.utils.resources import lazy_import, resources
+
+conf = Config()
+
+# 各类实体的取值来源
+ENTITY_SOURCES = {
+    "city": ["SELECT DISTINCT city FROM weather_data",
+             "SELECT DISTINCT departure_city FROM train_tickets",
+             "SELECT DISTINCT arrival_city FROM train_tickets",
+             "SELECT DISTINCT departure_city FROM flight_tickets",
+             "SELECT DISTINCT arrival_city FROM flight_tickets",
+             "SELECT DISTINCT city FROM concert_tickets"],
+    "artist": ["SELECT DISTINCT artist FROM concert_tickets"],
+    "venue": ["SELECT DISTINCT venue FROM concert_tickets"],
+}
+# 槽位/列名 -> 实体类别
+ENTITY_FIELDS = {"city": "city", "departure_city": "city", "arrival_city": "city", "artist": "artist",
+                 "venue": "venue"}
+# 城市名常见的行政区划后缀，查找前去掉
+CITY_SUFFIXES = re.compile(r"(特别行政区|自治州|地区|市)$")
+# 文本中的英文/拼音片段（单词之间可以有空格或间隔号）与其中的单词
+ASCII_PHRASE = re.compile(r"[A-Za-z]+(?:[\s·・]+[A-Za-z]+)*")
+ASCII_WORD = re.compile(r"[A-Za-z]+")
+# 文本中的中文片段
+CJK_RUN = re.compile(r"[\u4e00-\u9fff]+")
+
+
+def _normalize(text):
+    return re.sub(r"[\s·・]+", "", text).lower()
+
+
+# 前缀树，节点为 {字符: 子节点}，词条结尾的节点在 "$" 下保存规范名称集合
+class Trie:
+    def __init__(self):
+        self.root = {}
+
+    def add(self, key, canonical):
+        node = self.root
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node.setdefault("$", set()).add(canonical)
+
+    def search(self, word, max_distance):
+        '''
+        在前缀树上逐层计算编辑距离矩阵的一行，某一行的最小值超过max_distance时剪掉整棵子树
+        :return: [(编辑距离, 规范名称)]
+        '''
+        results = []
+        first_row = list(range(len(word) + 1))
+        for ch, child in self.root.items():
+            if ch != "$":
+                self._search(child, ch, word, first_row, max_distance, results)
+        return results
+
+    def _search(self, node, ch, word, previous_row, max_distance, results):
+        row = [previous_row[0] + 1]
+        for i in range(1, len(word) + 1):
+            row.append(min(row[i - 1] + 1, previous_row[i] + 1,
+                           previous_row[i - 1] + (word[i - 1] != ch)))
+        if row[-1] <= max_distance and "$" in node:
+            results.extend((row[-1], canonical) for canonical in node["$"])
+        if min(row) <= max_distance:
+            for next_ch, child in node.items():
+                if next_ch != "$":
+                    self._search(child, next_ch, word, row, max_distance, results)
+
+
+# 实体解析器：把用户说法（简称、别名、拼音、错别字）解析为数据库中的规范取值
+class EntityResolver:
+    def __init__(self, entities=None, aliases=None):
+        '''
+        :param entities: 类别 -> 规范取值集合
+        :param aliases: 类别 -> {别名: 规范取值}
+        '''
+        pinyin = lazy_import("pypinyin")
+        self.exact = {}  # 类别 -> {归一化的名称/别名/拼音: 规范取值集合}
+        self.tries = {}  # 类别 -> 规范取值与拼音构成的前缀树，用于编辑距离查找
+        for kind in ENTITY_SOURCES:
+            values = set((entities or {}).get(kind, ()))
+            exact, trie = {}, Trie()
+            for value in values:
+                for key in {_normalize(value), _normalize(CITY_SUFFIXES.sub("", value)) if kind == "city" else None}:
+                    if key:
+                        exact.setdefault(key, set()).add(value)
+                        trie.add(key, value)
+                spelled = "".join(pinyin.lazy_pinyin(value)).lower()
+                if spelled.isascii() and spelled != _normalize(value):
+                    exact.setdefault(spelled, set()).add(value)
+                    trie.add(spelled, value)
+            for alias, value in (aliases or {}).get(kind, {}).items():
+                exact.setdefault(_normalize(alias), set()).add(value)
+            self.exact[kind], self.tries[kind] = exact, trie
+
+    @classmethod
+    def from_database(cls, alias_file=None):
+        conn = lazy_import("mysql.connector").connect(host=conf.host, user=conf.user, password=conf.password,
+                                                      database=conf.database)
+        try:
+            cursor = conn.cursor()
+            entities = {}
+            for kind, sqls in ENTITY_SOURCES.items():
+                values = entities.setdefault(kind, set())
+                for sql in sqls:
+                    cursor.execute(sql)
+                    values.update(row[0] for row in cursor.fetchall() if row[0])
+            cursor.close()
+        finally:
+            conn.close()
+        resolver = cls(entities, load_aliases(alias_file or conf.entity_alias_file))
+        logger.info(f"实体解析索引加载完成：" + "，".join(f"{kind} {len(values)} 个" for kind, values in entities.items()))
+        return resolver
+
+    def resolve(self, kind, text):
+        '''
+        解析一个实体取值：依次尝试精确匹配（名称、去后缀名称、别名、拼音）和编辑距离匹配，
+        编辑距离最小的候选不唯一时视为无法确定
+        :param kind: city/artist/venue
+        :param text: 用户的说法
+        :return: 规范取值；无法确定时返回None
+        '''
+        if not isinstance(text, str) or not text.strip():
+            return None
+        key = _normalize(text)
+        if kind == "city":
+            key = _normalize(CITY_SUFFIXES.sub("", text.strip())) or key
+        found = self.exact.get(kind, {}).get(key)
+        if found:
+            return next(iter(found)) if len(found) == 1 else None
+        # 错别字容忍度按长度：两个字的中文名改一个字就是另一座城市（杭州/广州），三个字及以上才容忍1个字；
+        # 拼音5个字母及以上容忍1个字母，10个及以上容忍2个
+        if key.isascii():
+            max_distance = 2 if len(key) >= 10 else 1 if len(key) >= 5 else 0
+        else:
+            max_distance = 1 if len(key) >= 3 else 0
+        if max_distance == 0:
+            return None
+        candidates = self.tries[kind].search(key, max_distance)
+        if not candidates:
+            return None
+        best = min(distance for distance, _ in candidates)
+        values = {value for distance, value in candidates if distance == best}
+        return values.pop() if len(values) == 1 else None
+
+    def resolve_slots(self, slots):
+        '''
+        解析槽位中的城市/艺人/场馆，能确定规范取值的替换，其余保持原样
+        :return: (解析后的槽位, {原值: 规范取值})
+        '''
+        resolved, replaced = dict(slots), {}
+        for field, kind in ENTITY_FIELDS.items():
+            value = slots.get(field)
+            if not isinstance(value, str):
+                continue
+            canonical = self.resolve(kind, value)
+            if canonical is not None and canonical != value:
+                resolved[field] = canonical
+                replaced[value] = canonical
+        return resolved, replaced
+
+    def resolve_sql(self, sql):
+        '''
+        解析SQL中城市/艺人/场馆列的等值条件取值，例如 departure_city = '沪' 改为 departure_city = '上海'
+        :return: (解析后的SQL, {原值: 规范取值})
+        '''
+        replaced = {}
+
+        def replace(match):
+            column, value = match.group(1), match.group(3)
+            canonical = self.resolve(ENTITY_FIELDS[column.lower()], value)
+            if canonical is None or canonical == value:
+                return match.group(0)
+            replaced[value] = canonical
+            return f"{match.group(1)}{match.group(2)}'{canonical}'"
+
+        pattern = r"\b(departure_city|arrival_city|city|artist|venue)(\s*=\s*)'([^']*)'"
+        return re.sub(pattern, replace, sql, flags=re.IGNORECASE), replaced
+
+
+# 城市与艺人词典：实体解析器的文本查找视图，在一句话中找出实体的位置与规范取值，
+# 名称、别名、拼音与错别字的解析规则与 EntityResolver.resolve 一致
+class EntityDictionary:
+    def __init__(self, cities=(), artists=(), aliases=None, resolver=None):
+        '''
+        :param cities: 城市取值，未传入resolver时用于就地构建解析器（测试、数据库不可用时）
+        :param artists: 艺人取值
+        :param aliases: 类别 -> {别名: 规范取值}
+        :param resolver: 已构建的实体解析器，进程内与SQL/槽位解析共用
+        '''
+        self.resolver = resolver or EntityResolver({"city": cities, "artist": artists}, aliases)
+        # 中文名称与别名（两个字及以上，且只对应一个规范取值），按长度从长到短排列，保证最长匹配；
+        # 单字别名（京、沪、深）在句子中歧义太大，只用于解析整个槽位
+        self.terms = {}
+        for kind in ("city", "artist"):
+            exact = self.resolver.exact.get(kind, {})
+            self.terms[kind] = sorted(((key, next(iter(values))) for key, values in exact.items()
+                                       if len(values) == 1 and len(key) >= 2 and not key.isascii()),
+                                      key=lambda item: len(item[0]), reverse=True)
+        self.max_length = {kind: max((len(key) for key, _ in terms), default=0) for kind, terms in self.terms.items()}
+
+    def _find(self, kind, text):
+        '''
+        在文本中查找某类实体：先精确匹配中文名称/别名，再按单词组合解析英文与拼音，
+        最后在剩余的中文片段中按窗口做编辑距离匹配（窗口从长到短，至少三个字）；
+        错别字只匹配三个字及以上的名称，否则“北京”加上相邻的任意一个字就会被当作错写的“北京”
+        :return: 不重叠的 [(开始位置, 结束位置, 规范取值)]，按出现顺序排列
+        '''
+        found, taken = [], [False] * len(text)
+
+        def take(start, end, value):
+            found.append((start, end, value))
+            taken[start:end] = [True] * (end - start)
+
+        for key, value in self.terms[kind]:
+            start = text.find(key)
+            while start != -1:
+                end = start + len(key)
+                if not any(taken[start:end]):
+                    take(start, end, value)
+                start = text.find(key, end)
+
+        for phrase in ASCII_PHRASE.finditer(text):
+            words = [(phrase.start() + word.start(), phrase.start() + word.end())
+                     for word in ASCII_WORD.finditer(phrase.group())]
+            i = 0
+            while i < len(words):
+                for j in range(len(words), i, -1):
+                    start, end = words[i][0], words[j - 1][1]
+                    value = self.resolver.resolve(kind, text[start:end])
+                    if value is not None:
+                        take(start, end, value)
+                        i = j
+                        break
+                else:
+                    i += 1
+
+        for run in CJK_RUN.finditer(text):
+            i = run.start()
+            while i < run.end():
+                for length in range(min(self.max_length[kind] + 1, run.end() - i), 2, -1):
+                    if any(taken[i:i + length]):
+                        continue
+                    value = self.resolver.resolve(kind, text[i:i + length])
+                    if value is not None and len(_normalize(value)) >= 3:
+                        take(i, i + length, value)
+                        i += length
+                        break
+                else:
+                    i += 1
+        return sorted(found)
+
+    def find_cities(self, text):
+        return self._find("city", text)
+
+    def find_artists(self, text):
+        return self._find("artist", text)
+
+
+# 别名文件：{"city": {"沪": "上海", ...}, "artist": {...}, "venue": {...}}
+def load_aliases(path):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _build_entity_resolver():
+    started = time.perf_counter()
+    try:
+        resolver = EntityResolver.from_database()
+    except Exception as e:
+        logger.error(f"实体解析索引加载失败，只使用别名文件: {e}")
+        resolver = EntityResolver(aliases=load_aliases(conf.entity_alias_file))
+    logger.info(f"实体解析索引构建耗时 {time.perf_counter() - started:.3f}s")
+    return resolver
+
+
+resources.register("entity_resolver", _build_entity_resolver)
+
+
+# 句子中的实体查找（快速意图、槽位记忆、天气本地解析）与SQL/槽位解析共用同一个实体解析器，数据库只查询一次
+def _build_entity_dictionary():
+    return EntityDictionary(resolver=resources.get("entity_resolver"))
+
+
+resources.register("entity_dictionary", _build_entity_dictionary)
+
+
+# 执行查询前解析生成的SQL中的实体取值，避免因简称、拼音、错别字查不到数据而追问
+def resolve_query_sql(sql):
+    if not conf.entity_resolver_enabled or not isinstance(sql, str):
+        return sql
+    resolved, replaced = resources.get("entity_resolver").resolve_sql(sql)
+    if replaced:
+        logger.info(f"实体解析: {replaced}")
+        metrics.incr("entity_resolver.resolved", len(replaced))
+    return resolved
+
+
+# 执行查询前解析抽取到的槽位中的实体取值
+def resolve_query_slots(slots):
+    if not conf.entity_resolver_enabled or not slots:
+        return slots
+    resolved, replaced = resources.get("entity_resolver").resolve_slots(slots)
+    if replaced:
+        logger.info(f"实体解析: {replaced}")
+        metrics.incr("entity_resolver.resolved", len(replaced))
+    return resolved
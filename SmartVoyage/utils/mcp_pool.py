@@ -0,0 +1,323 @@
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from SmartVoyage.config import Config
+from SmartVoyage.create_logger import logger
+from SmartVoyage.utils.resources import lazy_import, resources
+
+conf = Config()
+
+# 进程内MCP服务：服务名称 -> (模块, 构建FastMCP实例的函数)，传输方式为local时在代理进程内直接构建
+LOCAL_MCP_SERVERS = {
+    "ticket": ("SmartVoyage.mcp_server.mcp_ticket_server", "build_ticket_mcp"),
+    "weather": ("SmartVoyage.mcp_server.mcp_weather_server", "build_weather_mcp"),
+    "order": ("SmartVoyage.mcp_server.mcp_order_server", "build_order_mcp"),
+}
+
+
+# 远程传输：通过streamable HTTP连接独立部署的MCP服务
+@asynccontextmanager
+async def http_transport(url):
+    streamablehttp_client = lazy_import("mcp.client.streamable_http").streamablehttp_client
+    async with streamablehttp_client(url) as (read, write, _):
+        yield read, write
+
+
+# 进程内传输：客户端与服务端通过内存流直接交换MCP消息，不经过HTTP与JSON序列化，工具契约与远程一致
+@asynccontextmanager
+async def local_transport(server):
+    anyio = lazy_import("anyio")
+    memory = lazy_import("mcp.shared.memory")
+    lowlevel_server = server._mcp_server  # FastMCP未公开底层Server，mcp.shared.memory中也是这样取的
+    async with memory.create_client_server_memory_streams() as (client_streams, server_streams):
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(lambda: lowlevel_server.run(*server_streams,
+                                                      lowlevel_server.create_initialization_options()))
+            try:
+                yield client_streams
+            finally:
+                tg.cancel_scope.cancel()
+
+
+def mcp_transport(name):
+    '''
+    按配置选择MCP服务的传输方式
+    :param name: MCP服务名称（ticket/weather/order）
+    :return: (描述, 无参函数)，调用该函数得到产出 (read, write) 的异步上下文管理器
+    '''
+    if conf.mcp_transports.get(name, "http") == "local":
+        module_name, factory = LOCAL_MCP_SERVERS[name]
+        # 进程内MCP服务持有数据库连接和索引刷新线程，多工作进程时由各子进程各自构建
+        resources.register(f"mcp_server_{name}", lambda: getattr(lazy_import(module_name), factory)(),
+                           fork_safe=False)
+        return f"local://{name}", lambda: local_transport(resources.get(f"mcp_server_{name}"))
+    url = conf.mcp_urls[name]
+    return url, lambda: http_transport(url)
+
+
+# 一个长驻的MCP会话：连接的建立与关闭都在同一个owner任务中完成（anyio的任务组要求进出在同一任务内）
+class PooledMcpSession:
+    def __init__(self, url, connect):
+        self.url = url
+        self.connect = connect
+        self.session = None
+        self.last_used = time.monotonic()
+        self.calls = 0  # 已完成的调用次数，大于0表示是复用的会话
+        self._closing = None
+        self._owner = None
+
+    # 会话可用：已完成初始化且底层连接没有断开
+    @property
+    def alive(self):
+        return self.session is not None and self._owner is not None and not self._owner.done()
+
+    async def open(self, timeout):
+        self._closing = asyncio.Event()
+        ready = asyncio.get_running_loop().create_future()
+        self._owner = asyncio.ensure_future(self._run(ready))
+        try:
+            await asyncio.wait_for(asyncio.shield(ready), timeout)
+        except BaseException:
+            self._owner.cancel()
+            raise
+
+    async def _run(self, ready):
+        ClientSession = lazy_import("mcp").ClientSession
+        try:
+            async with self.connect() as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.session = session
+                    ready.set_result(True)
+                    # 保持连接，直到连接池关闭该会话
+                    await self._closing.wait()
+        except asyncio.CancelledError:
+            if not ready.done():
+                ready.cancel()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.warning(f"MCP会话断开 {self.url}: {str(e)}")
+        finally:
+            self.session = None
+
+    async def call(self, fn):
+        '''
+        在本会话上执行 fn(session)；底层连接在调用过程中断开时立即抛出ConnectionError，而不是一直等到超时
+        '''
+        call = asyncio.ensure_future(fn(self.session))
+        try:
+            await asyncio.wait({call, self._owner}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+        if call.done():
+            return call.result()
+        call.cancel()
+        raise ConnectionError(f"MCP会话已断开: {self.url}")
+
+    async def close(self, timeout=2):
+        if self._owner is None or self._owner.done():
+            return
+        self._closing.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._owner), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self._owner.cancel()
+
+
+# 单个MCP服务的会话池：复用已初始化的会话，空闲较久的会话复用前先ping，断线时透明重连，并发数不超过池大小
+# 会话绑定在创建它的事件循环上，只能在该循环中使用
+class McpSessionPool:
+    def __init__(self, url, connect, size=None, connect_timeout=None, health_interval=None, idle_timeout=None):
+        self.url = url  # 远程服务的URL，进程内服务为 local://名称
+        self.connect = connect
+        self.size = size or conf.mcp_pool_size
+        self.connect_timeout = connect_timeout or conf.mcp_connect_timeout
+        self.health_interval = health_interval or conf.mcp_health_check_interval
+        self.idle_timeout = idle_timeout or conf.mcp_pool_idle_timeout
+        self._idle = []  # 空闲会话，后进先出，优先复用最近用过的会话
+        self._semaphore = asyncio.Semaphore(self.size)
+        # 会话池统计：调用次数、新建会话、复用会话、健康检查、重连、失败、空闲回收
+        self.stats = {"calls": 0, "opens": 0, "reuses": 0, "health_checks": 0, "reconnects": 0, "errors": 0,
+                      "idle_evictions": 0}
+
+    async def _acquire(self):
+        while self._idle:
+            pooled = self._idle.pop()
+            if not pooled.alive:
+                await pooled.close()
+                continue
+            if time.monotonic() - pooled.last_used > self.health_interval:
+                self.stats["health_checks"] += 1
+                try:
+                    await asyncio.wait_for(pooled.session.send_ping(), self.connect_timeout)
+                except Exception as e:
+                    logger.info(f"MCP会话健康检查失败，重新连接 {self.url}: {str(e)}")
+                    self.stats["reconnects"] += 1
+                    await pooled.close()
+                    continue
+            self.stats["reuses"] += 1
+            return pooled
+        pooled = PooledMcpSession(self.url, self.connect)
+        await pooled.open(self.connect_timeout)
+        self.stats["opens"] += 1
+        return pooled
+
+    # 连接层面的错误（会话已断开、流已关闭）才值得换一个会话重试
+    @staticmethod
+    def _is_connection_error(pooled, e):
+        anyio = lazy_import("anyio")
+        httpx = lazy_import("httpx")
+        return not pooled.alive or isinstance(e, (anyio.ClosedResourceError, anyio.BrokenResourceError,
+                                                  anyio.EndOfStream, httpx.TransportError,
+                                                  ConnectionError))
+
+    async def run(self, fn, retry=True):
+        '''
+        借出一个会话执行 fn(session)，完成后归还
+        :param fn: 接收ClientSession的协程函数
+        :param retry: 复用的会话因连接错误失败时，是否换一个新会话重试一次；有副作用的调用（如订票）应为False
+        :return: fn的返回值
+        '''
+        async with self._semaphore:
+            self.stats["calls"] += 1
+            while True:
+                try:
+                    pooled = await self._acquire()
+                except Exception:
+                    self.stats["errors"] += 1
+                    raise
+                try:
+                    result = await pooled.call(fn)
+                except asyncio.CancelledError:
+                    # 调用被取消时会话上可能还有未完成的请求，直接丢弃
+                    await pooled.close()
+                    raise
+                except Exception as e:
+                    await pooled.close()
+                    # 新建的会话也失败说明服务本身不可用，不再重试
+                    if retry and pooled.calls and self._is_connection_error(pooled, e):
+                        retry = False
+                        self.stats["reconnects"] += 1
+                        logger.warning(f"MCP会话连接失效，重新连接后重试 {self.url}: {str(e)}")
+                        continue
+                    self.stats["errors"] += 1
+                    raise
+                pooled.calls += 1
+                pooled.last_used = time.monotonic()
+                self._idle.append(pooled)
+                return result
+
+    # 关闭空闲超过idle_timeout的会话
+    async def evict_idle(self, now):
+        keep = []
+        for pooled in self._idle:
+            if now - pooled.last_used > self.idle_timeout or not pooled.alive:
+                await pooled.close()
+                self.stats["idle_evictions"] += 1
+            else:
+                keep.append(pooled)
+        self._idle = keep
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for pooled in idle:
+            await pooled.close()
+
+
+# MCP客户端运行时：按MCP服务划分的会话池，会话直接在调用方的事件循环中await
+# 两种服务模式下代理任务都在进程内唯一的常驻事件循环中处理（Flask模式为run_sync的常驻循环，异步模式为服务自身的循环），
+# 会话池绑定该循环，不再转交到单独的线程：截止时间到期时的取消直接作用于进行中的MCP请求，contextvars照常传递
+class McpRuntime:
+    def __init__(self):
+        self.pools = {}  # MCP服务名称 -> McpSessionPool
+        self._loop = None  # 会话池所属的事件循环
+        self._sweeper = None
+
+    def get_pool(self, name):
+        '''
+        返回当前事件循环中MCP服务对应的会话池；会话只能在创建它的事件循环中使用，
+        在另一个事件循环中调用时（例如原循环已关闭）丢弃旧的会话池重新建立
+        '''
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self.pools:
+                logger.warning("MCP会话池所属的事件循环已变化，重新建立会话")
+            self._loop = loop
+            self.pools = {}
+            self._sweeper = loop.create_task(self._sweep_idle_sessions())
+        if name not in self.pools:
+            self.pools[name] = McpSessionPool(*mcp_transport(name))
+        return self.pools[name]
+
+    async def call(self, name, fn, retry=True):
+        '''
+        借出MCP服务对应的会话，在当前事件循环中执行 fn(session)
+        调用方取消（例如截止时间到期）时，进行中的调用一并取消，会话被丢弃
+        '''
+        return await self.get_pool(name).run(fn, retry)
+
+    # 返回各MCP服务会话池的统计信息
+    def pool_stats(self):
+        return {pool.url: dict(pool.stats) for pool in self.pools.values()}
+
+    async def _sweep_idle_sessions(self):
+        while True:
+            await asyncio.sleep(conf.mcp_pool_idle_timeout / 2)
+            now = time.monotonic()
+            for pool in list(self.pools.values()):
+                await pool.evict_idle(now)
+
+    # 在会话池所属的事件循环中调用，关闭所有会话
+    async def shutdown(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        for pool in list(self.pools.values()):
+            await pool.close()
+
+
+# 工具调用代理使用的MCP会话：每个请求各自借出会话池中的会话，代理等待LLM时不占用会话
+class McpSessionProxy:
+    def __init__(self, runtime, name, retry=True):
+        self.runtime = runtime
+        self.name = name
+        self.retry = retry  # 工具调用会话失效时是否重试；有副作用的工具（如订票）应为False
+
+    async def list_tools(self, cursor=None):
+        return await self.runtime.call(self.name, lambda session: session.list_tools(cursor=cursor))
+
+    async def call_tool(self, name, arguments=None):
+        return await self.runtime.call(self.name, lambda session: session.call_tool(name, arguments), self.retry)
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+# 获取进程内唯一的MCP客户端运行时
+def get_mcp_runtime():
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = McpRuntime()
+        return _runtime
+
+
+# fork出的子进程不继承父进程的事件循环与连接：丢弃从父进程复制的运行时，子进程首次调用时重新创建
+def _reset_runtime_after_fork():
+    global _runtime, _runtime_lock
+    _runtime = None
+    _runtime_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_runtime_after_fork)
+
+
+# 调用MCP工具：优先复用会话池中的会话，按配置走远程HTTP或进程内传输
+async def call_mcp_tool(name, tool_name, arguments):
+    return await get_mcp_runtime().call(name, lambda session: session.call_tool(tool_name, arguments))
@@ -0,0 +1,227 @@
+import asyncio
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from SmartVoyage.config import Config
+from SmartVoyage.utils.resources import lazy_import, resources
+
+conf = Config()
+
+# 当前轮次（或当前代理任务）的LLM调用明细；asyncio任务创建时会复制上下文，并发分支共享同一个明细对象
+_current_turn = contextvars.ContextVar("llm_turn_metrics", default=None)
+
+
+# 最近邻秩百分位数
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+# 一轮对话（或一次代理任务）内所有LLM调用的明细
+class TurnMetrics:
+    def __init__(self, name):
+        self.name = name
+        self.started = time.monotonic()
+        self.seconds = 0.0
+        self.calls = []  # [{"stage", "model", "prompt_tokens", "completion_tokens", "seconds", "error"}]
+
+    def tokens(self):
+        return sum(c["prompt_tokens"] + c["completion_tokens"] for c in self.calls)
+
+    # 渲染为一行日志：总耗时、总token、各次调用的阶段/模型/耗时/token
+    def summary_line(self):
+        details = " | ".join(f"{c['stage']}({c['model']}) {c['seconds']:.2f}s "
+                             f"{c['prompt_tokens']}+{c['completion_tokens']} tokens{' 失败' if c['error'] else ''}"
+                             for c in self.calls)
+        return (f"{self.name}耗时 {self.seconds:.2f}s，LLM调用 {len(self.calls)} 次，共 {self.tokens()} tokens"
+                + (f"：{details}" if details else ""))
+
+
+# 进程内的LLM指标汇总：按阶段记录最近的调用样本，按轮次记录耗时与token
+class MetricsRegistry:
+    def __init__(self, max_samples=None):
+        self.max_samples = max_samples or conf.metrics_max_samples
+        self._lock = threading.Lock()
+        self.stages = defaultdict(lambda: deque(maxlen=self.max_samples))  # stage -> 调用记录
+        self.turns = deque(maxlen=self.max_samples)  # 轮次记录 (seconds, tokens, calls)
+        self.caches = {}  # 缓存名称 -> 带 stats() 方法的缓存对象，汇总时附上命中率
+        self.worker = None  # 多工作进程部署时的进程序号，各进程写各自的指标文件
+        self.counters = defaultdict(int)  # 事件计数，例如输出解析成功/失败次数
+        self._pending_dumps = set()  # 已安排延迟写出的指标文件名称
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    # 登记需要在指标中展示命中率的缓存
+    def register_cache(self, name, cache):
+        self.caches[name] = cache
+
+    def record_call(self, call):
+        with self._lock:
+            self.stages[call["stage"]].append(call)
+        turn = _current_turn.get()
+        if turn is not None:
+            turn.calls.append(call)
+
+    def record_turn(self, turn):
+        with self._lock:
+            self.turns.append((turn.seconds, turn.tokens(), len(turn.calls)))
+
+    def summary(self):
+        '''
+        汇总各阶段与各轮次的指标
+        :return: {"stages": {stage: {count, errors, p50/p95/p99 耗时, 平均token}}, "turns": {count, p50/p95/p99 耗时, 每轮token},
+                  "caches": {name: {size, hits, misses, evictions, hit_rate}}, "counters": {name: 次数}}
+        '''
+        with self._lock:
+            stages = {stage: list(calls) for stage, calls in self.stages.items()}
+            turns = list(self.turns)
+            counters = dict(self.counters)
+        result = {"stages": {}, "turns": {}, "caches": {name: cache.stats() for name, cache in self.caches.items()},
+                  "counters": counters}
+        for stage, calls in stages.items():
+            seconds = [c["seconds"] for c in calls]
+            result["stages"][stage] = {
+                "count": len(calls),
+                "errors": sum(1 for c in calls if c["error"]),
+                "models": sorted({c["model"] for c in calls}),
+                "p50": round(percentile(seconds, 50), 3),
+                "p95": round(percentile(seconds, 95), 3),
+                "p99": round(percentile(seconds, 99), 3),
+                "avg_prompt_tokens": round(sum(c["prompt_tokens"] for c in calls) / len(calls), 1),
+                "avg_completion_tokens": round(sum(c["completion_tokens"] for c in calls) / len(calls), 1),
+            }
+        if turns:
+            seconds = [t[0] for t in turns]
+            tokens = [t[1] for t in turns]
+            result["turns"] = {
+                "count": len(turns),
+                "p50": round(percentile(seconds, 50), 3),
+                "p95": round(percentile(seconds, 95), 3),
+                "p99": round(percentile(seconds, 99), 3),
+                "avg_tokens": round(sum(tokens) / len(tokens), 1),
+                "p95_tokens": percentile(tokens, 95),
+                "avg_llm_calls": round(sum(t[2] for t in turns) / len(turns), 2),
+            }
+        return result
+
+    # 把汇总结果写入 logs/metrics_{name}.json，每个进程（编排器、各代理及其工作进程）各写一个文件
+    def dump(self, name):
+        if self.worker is not None:
+            name = f"{name}_w{self.worker}"
+        path = os.path.join(conf.metrics_dir, f"metrics_{name}.json")
+        os.makedirs(conf.metrics_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+    def dump_soon(self, name):
+        '''
+        在事件循环中调用：安排在 metrics_dump_interval 秒后写出指标文件，期间的多次调用合并为一次，
+        写文件在线程池中执行，不阻塞事件循环
+        :param name: 指标文件名称，同 dump
+        '''
+        if name in self._pending_dumps:
+            return
+        self._pending_dumps.add(name)
+        loop = asyncio.get_running_loop()
+
+        def write():
+            self._pending_dumps.discard(name)
+            loop.run_in_executor(None, self.dump, name)
+
+        loop.call_later(conf.metrics_dump_interval, write)
+
+
+# LangChain回调：记录每次LLM调用的阶段、模型、token与耗时
+# 不直接继承BaseCallbackHandler（langchain_core导入较慢），首次构建链调用配置时才与其组合成回调类
+class LLMMetricsHandler:
+    run_inline = True  # 在调用方的上下文中执行，才能取到当前轮次的明细对象
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._starts = {}  # run_id -> (开始时间, 阶段, 模型)
+
+    def _start(self, run_id, metadata, kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = (params.get("model") or params.get("model_name") or (metadata or {}).get("ls_model_name")
+                 or "unknown")
+        self._starts[run_id] = (time.monotonic(), (metadata or {}).get("stage", "unknown"), model)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, metadata, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, metadata, kwargs)
+
+    def _finish(self, run_id, prompt_tokens=0, completion_tokens=0, model=None, error=False):
+        started, stage, start_model = self._starts.pop(run_id, (time.monotonic(), "unknown", "unknown"))
+        self.registry.record_call({"stage": stage, "model": model or start_model,
+                                   "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                   "seconds": time.monotonic() - started, "error": error})
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        llm_output = response.llm_output or {}
+        usage = llm_output.get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        if not usage:  # 部分模型只在消息的usage_metadata中返回用量
+            for generations in response.generations:
+                for generation in generations:
+                    usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    prompt_tokens += usage_metadata.get("input_tokens", 0)
+                    completion_tokens += usage_metadata.get("output_tokens", 0)
+        self._finish(run_id, prompt_tokens, completion_tokens, llm_output.get("model_name"))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, error=True)
+
+
+# 进程内唯一的指标汇总
+metrics = MetricsRegistry()
+
+
+# 进程内唯一的指标回调
+def _build_metrics_handler():
+    BaseCallbackHandler = lazy_import("langchain_core.callbacks").BaseCallbackHandler
+
+    class MetricsCallbackHandler(LLMMetricsHandler, BaseCallbackHandler):
+        pass
+
+    return MetricsCallbackHandler(metrics)
+
+
+resources.register("metrics_handler", _build_metrics_handler)
+
+
+# 链调用的配置：挂上指标回调并标记调用阶段，用法 chain.ainvoke(inputs, config=llm_config("intent"))
+def llm_config(stage):
+    return {"callbacks": [resources.get("metrics_handler")], "metadata": {"stage": stage}, "run_name": stage}
+
+
+@contextmanager
+def track_turn(name="本轮"):
+    '''
+    统计一轮对话（或一次代理任务）内的LLM调用，结束时计入汇总
+    :param name: 日志中的名称，例如“本轮”“天气任务”
+    :return: TurnMetrics，退出后可用 summary_line() 输出明细
+    '''
+    turn = TurnMetrics(name)
+    token = _current_turn.set(turn)
+    try:
+        yield turn
+    finally:
+        _current_turn.reset(token)
+        turn.seconds = time.monotonic() - turn.started
+        metrics.record_turn(turn)
@@ -0,0 +1,80 @@
+import base64
+import hashlib
+import heapq
+import hmac
+import json
+import secrets
+
+from SmartVoyage.config import Config
+
+conf = Config()
+
+# 翻页令牌在A2A任务metadata中的键名：代理在结果任务中返回下一页的令牌，客户端带上该令牌发起任务即可取下一页
+PAGE_TOKEN_KEY = "continuation_token"
+# 排序方式：time（按出发/开始时间）或 price（按票价）
+PAGE_ORDERS = ("time", "price")
+
+
+def row_sort_key(row, order):
+    '''
+    票务记录的排序键，同时作为翻页游标：末尾用id与车次/座位打破平局，保证同一查询内的顺序是全序
+    :param row: 票务记录字典（火车票/机票/演唱会票）
+    :param order: time 或 price
+    :return: 可JSON序列化后再还原比较的元组
+    '''
+    time_value = str(row.get("departure_time") or row.get("start_time") or "")
+    try:
+        price = float(row.get("price"))
+    except (TypeError, ValueError):
+        price = 0.0
+    tie = (str(row.get("id", "")).zfill(12),
+           str(row.get("train_number") or row.get("flight_number") or row.get("artist") or ""),
+           str(row.get("seat_type") or row.get("cabin_type") or row.get("ticket_type") or ""))
+    return (price, time_value) + tie if order == "price" else (time_value, price) + tie
+
+
+def page_rows(rows, order, after=None, limit=None):
+    '''
+    游标分页：取排序键大于游标的前limit条，只维护大小为limit+1的堆，结果集再大耗时也只随limit增长
+    :param rows: 票务记录列表（无需有序）
+    :param order: time 或 price
+    :param after: 上一页最后一条的排序键，为None时从第一条开始
+    :param limit: 每页条数
+    :return: (本页记录, 游标之后的记录总数, 下一页游标；没有下一页时为None)
+    '''
+    limit = limit or conf.ticket_page_size
+    after = tuple(after) if after else None
+    candidates = rows if after is None else [row for row in rows if row_sort_key(row, order) > after]
+    page = heapq.nsmallest(limit + 1, candidates, key=lambda row: row_sort_key(row, order))
+    if len(page) <= limit:
+        return page, len(candidates), None
+    page = page[:limit]
+    return page, len(candidates), list(row_sort_key(page[-1], order))
+
+
+# 未配置签名密钥时使用进程启动时随机生成的密钥：多工作进程在fork前已导入本模块，共享同一密钥；服务重启后旧令牌失效
+_RANDOM_SECRET = secrets.token_hex(32)
+
+
+def _sign(payload):
+    secret = conf.page_token_secret or _RANDOM_SECRET
+    return hmac.new(secret.encode("utf-8"), payload, hashlib.sha256).digest()[:16]
+
+
+# 生成翻页令牌：查询状态序列化后签名，令牌自包含，任意工作进程都能继续翻页
+def encode_page_token(state):
+    payload = json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(_sign(payload) + payload).decode("ascii").rstrip("=")
+
+
+# 解析翻页令牌，格式错误或签名不符（被篡改、密钥已更换）时返回None
+def decode_page_token(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        signature, payload = raw[:16], raw[16:]
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        state = json.loads(payload.decode("utf-8"))
+    except (TypeError, ValueError):
+        return None
+    return state if isinstance(state, dict) else None
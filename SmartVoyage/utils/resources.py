@@ -0,0 +1,181 @@
+import asyncio
+import importlib
+import os
+import sys
+import threading
+import time
+
+from SmartVoyage.config import Config
+
+conf = Config()
+
+# 本模块首次导入的时刻；各入口在导入其他重量级模块之前先导入本模块，近似作为进程启动时刻
+_STARTED = time.perf_counter()
+
+
+# 已导入完成的模块；其他线程（例如后台预导入）正在导入、模块尚未初始化完时返回None
+def _loaded(module_name):
+    module = sys.modules.get(module_name)
+    if module is None or getattr(getattr(module, "__spec__", None), "_initializing", False):
+        return None
+    return module
+
+
+# 资源注册表：重量级依赖按需导入，LLM客户端、提示模板等资源首次使用时构建一次，进程内共享
+# 逐模块的导入耗时可用 python -X importtime 查看，这里只记录启动阶段与按需导入/构建的耗时
+class ResourceRegistry:
+    def __init__(self):
+        self._factories = {}  # 资源名称 -> 构建函数
+        self._instances = {}  # 资源名称 -> 已构建的实例
+        self._fork_unsafe = set()  # 持有线程、数据库连接等不能跨fork共享的资源名称
+        self._building = set()  # 正在后台线程中构建的资源名称
+        self._prefetch_thread = None  # 后台预导入线程
+        self._lock = threading.RLock()
+        self._build_locks = {}  # 资源名称 -> 构建锁，各资源分别加锁，构建较慢的资源不阻塞其他资源的获取
+        self.import_times = {}  # 模块名 -> 首次按需导入耗时（秒）
+        self.build_times = {}  # 资源名称 -> 构建耗时（秒）
+        self.marks = []  # 启动阶段标记 [(名称, 距启动的秒数)]
+        self._profiled = False
+
+    # 注册资源的构建函数；同名资源只保留第一次注册（Streamlit rerun时重复注册不会覆盖）
+    # fork_safe为False的资源不在fork前预热，子进程中丢弃从父进程复制的实例，首次使用时重新构建
+    def register(self, name, factory, fork_safe=True):
+        with self._lock:
+            self._factories.setdefault(name, factory)
+            if not fork_safe:
+                self._fork_unsafe.add(name)
+
+    def get(self, name):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            lock = self._build_locks.setdefault(name, threading.RLock())
+        with lock:
+            if name not in self._instances:
+                start = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                self.build_times[name] = time.perf_counter() - start
+            return self._instances[name]
+
+    # 非阻塞获取：资源已构建时直接返回，否则在后台线程中构建并返回None，供事件循环中的调用方先走不依赖该资源的路径
+    def get_nowait(self, name):
+        instance = self._instances.get(name)
+        if instance is not None or name in self._building:
+            return instance
+        with self._lock:
+            if name in self._building:
+                return None
+            self._building.add(name)
+
+        def build():
+            try:
+                self.get(name)
+            finally:
+                self._building.discard(name)
+
+        threading.Thread(target=build, name=f"build-{name}", daemon=True).start()
+        return None
+
+    # 按需导入模块并记录首次导入耗时
+    def import_module(self, module_name):
+        module = _loaded(module_name)
+        if module is not None:
+            return module
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        self.import_times.setdefault(module_name, time.perf_counter() - start)
+        return module
+
+    # 在事件循环中按需导入：未导入的模块在工作线程中导入，导入期间不阻塞事件循环上的其他请求
+    async def import_module_async(self, module_name):
+        module = _loaded(module_name)
+        if module is not None:
+            return module
+        return await asyncio.to_thread(self.import_module, module_name)
+
+    # 预热：启动模式为eager时在开始服务前导入模块、构建资源，避免首个请求承担冷启动耗时
+    # fork_safe_only为True时只构建可以在fork后由子进程共享的资源（多工作进程模式在fork前调用）
+    def warm(self, names=None, modules=(), fork_safe_only=False):
+        for module_name in modules:
+            self.import_module(module_name)
+        for name in names or list(self._factories):
+            if not (fork_safe_only and name in self._fork_unsafe):
+                self.get(name)
+
+    # 后台预导入：启动模式为lazy时在开始服务后由后台线程导入重量级模块、构建指定资源，首个请求通常不再承担这些耗时
+    def prefetch(self, modules=(), names=()):
+        def run():
+            for module_name in modules:
+                try:
+                    self.import_module(module_name)
+                except Exception as e:
+                    print(f"预导入 {module_name} 失败: {e}")
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"预构建 {name} 失败: {e}")
+
+        self._prefetch_thread = threading.Thread(target=run, name="prefetch", daemon=True)
+        self._prefetch_thread.start()
+
+    # 等待后台预导入完成：fork前调用，避免子进程继承其他线程持有的导入锁
+    def join_prefetch(self):
+        if self._prefetch_thread is not None:
+            self._prefetch_thread.join()
+
+    # fork后在子进程中调用：父进程的锁可能在fork时被其他线程持有，不能跨fork共享的实例丢弃后重新构建
+    def reset_after_fork(self):
+        self._lock = threading.RLock()
+        self._build_locks = {}
+        self._building = set()
+        for name in self._fork_unsafe:
+            self._instances.pop(name, None)
+
+    # 记录启动阶段，例如“导入完成”“资源就绪”
+    def mark(self, name):
+        self.marks.append((name, time.perf_counter() - _STARTED))
+
+    def print_profile(self, title):
+        '''
+        打印导入与冷启动耗时分析，只在配置 startup_profile 开启时打印，且每个进程只打印一次
+        :param title: 进程名称，例如“天气代理”
+        '''
+        if not conf.startup_profile or self._profiled:
+            return
+        self._profiled = True
+        print(f"\n=== {title} 启动耗时分析（启动模式：{conf.startup_mode}）===")
+        for name, seconds in self.marks:
+            print(f"[阶段] {name:<20} {seconds:8.3f}s")
+        for module_name, seconds in sorted(self.import_times.items(), key=lambda x: -x[1]):
+            print(f"[导入] {module_name:<20} {seconds:8.3f}s")
+        for name, seconds in sorted(self.build_times.items(), key=lambda x: -x[1]):
+            print(f"[构建] {name:<20} {seconds:8.3f}s")
+        print(f"冷启动总耗时: {time.perf_counter() - _STARTED:.3f}s\n")
+
+
+resources = ResourceRegistry()
+os.register_at_fork(after_in_child=resources.reset_after_fork)
+
+
+def lazy_import(module_name):
+    return resources.import_module(module_name)
+
+
+async def lazy_import_async(module_name):
+    return await resources.import_module_async(module_name)
+
+
+# 共享的LLM客户端
+def _build_llm():
+    ChatOpenAI = lazy_import("langchain_openai").ChatOpenAI
+    return ChatOpenAI(
+        model=conf.model_name,
+        api_key=conf.api_key,
+        base_url=conf.base_url,
+        temperature=0.1
+    )
+
+
+resources.register("llm", _build_llm)
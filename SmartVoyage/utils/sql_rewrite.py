@@ -0,0 +1,119 @@
+import re
+from datetime import date, timedelta
+
+from SmartVoyage.create_logger import logger
+
+_DATE = r"'(\d{4}-\d{2}-\d{2})'"
+# 函数包裹列的日期条件（索引无法使用），或一个完整的字符串字面量（原样跳过，字面量内部的内容不改写）
+_TOKEN_PATTERN = re.compile(
+    r"\bDATE\s*\(\s*(`?\w+`?(?:\.`?\w+`?)?)\s*\)\s*(?:"
+    rf"BETWEEN\s+{_DATE}\s+AND\s+{_DATE}|(>=|<=|=|>|<)\s*{_DATE})"
+    r"|'(?:[^'\\]|\\.|'')*'",
+    re.IGNORECASE)
+_LIMIT_PATTERN = re.compile(r"\bLIMIT\s+\d+", re.IGNORECASE)
+_STRING_PATTERN = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_ORDER_PATTERN = re.compile(r"\bORDER\s+BY\b", re.IGNORECASE)
+# FROM/JOIN 后的表列表（含逗号连接的多表与别名），只取每项的表名
+_TABLES_PATTERN = re.compile(r"\b(?:FROM|JOIN)\s+((?:`?\w+`?(?:\s+(?:AS\s+)?\w+)?\s*,\s*)*`?\w+`?)", re.IGNORECASE)
+# 单条只读查询中不应出现的内容：多语句、注释、写文件、加锁、耗时函数
+_UNSAFE_PATTERN = re.compile(r";|--|#|/\*|\b(?:INTO|FOR\s+UPDATE|LOCK|SLEEP|BENCHMARK|LOAD_FILE)\b", re.IGNORECASE)
+
+
+def _next_day(value):
+    return (date.fromisoformat(value) + timedelta(days=1)).isoformat()
+
+
+def _range_predicate(match):
+    column, between_start, between_end, op, value = match.groups()
+    if column is None:  # 字符串字面量
+        return match.group(0)
+    # 改写结果整体加括号，前面的 NOT、相邻的 OR 仍作用于整个条件
+    return f"({_range_condition(column, between_start, between_end, op, value)})"
+
+
+def _range_condition(column, between_start, between_end, op, value):
+    if between_start is not None:
+        return f"{column} >= '{between_start}' AND {column} < '{_next_day(between_end)}'"
+    # DATE(col) 与某一天比较，等价于 col 落在该天的半开区间 [d, d+1) 的某一侧
+    if op == "=":
+        return f"{column} >= '{value}' AND {column} < '{_next_day(value)}'"
+    if op == ">=":
+        return f"{column} >= '{value}'"
+    if op == ">":
+        return f"{column} >= '{_next_day(value)}'"
+    if op == "<":
+        return f"{column} < '{value}'"
+    return f"{column} < '{_next_day(value)}'"  # <=
+
+
+def rewrite_sql(sql, default_limit=None):
+    '''
+    把LLM生成的查询改写为可走索引的形式：DATE(col) 上的比较改写为 col 上的半开区间条件，
+    没有LIMIT的查询追加默认LIMIT；字符串字面量内部不改写，非SELECT语句原样返回
+    :param sql: SQL语句
+    :param default_limit: 默认LIMIT，为None或0时不追加
+    :return: 改写后的SQL
+    '''
+    statement = sql.strip().rstrip(';').strip()
+    if not re.match(r"SELECT\b", statement, re.IGNORECASE):
+        return sql
+    try:
+        statement = _TOKEN_PATTERN.sub(_range_predicate, statement)
+    except ValueError:  # 非法日期（如 2025-02-30），保留原条件
+        return sql
+    if default_limit and not has_limit(statement):
+        statement = f"{statement} LIMIT {int(default_limit)}"
+    return statement
+
+
+def has_limit(sql):
+    return bool(_LIMIT_PATTERN.search(_STRING_PATTERN.sub("''", sql)))
+
+
+def append_order_by(sql, columns):
+    '''
+    没有ORDER BY和LIMIT的SELECT追加排序，默认LIMIT截取的就是按该排序的前若干条，而不是任意若干条
+    :param columns: 排序列，例如 ["departure_time", "price", "id"]
+    :return: 追加排序后的SQL；已有ORDER BY或LIMIT时原样返回
+    '''
+    statement = sql.strip().rstrip(';').strip()
+    masked = _STRING_PATTERN.sub("''", statement)
+    if _ORDER_PATTERN.search(masked) or _LIMIT_PATTERN.search(masked):
+        return sql
+    return f"{statement} ORDER BY {', '.join(columns)}"
+
+
+def is_single_select(sql, tables):
+    '''
+    校验SQL是只读取指定表的单条SELECT语句，字符串字面量内部不参与判断
+    :param tables: 允许出现在 FROM/JOIN 中的表名集合
+    '''
+    if not isinstance(sql, str):
+        return False
+    statement = _STRING_PATTERN.sub("''", sql.strip().rstrip(';').strip())
+    if not re.match(r"SELECT\b", statement, re.IGNORECASE) or _UNSAFE_PATTERN.search(statement):
+        return False
+    referenced = [item.split()[0].strip("`").lower()
+                  for group in _TABLES_PATTERN.findall(statement) for item in group.split(",")]
+    return bool(referenced) and all(table in tables for table in referenced)
+
+
+def explain_plan(conn, sql, params=None):
+    '''
+    执行EXPLAIN，返回每张表的访问方式摘要：表名/访问类型/使用的索引/预估扫描行数
+    '''
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(f"EXPLAIN {sql}", params)
+        plan = cursor.fetchall()
+        cursor.close()
+    except Exception as e:
+        return f"EXPLAIN失败: {e}"
+    return "; ".join(f"{row.get('table')}:{row.get('type')}/key={row.get('key')}/rows={row.get('rows')}"
+                     for row in plan)
+
+
+def log_rewrite_plan(conn, before, after):
+    # 改写前后的执行计划对比，用于确认改写后的条件命中了复合索引
+    logger.info(f"SQL改写: {before} => {after}")
+    logger.info(f"执行计划 改写前: {explain_plan(conn, before)} | 改写后: {explain_plan(conn, after)}")